@@ -0,0 +1,116 @@
+"""
+AutoSave.py
+
+Background saving of the ROI set of the TinyRoiManager, so the Swing EDT never waits for the disk.
+- save(path): the ROIs are taken from a snapshot right away (copy-on-write, cheap), written later by
+  the save thread, e.g. the backups of DoTheWorkFrame
+- start(path): autosave to path every autosave_seconds (PerpetualTimer) while the ROIs change. The change
+  listener only marks the ROI set as changed: a burst of edits gives at most 1 write per interval,
+  and no new autosave is queued while one is waiting or being written
+- after_saves(then): runs then on the Swing EDT once everything that has been requested is written,
+  e.g. to exit the plugin after its last backup: the EDT does not wait for the write
+- flush(): waits until everything that has been requested is written, not to be called on the EDT
+All writes are done 1 at a time, in order, by 1 save thread. RoiIo writes <path>.part and moves it over
+path, and after the first save only tags.json is written again (the outlines do not change while editing).
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+from ij import IJ
+from java.lang import Runnable
+from java.util.concurrent import Executors
+from java.util.concurrent.atomic import AtomicBoolean
+from javax.swing import SwingUtilities
+
+from PerpetualTimer import PerpetualTimer
+from RoiIo import RoiIo
+from TinyRoiManager import TinyRoiManager
+
+class AutoSave(object):
+    def __init__(self, gvars, rm=None):
+        self.gvars = gvars
+        self.rm = TinyRoiManager.getInstance2() if rm is None else rm
+        self.interval = gvars.get("autosave_seconds", 60)  # 0: no autosave, save() still works
+        self.path = None
+        self._executor = Executors.newSingleThreadExecutor()
+        self._changed = AtomicBoolean(False)   # changes that have not been autosaved
+        self._queued = AtomicBoolean(False)    # an autosave is waiting or being written
+        self._timer = None
+
+    def start(self, path):
+        """Autosaves to path every interval while the ROIs change."""
+        self.path = path
+        self.rm.add_change_listener(self._on_rois_changed)
+        if self.interval > 0 and self._timer is None:
+            self._timer = PerpetualTimer(self.interval, self._on_timer)
+            self._timer.start()
+            IJ.log("AutoSave: every " + str(self.interval) + " seconds after a change to " + path)
+
+    def stop(self):
+        """Stops autosaving, requested saves are still written."""
+        self.rm.remove_change_listener(self._on_rois_changed)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_rois_changed(self, event):
+        self._changed.set(True)
+
+    def _on_timer(self):
+        # runs on the timer thread: only queues the write, of the path and ROIs of this moment
+        # (a reset or a new path after the autosave has been queued does not change what it writes)
+        # PerpetualTimer stops for good when its target raises: log the error, the next tick tries again
+        if self._changed.get() and self._queued.compareAndSet(False, True):
+            self._changed.set(False)  # changes made from now on go into the next autosave
+            try:
+                path, snapshot = self.path, self.rm.snapshot()
+                self._executor.submit(_SaveTask(lambda: self._autosave(path, snapshot)))
+            except Exception as e:
+                self._changed.set(True)
+                self._queued.set(False)
+                IJ.log("AutoSave: could not queue the autosave of " + str(self.path) + " - " + str(e))
+
+    def _autosave(self, path, snapshot):
+        try:
+            self._write(path, snapshot)
+        finally:
+            self._queued.set(False)
+
+    def save(self, path):
+        """Saves the current ROI set to path on the save thread, returns a Future that is done when written."""
+        snapshot = self.rm.snapshot()
+        return self._executor.submit(_SaveTask(lambda: self._write(path, snapshot)))
+
+    def _write(self, path, snapshot):
+        try:
+            RoiIo.getInstance().save_to_zip(path, rm=self.rm, snapshot=snapshot)
+            IJ.log("ROIs saved: " + path)
+        except Exception as e:
+            IJ.log("AutoSave: could not save " + path + " - " + str(e))
+
+    def after_saves(self, then):
+        """Runs then on the Swing EDT once all saves requested so far have been written, returns right away."""
+        self._executor.submit(_SaveTask(lambda: SwingUtilities.invokeLater(_SaveTask(then))))
+
+    def flush(self):
+        """Waits until all saves requested so far have been written (blocks: not on the EDT, see after_saves)."""
+        self._executor.submit(_SaveTask(lambda: None)).get()
+
+    def shutdown(self, then=None):
+        """Stops autosaving, writes what has been requested and ends the save thread.
+        Without then it waits for the writes; with then it returns right away and runs then on the EDT afterwards."""
+        self.stop()
+        if then is None:
+            self.flush()
+        else:
+            self.after_saves(then)
+        self._executor.shutdown()
+
+class _SaveTask(Runnable):
+    def __init__(self, fn):
+        self.fn = fn
+
+    def run(self):
+        self.fn()
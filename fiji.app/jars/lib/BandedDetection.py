@@ -0,0 +1,96 @@
+"""
+BandedDetection.py
+
+ROI detection on a label image that is read band by band (TiffLabelReader), so the whole label image
+is never in memory. Each step works on a window: the rows carried over from the previous step plus
+the next band.
+- a label whose last row in the window is not the last row of the window is complete (labels are
+  connected, every row between their top and bottom row holds label pixels): it is traced now
+- the other labels are still open: the rows from the top row of the highest open label onwards are
+  carried over to the next window, so an open label is always traced on its full extent
+- labels that were traced already are skipped, e.g. when they still have pixels in the carried rows
+  (a label made of several parts is traced once, like in the 2-D detection)
+Peak memory is the window: one band plus the rows of the labels that cross the band boundary.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+from ij import IJ
+from ij.gui import Roi
+from java.lang import System
+
+from jarray import zeros
+
+from LabelCensus import compute_census
+from RoiDetector import detect_with_contours
+from MeasurementStore import translate_measurement
+
+def iter_band_results(reader, gvars):
+    """
+    Generator over the windows of the label image of reader, yields (census, closed, roi_array, measurements):
+    - census: LabelCensus of the window, translated to image coordinates
+    - closed: dense indices of the labels completed in this window
+    - roi_array: roi_array[dense] = ROI (image coordinates) of the closed labels
+    - measurements: measurements[dense] = measure_traced_roi (image coordinates) of the closed labels
+    """
+    band_height = gvars.get("band_height", 1024)
+    width = reader.getWidth()
+    height = reader.getHeight()
+    carry = None        # pixels of the rows carried over
+    carry_y0 = 0        # image row of the first carried row
+    traced = set()      # ids of the labels traced so far
+    max_window_height = 0
+
+    y = 0
+    while y < height:
+        y_next = min(y + band_height, height)
+        band = reader.read_band(y, y_next).getPixels()
+        if carry is None:
+            pixels, window_y0 = band, y
+        else:
+            pixels = reader.new_pixels(len(carry) + len(band))
+            System.arraycopy(carry, 0, pixels, 0, len(carry))
+            System.arraycopy(band, 0, pixels, len(carry), len(band))
+            window_y0 = carry_y0
+        window_height = y_next - window_y0
+        max_window_height = max(max_window_height, window_height)
+        ip = reader.make_processor(pixels, window_height)
+
+        census = compute_census(ip, gvars)
+        last_row = window_height - 1
+        is_last_band = y_next >= height
+        closed = []
+        open_min_y = None
+        for dense in census.labels():
+            if census.label_id(dense) in traced:
+                continue
+            if not is_last_band and census.max_y[dense] == last_row:
+                if open_min_y is None or census.min_y[dense] < open_min_y:
+                    open_min_y = census.min_y[dense]
+            else:
+                closed.append(dense)
+
+        roi_array = zeros(census.num_labels, Roi)
+        measurements = [None] * census.num_labels
+        detect_with_contours(ip, roi_array, gvars, census, closed, measurements)
+        census.translate_y(window_y0)
+        for dense in closed:
+            roi = roi_array[dense]
+            if roi:
+                bounds = roi.getBounds()
+                roi.setLocation(bounds.x, bounds.y + window_y0)
+                measurements[dense] = translate_measurement(measurements[dense], 0, window_y0)
+            traced.add(census.label_id(dense))
+
+        if open_min_y is None:
+            carry = None
+        else:
+            carry_y0 = window_y0 + open_min_y
+            carry = pixels[open_min_y * width:]
+
+        yield census, closed, roi_array, measurements
+        y = y_next
+
+    IJ.log("Banded detection | band height: " + str(band_height) + " | largest window: " + str(max_window_height) + " rows")
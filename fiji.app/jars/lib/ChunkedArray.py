@@ -0,0 +1,128 @@
+"""
+ChunkedArray.py
+
+Growable array made of fixed size chunks, used for the parallel arrays of TinyRoiManager.
+- O(1) index access: chunk = idx >> chunk_bits, position in chunk = idx & (chunk_size - 1)
+- growing never moves existing elements, so threads can keep reading while another thread grows the array
+- a chunk is only allocated when an index inside it is written, so memory scales with the
+  number of ROIs actually present and not with the highest possible label value
+- freeze() returns an immutable snapshot that shares the chunks (copy-on-write): the first write
+  into a shared chunk copies that chunk, so a snapshot never changes and costs O(number of chunks).
+  A write takes a short lock: freeze() cannot share a chunk between the copy-on-write check and the write,
+  so the callers do not need to hold any lock of their own to keep the snapshots unchanged
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import threading
+
+from jarray import zeros
+
+class ChunkedArray(object):
+    def __init__(self, element_type=None, default=None, chunk_bits=10):
+        """
+        Parameters:
+        - element_type: jarray type code ('b', 'i', ...) or Java class (Roi, String, ...) of the chunks,
+          None for plain Python lists (e.g. to store sets)
+        - default: value returned for indices that have never been written
+        - chunk_bits: chunk size = 2**chunk_bits elements
+        """
+        self.element_type = element_type
+        self.default = default
+        self.chunk_bits = chunk_bits
+        self.chunk_size = 1 << chunk_bits
+        self.chunk_mask = self.chunk_size - 1
+        self.chunks = []
+        self._shared = set()  # indices of the chunks shared with a snapshot
+        self._write_lock = threading.Lock()  # writes, growth and freeze()
+
+    def _new_chunk(self):
+        if self.element_type is None:
+            return [self.default] * self.chunk_size
+        chunk = zeros(self.chunk_size, self.element_type)
+        if self.default:
+            for i in range(self.chunk_size):
+                chunk[i] = self.default
+        return chunk
+
+    def _chunk_for_write(self, chunk_idx):
+        # the caller holds self._write_lock until it has written into the chunk
+        chunks = self.chunks
+        if chunk_idx >= len(chunks):
+            chunks.extend([None] * (chunk_idx + 1 - len(chunks)))
+        if chunks[chunk_idx] is None:
+            chunks[chunk_idx] = self._new_chunk()
+        elif chunk_idx in self._shared:
+            chunks[chunk_idx] = chunks[chunk_idx][:]  # copy on write, the snapshot keeps the old chunk
+            self._shared.discard(chunk_idx)
+        return chunks[chunk_idx]
+
+    def __getitem__(self, idx):
+        chunk_idx = idx >> self.chunk_bits
+        chunks = self.chunks
+        if chunk_idx >= len(chunks):
+            return self.default
+        chunk = chunks[chunk_idx]
+        if chunk is None:
+            return self.default
+        return chunk[idx & self.chunk_mask]
+
+    def __setitem__(self, idx, value):
+        with self._write_lock:
+            self._chunk_for_write(idx >> self.chunk_bits)[idx & self.chunk_mask] = value
+
+    def __len__(self):
+        """Capacity: all indices below len() can be read without allocating."""
+        return len(self.chunks) << self.chunk_bits
+
+    def __iter__(self):
+        for chunk in list(self.chunks):
+            if chunk is None:
+                for _ in range(self.chunk_size):
+                    yield self.default
+            else:
+                for value in chunk:
+                    yield value
+
+    def ensure_capacity(self, size):
+        """Allocate all chunks needed for indices [0, size), e.g. before threads start writing."""
+        with self._write_lock:
+            for chunk_idx in range((size + self.chunk_size - 1) >> self.chunk_bits):
+                self._chunk_for_write(chunk_idx)
+
+    def freeze(self):
+        """Immutable snapshot of the current contents, shares the chunks until they are written."""
+        with self._write_lock:
+            self._shared = set(range(len(self.chunks)))
+            return FrozenChunkedArray(list(self.chunks), self.chunk_bits, self.default)
+
+    def clear(self):
+        """Drop all chunks, every index reads as the default value again."""
+        with self._write_lock:
+            self.chunks = []
+            self._shared = set()
+
+    def allocated_chunks(self):
+        return sum(1 for chunk in self.chunks if chunk is not None)
+
+class FrozenChunkedArray(object):
+    """Read-only snapshot of a ChunkedArray (see ChunkedArray.freeze)."""
+    def __init__(self, chunks, chunk_bits, default):
+        self.chunks = chunks
+        self.chunk_bits = chunk_bits
+        self.chunk_mask = (1 << chunk_bits) - 1
+        self.default = default
+
+    def __getitem__(self, idx):
+        chunk_idx = idx >> self.chunk_bits
+        if chunk_idx >= len(self.chunks):
+            return self.default
+        chunk = self.chunks[chunk_idx]
+        if chunk is None:
+            return self.default
+        return chunk[idx & self.chunk_mask]
+
+    def __len__(self):
+        return len(self.chunks) << self.chunk_bits
@@ -0,0 +1,85 @@
+"""
+ContourTracer.py
+
+Crack-following contour tracer for label images.
+Follows the outer boundary of an 8-connected label region along the pixel edges
+and returns the corner points, i.e. the same outline ImageJ's Wand produces for a
+Roi.TRACED_ROI (only the vertices where the direction changes are kept).
+
+The tracer always starts at the first pixel of a region in raster order
+(topmost row, leftmost pixel). The upper edge of that pixel is guaranteed to be part
+of the outer boundary, so no search for the boundary and no inner hole check is needed.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+from ij.gui import PolygonRoi, Roi
+from java.awt import Polygon
+from jarray import array
+
+# directions, counter clockwise: direction + 1 turns left, direction - 1 turns right
+UP, LEFT, DOWN, RIGHT = 0, 1, 2, 3
+
+# pixel ahead at the right-hand side when leaving vertex (x,y) in a given direction
+# vertex (x,y) is the upper left corner of pixel (x,y)
+_AHEAD_DX = (0, -1, -1, 0)
+_AHEAD_DY = (-1, -1, 0, 0)
+
+# displacement of the vertex when moving in a given direction
+_MOVE_DX = (0, -1, 0, 1)
+_MOVE_DY = (-1, 0, 1, 0)
+
+class ContourTracer(object):
+    def __init__(self, pixels, width, height):
+        """
+        Parameters:
+        - pixels: pixel array of the label image (as returned by ImageProcessor.getPixels())
+        - width, height: dimensions of the label image
+        """
+        self.pixels = pixels
+        self.width = width
+        self.height = height
+
+    def trace(self, x0, y0):
+        """
+        Trace the outer boundary of the 8-connected region that contains pixel (x0,y0).
+        (x0,y0) must be the first pixel of that region in raster order.
+        Returns (xpoints, ypoints, npoints), the outline runs clockwise on screen.
+        """
+        pixels = self.pixels
+        width = self.width
+        height = self.height
+        value = pixels[y0 * width + x0]
+
+        xs = [x0]
+        ys = [y0]
+        # nothing above or to the left of the start pixel: the first step goes to the right
+        direction = RIGHT
+        x = x0 + 1
+        y = y0
+        while x != x0 or y != y0:
+            # 8-connected: prefer a left turn, then straight on, else turn right
+            new_direction = (direction + 1) & 3
+            px = x + _AHEAD_DX[new_direction]
+            py = y + _AHEAD_DY[new_direction]
+            if not (0 <= px < width and 0 <= py < height and pixels[py * width + px] == value):
+                new_direction = direction
+                px = x + _AHEAD_DX[direction]
+                py = y + _AHEAD_DY[direction]
+                if not (0 <= px < width and 0 <= py < height and pixels[py * width + px] == value):
+                    new_direction = (direction + 3) & 3
+            if new_direction != direction:
+                xs.append(x)
+                ys.append(y)
+                direction = new_direction
+            x += _MOVE_DX[direction]
+            y += _MOVE_DY[direction]
+
+        return array(xs, 'i'), array(ys, 'i'), len(xs)
+
+    def trace_roi(self, x0, y0):
+        """Same as trace, but wrapped in a PolygonRoi of type TRACED_ROI."""
+        xpoints, ypoints, npoints = self.trace(x0, y0)
+        return PolygonRoi(Polygon(xpoints, ypoints, npoints), Roi.TRACED_ROI)
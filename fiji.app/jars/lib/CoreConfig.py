@@ -0,0 +1,31 @@
+"""
+CoreConfig.py
+
+Core configuration of the 'Edit ROIs' plugin, shared by the interactive plugin (EditRoisGo)
+and the headless batch mode (EditRoisBatch).
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+
+"""
+
+def core_configuration(gvars):
+    gvars["pixels_per_logical_processor"] = 500000
+    gvars["load_zip_batch_size"] = 384
+    gvars["tile_size"] = 512                # detection works on tiles of tile_size x tile_size pixels
+    gvars["tracing_engine"] = "contour"     # "contour": single sweep contour tracer, "wand": ImageJ's Wand
+    gvars["scan_step"] = 7                  # "wand" engine: only every scan_step-th pixel is scanned
+    gvars["slice_threads"] = 4              # label stacks: number of slices converted at the same time
+    gvars["batch_threads"] = 4              # batch mode: number of images converted at the same time
+    gvars["streaming_label_bytes"] = 1 << 30  # TIFF label images larger than this are read band by band
+    gvars["band_height"] = 1024             # streamed label images: number of rows read at once
+    gvars["simplify_outlines"] = False      # remove collinear outline vertices after tracing (lossless)
+    gvars["display_tolerance"] = 0          # overlay: outlines drawn within this many pixels, 0 = exact outlines
+    gvars["polygon_cache_size"] = 4096      # number of PolygonRoi objects kept, the outlines themselves are stored as int arrays
+    gvars["spatial_cell_size"] = 128        # grid cell size (pixels) of the spatial index over the ROI bounding boxes
+    gvars["roi_cache_enabled"] = True       # ROI sets of converted label images are cached on disk (RoiCache)
+    gvars["roi_cache_dir"] = None           # None: <user home>/FijiLog/RoiCache
+    gvars["roi_cache_max_bytes"] = 2 << 30  # least recently used ROI sets are removed above this size
+    gvars["autosave_seconds"] = 60          # ROIs autosaved at most once per this many seconds while editing, 0 = off
+    return gvars
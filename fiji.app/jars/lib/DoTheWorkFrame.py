@@ -21,7 +21,7 @@ from java.awt import Toolkit, Window
 from java.awt import Rectangle
 from ij import IJ
 from ij.gui import Roi
-from RoiIo import RoiIo
+from AutoSave import AutoSave
 
 import sys
 import os
@@ -37,6 +37,7 @@ class DoTheWorkFrame:
     def __init__(self, gvars):
         self.gvars = gvars
         self.rm = TinyRoiManager.getInstance2()
+        self.autosave = AutoSave(gvars, self.rm)
 
         self.frame = JFrame("Edit Rois - Do the work!")
         self.frame.setSize(450, 300)
@@ -112,25 +113,31 @@ class DoTheWorkFrame:
     def show(self):
         self.frame.setVisible(True)
         self.frm_delete.setVisible(True)
+        self.autosave.start(self._backup_path("RoiAutosave", with_timestamp=False))
 
     def on_save_rois(self, event):
         self.save_rois(as_backup=False)
     
-    def save_rois(self,as_backup=False):
-        ri=RoiIo.getInstance()
+    def _backup_path(self, kind, with_timestamp=True):
+        """<image folder>/RoiBackup/[timestamp_]<image name>_<kind>.zip"""
         all_but_ext, _ = os.path.splitext(self.gvars["path_original_image"])
+        backup_folder = os.path.dirname(all_but_ext)+"/RoiBackup/"
+        filename_wo_ext = os.path.basename(all_but_ext)
+        if not os.path.exists(backup_folder):
+            os.makedirs(backup_folder)
+            IJ.log("Create backup folder for ROIs: "+backup_folder)
+        prefix = get_timestamp_string() + "_" if with_timestamp else ""
+        return backup_folder + prefix + filename_wo_ext + "_" + kind + ".zip"
+
+    def save_rois(self,as_backup=False):
+        """Written by the save thread of AutoSave, from a snapshot taken now: the EDT does not wait for the disk."""
         if as_backup:
-            now=get_timestamp_string()
-            backup_folder = os.path.dirname(all_but_ext)+"/RoiBackup/"
-            filename_wo_ext = os.path.basename(all_but_ext)
-            if not os.path.exists(backup_folder):
-                os.makedirs(backup_folder)
-                IJ.log("Create backup folder for ROIs: "+backup_folder)
-            full_name = backup_folder + now + "_" + filename_wo_ext+"_RoiBackup.zip"
+            full_name = self._backup_path("RoiBackup")
         else:
+            all_but_ext, _ = os.path.splitext(self.gvars["path_original_image"])
             full_name = all_but_ext + "_RoiSet.zip"
-            ri.save_to_zip(full_name)
-        IJ.log("ROIs saved: " + full_name)
+        # the outlines do not change while editing: after the first save only tags.json is written again
+        return self.autosave.save(full_name)
 
     def on_select_outliers(self, event):
         IJ.log("Selecting and tagging Outliers")
@@ -169,13 +176,18 @@ class DoTheWorkFrame:
 
     def on_previous(self, event):
         self.save_rois(as_backup=True)
+        self.autosave.stop()
         self.setVisible(False)
-        self.gvars['EditRoisStartUpFrame'].goto(self)
+        # the start-up frame can reset the ROIs: shown once the backup is written, the EDT does not wait for it
+        self.autosave.after_saves(lambda: self.gvars['EditRoisStartUpFrame'].goto(self))
 
     def on_finish(self, event):
         self.setVisible(False)
         IJ.log("Finishing plugin")
         self.save_rois(as_backup=True)
+        self.autosave.shutdown(then=self._exit)  # exits once the backup is written, the EDT does not wait for it
+
+    def _exit(self):
         for w in Window.getWindows():
             if hasattr(w, "getTitle") and w.getTitle() not in {"Log", "Console", "(Fiji Is Just) ImageJ"}:
                 w.dispose()
@@ -228,7 +240,8 @@ class DoTheWorkFrame:
 
     def  on_rectangle_select(self, rect):
         IJ.log("rectangle select")
-        self.rm.select_within(rect,additive=True)
+        # only the ROIs of the slice that is shown
+        self.rm.select_within(rect,additive=True,position=self.gvars["working_image"].position)
         self.refresh_overlay()
 
 
@@ -0,0 +1,143 @@
+"""
+EditRoisBatch.py
+
+Headless batch mode of the 'Edit ROIs' plugin: converts all label images in a folder without any UI.
+For every label image (paired with its original image by the rules in ImagePairs):
+- the label image is converted into ROIs, small ROIs and ROIs at the image edge are marked deleted
+- the ROIs are saved to <original>_RoiSet.zip
+- the measurements are saved to Msmts/<timestamp>_<original>.csv
+The images are processed on a fixed pool of batch_threads workers, each image has its own
+detached TinyRoiManager. One summary report is written when all images are done.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import os
+import time
+import datetime
+import traceback
+
+from ij import IJ
+from java.lang import Runtime
+from java.util.concurrent import Callable, Executors
+
+from CoreConfig import core_configuration
+from ImagePairs import find_image_pairs
+from TinyRoiManager import TinyRoiManager
+from RoiIo import RoiIo
+from LabelToRoiTask import LabelToRois
+from TiffLabelReader import open_label_image
+from RoiMeasurements import RoiMeasurements
+from RoiCache import RoiCache
+
+SUMMARY_COLUMNS = ["original", "label image", "status", "ROIs", "active", "deleted small",
+                   "deleted edge", "ROI file", "measurement file", "milliseconds"]
+
+class BatchImageTask(Callable):
+    """Converts 1 image pair, returns 1 row of the summary report (dict keyed by SUMMARY_COLUMNS)."""
+    def __init__(self, path_original_image, path_label_image, gvars):
+        self.path_original_image = path_original_image
+        self.path_label_image = path_label_image
+        self.gvars = gvars
+
+    def call(self):
+        row = {"original": self.path_original_image, "label image": self.path_label_image, "status": "OK"}
+        start_time = datetime.datetime.now()
+        try:
+            self._convert(row)
+        except Exception as e:
+            row["status"] = "FAILED: " + str(e)
+            IJ.log("Batch: " + self.path_label_image + " failed: " + str(e))
+            traceback.print_exc()
+        duration = datetime.datetime.now() - start_time
+        row["milliseconds"] = int(duration.total_seconds() * 1000.0)
+        return row
+
+    def _convert(self, row):
+        # a large TIFF label image is read band by band
+        imp_lbl = open_label_image(self.path_label_image, self.gvars)
+        if not imp_lbl:
+            raise IOError("could not open label image")
+
+        # each image has its own gvars: RoiMeasurements registers itself in gvars
+        gvars = dict(self.gvars)
+        rm = TinyRoiManager.create_detached(gvars)
+        rm.reset(-1)
+        converter = LabelToRois(imp_lbl, rm, gvars)
+        converter.run()
+        imp_lbl.close()
+
+        row["ROIs"] = converter.added_roi_counter + converter.deleted_too_small_counter + converter.deleted_at_edge_counter
+        row["active"] = converter.added_roi_counter
+        row["deleted small"] = converter.deleted_too_small_counter
+        row["deleted edge"] = converter.deleted_at_edge_counter
+
+        # the output files are named after the original image, as in the interactive plugin
+        path_original_image = self.path_original_image or self.path_label_image
+        all_but_ext, _ = os.path.splitext(path_original_image)
+        row["ROI file"] = all_but_ext + "_RoiSet.zip"
+        RoiIo.getInstance().save_to_zip(row["ROI file"], rm=rm)
+        # a later interactive session on this label image loads the ROI set from the cache
+        cache = RoiCache(gvars)
+        cache.store(cache.key_for(self.path_label_image, gvars), row["ROI file"])
+
+        if not row["ROIs"]:
+            IJ.log("Batch: no labels in " + self.path_label_image + ", no measurements")
+            return
+        msmts = RoiMeasurements(gvars, rm=rm)
+        msmts.compute_measurements_all()
+        for subset_name, subset_state in (("ACTIVE", rm.ROI_STATE_ACTIVE), ("DELETED", rm.ROI_STATE_DELETED)):
+            msmts.compute_measurements_subset(subset_name, [name for (_, name, _, _) in rm.snapshot().entries(subset_state)])
+        row["measurement file"] = msmts.save_all(path_original_image)
+
+def write_summary(rows, folder):
+    """Writes the summary report as a ';' separated file in folder, returns its path."""
+    full_name = os.path.join(folder, time.strftime("%Y%m%d%H%M%S") + "_EditRois_batch_summary.csv")
+    with open(full_name, 'w') as f:
+        f.write(';'.join(SUMMARY_COLUMNS) + '\n')
+        for row in rows:
+            f.write(';'.join(str(row.get(column, "")) for column in SUMMARY_COLUMNS) + '\n')
+    return full_name
+
+def run_batch(folder, gvars=None):
+    """
+    Converts all label images in folder. gvars: filter settings (remove_edges, remove_small,
+    size_threshold) and optionally core configuration overrides.
+    Returns the rows of the summary report.
+    """
+    settings = core_configuration({})
+    settings.update({"remove_edges": True, "remove_small": True, "size_threshold": 100})
+    settings.update(gvars or {})
+    if RoiIo.getInstance() is None:
+        RoiIo(settings)
+
+    pairs = find_image_pairs(folder)
+    IJ.log("Batch: " + str(len(pairs)) + " label images found in " + folder)
+    if not pairs:
+        return []
+    for path_original_image, path_label_image in pairs:
+        if path_original_image is None:
+            IJ.log("Batch: no original image for " + path_label_image + ", the label image names the output files")
+
+    batch_threads = max(1, min(settings.get("batch_threads", 4), len(pairs)))
+    # the images share the logical processors
+    settings["max_threads"] = max(1, Runtime.getRuntime().availableProcessors() // batch_threads)
+
+    start_time = datetime.datetime.now()
+    pool = Executors.newFixedThreadPool(batch_threads)
+    try:
+        futures = [pool.submit(BatchImageTask(original, label, settings)) for original, label in pairs]
+        rows = [future.get() for future in futures]
+    finally:
+        pool.shutdown()
+    duration = datetime.datetime.now() - start_time
+
+    summary_path = write_summary(rows, folder)
+    num_failed = sum(1 for row in rows if row["status"] != "OK")
+    IJ.log("Batch: " + str(len(rows)) + " images | failed: " + str(num_failed) +
+           " | #ROIs: " + str(sum(row.get("ROIs", 0) for row in rows)) +
+           " | finished in: " + str(int(duration.total_seconds() * 1000.0)) + " milliseconds")
+    IJ.log("Batch: summary written to : " + summary_path)
+    return rows
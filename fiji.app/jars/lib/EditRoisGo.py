@@ -23,6 +23,7 @@ from java.lang import System
 from ij import IJ, Prefs, WindowManager
 
 from Tee import Tee
+from CoreConfig import core_configuration
 from EditRoisStartUpFrame import EditRoisStartUpFrame
 from DoTheWorkFrame import DoTheWorkFrame
 from TinyRoiManager import TinyRoiManager as RoiManager
@@ -46,10 +47,8 @@ key_to_label_map = { "F5" : "freeze",           # all but the last line must end
 def just_go_for_it():
     gvars = {}
 
-    # Core configuration
-    gvars["pixels_per_logical_processor"] = 500000
-    gvars["max_number_of_rois"] = 4095
-    gvars["load_zip_batch_size"] = 384
+    # Core configuration, see CoreConfig.py
+    core_configuration(gvars)
 
     rm = RoiManager(gvars)
     ri = RoiIo(gvars)
@@ -29,6 +29,7 @@ from MouseListener import ROIClickListener
 from TinyRoiManager import TinyRoiManager as RoiManager
 from RoiImage import RoiImage
 from RoiIo import RoiIo
+from TiffLabelReader import TiffLabelReader, open_label_image
 
 def clean_up():
     IJ.log("Edit ROIs - closing plug in")
@@ -128,6 +129,8 @@ class EditRoisStartUpFrame(JFrame):
         self.gvars["eroded_pixels"] = 0
         if "working_image" in self.gvars:
             self.gvars["working_image"].getImage().close()
+        if isinstance(self.gvars.get("label_image"), TiffLabelReader):
+            self.gvars.pop("label_image").close()
         for key in ['path_original_image', 'path_zip_file', 'path_label_image','working_image']:
             self.gvars.pop(key, None)
         self.txt_original.setText("")
@@ -215,7 +218,8 @@ class EditRoisStartUpFrame(JFrame):
             return
         
         ## open the label image
-        imp_lbl = IJ.openImage(self.gvars['path_label_image'])
+        # a large TIFF label image is not loaded, it is read band by band
+        imp_lbl = open_label_image(self.gvars['path_label_image'], self.gvars)
         if not imp_lbl:
             System.err.println("Could not open label image: " + self.gvars['path_label_image'])
             IJ.beep()
@@ -286,8 +290,9 @@ class EditRoisStartUpFrame(JFrame):
 
         
         if 'path_zip_file' not in self.gvars.keys():
+            # the task loads the ROI set from the RoiCache when the label image has been converted before
             IJ.log("No zip/roi file selected, creating ROIs from labels")
-            task = LabelToRoiTask(imp_lbl, self.gvars,self.continuation_after_loading)
+            task = LabelToRoiTask(imp_lbl, self.gvars,self.continuation_after_loading, use_cache=True)
             task.start()
         else:
             IJ.log("Zip file selected, reading ROIs from file: " + self.gvars["path_zip_file"])
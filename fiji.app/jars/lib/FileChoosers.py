@@ -16,6 +16,8 @@ from javax.swing import JFileChooser
 from javax.swing.filechooser import FileFilter
 import os
 
+from ImagePairs import LABEL_SUFFIXES, ORIGINAL_EXTENSIONS, is_label_file
+
 class JLabelFileChooser(object):
     def __init__(self):
         """
@@ -38,15 +40,10 @@ class JLabelFileChooser(object):
             def accept(self, f):
                 if f.isDirectory():
                     return True  # Always show directories
-                name = f.getName().lower()
-                return (name.endswith("_label.png") or
-                        name.endswith("_label.tif") or
-                        name.endswith("_label.tiff") or
-                        name.endswith("_label.jpg") or
-                        name.endswith("_cp_masks.png"))
+                return is_label_file(f.getName())
 
             def getDescription(self):
-                return "Label Files (*_label.png, *_label.tif, *_label.tiff, *_label.jpg, *_cp_masks.png)"
+                return "Label Files (" + ", ".join("*" + suffix for suffix in LABEL_SUFFIXES) + ")"
 
         # Attach the filter to the file chooser
         self.fc.setFileFilter(LabelFileFilter())
@@ -95,14 +92,10 @@ class JOriginalFileChooser(object):
             def accept(self, f):
                 if f.isDirectory():
                     return True  # Always show directories
-                name = f.getName().lower()
-                return (name.endswith(".png") or
-                        name.endswith(".tif") or
-                        name.endswith(".jpg") or
-                        name.endswith(".tiff"))
+                return f.getName().lower().endswith(ORIGINAL_EXTENSIONS)
 
             def getDescription(self):
-                return "Original Files (*.jpg, *.png, *.tif, *.tiff)"
+                return "Original Files (" + ", ".join("*" + ext for ext in ORIGINAL_EXTENSIONS) + ")"
 
         # Attach the filter to the file chooser
         self.fc.setFileFilter(OriginalFileFilter())
@@ -0,0 +1,52 @@
+"""
+ImagePairs.py
+
+File name rules that link an original image to its label image:
+- a label image ends with one of LABEL_SUFFIXES (e.g. image_cp_masks.png for cellpose)
+- the original image has the same base name with one of ORIGINAL_EXTENSIONS (image.png, image.tif, ...)
+Shared by the file choosers and by the headless batch mode, so both pair files the same way.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import os
+
+LABEL_SUFFIXES = ("_label.png", "_label.tif", "_label.tiff", "_label.jpg", "_cp_masks.png")
+ORIGINAL_EXTENSIONS = (".png", ".tif", ".jpg", ".tiff")
+
+def is_label_file(file_name):
+    return file_name.lower().endswith(LABEL_SUFFIXES)
+
+def is_original_file(file_name):
+    return file_name.lower().endswith(ORIGINAL_EXTENSIONS) and not is_label_file(file_name)
+
+def label_base_name(file_name):
+    """Base name of a label image without its label suffix, None if the name has no label suffix."""
+    lower_name = file_name.lower()
+    for suffix in LABEL_SUFFIXES:
+        if lower_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return None
+
+def find_image_pairs(folder):
+    """
+    Returns a sorted list of (path original image, path label image) for all label images in folder.
+    The path of the original image is None when there is no original image with the same base name.
+    """
+    file_names = sorted(os.listdir(folder))
+    originals = {}
+    for file_name in file_names:
+        if is_original_file(file_name):
+            originals.setdefault(os.path.splitext(file_name)[0], file_name)
+
+    pairs = []
+    for file_name in file_names:
+        base_name = label_base_name(file_name)
+        if base_name is None:
+            continue
+        original = originals.get(base_name)
+        pairs.append((os.path.join(folder, original) if original else None,
+                      os.path.join(folder, file_name)))
+    return pairs
@@ -0,0 +1,233 @@
+"""
+LabelCensus.py
+
+One sweep over a label image that collects, for every label:
+- the pixel count (area)
+- the bounding box (min/max x and y)
+- the sum of the x and y coordinates (for the centroid)
+- the first pixel in raster order (seed for the contour tracer)
+
+The label ids present in the image are compacted into a dense range 1..N during the census:
+label_ids[dense] holds the original label id, dense_of[label id] the dense index.
+All per label data is stored in primitive arrays indexed by the dense index, so a label image
+with large (32-bit, float) or sparse label ids costs O(N) memory, N = number of labels present.
+The cost of the sweep depends on the image size only and not on the number or the size of the ROIs.
+The sweep works on runs of equal pixels: the per pixel work is one comparison.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import math
+
+from java.lang import Runnable
+from jarray import zeros
+
+from TileWork import make_tiles, TileQueue, num_threads_for, run_workers
+
+def label_normalizer(ip):
+    """
+    Returns a function that turns a raw pixel value into a label id.
+    Java bytes and shorts are signed, RGB labels use the lower 24 bits, float labels see float_label.
+    """
+    bit_depth = ip.getBitDepth()
+    if bit_depth == 8:
+        return lambda value: value & 0xff
+    if bit_depth == 16:
+        return lambda value: value & 0xffff
+    if bit_depth == 24:
+        return lambda value: value & 0xffffff
+    return float_label
+
+def float_label(value):
+    """Label id of a float pixel value: truncated, NaN and +/-infinity are background 0."""
+    if math.isnan(value) or math.isinf(value):
+        return 0
+    return int(value)
+
+class _PartialCensus(object):
+    """Census of a part of the image, indexed by a local index in order of discovery."""
+    def __init__(self, normalize):
+        self.normalize = normalize
+        self.local_index = {}   # label id -> local index
+        self.count = []
+        self.min_x = []
+        self.max_x = []
+        self.min_y = []
+        self.max_y = []
+        self.sum_x = []
+        self.sum_y = []
+        self.first_pixel = []
+
+    def add_tile(self, pixels, width, x0, y0, x1, y1):
+        """Sweep the pixels of tile [x0, x1) x [y0, y1) of the label image."""
+        normalize = self.normalize
+        local_index = self.local_index
+        count = self.count
+        min_x, max_x = self.min_x, self.max_x
+        min_y, max_y = self.min_y, self.max_y
+        sum_x, sum_y = self.sum_x, self.sum_y
+        first_pixel = self.first_pixel
+        previous_value = None
+        i = -1
+        for y in range(y0, y1):
+            row_offset = y * width
+            x = x0
+            while x < x1:
+                value = pixels[row_offset + x]
+                run_start = x
+                x += 1
+                while x < x1 and pixels[row_offset + x] == value:
+                    x += 1
+                if value != previous_value:
+                    previous_value = value
+                    label = normalize(value)
+                    i = local_index.get(label, -1) if label else -1
+                    if label and i < 0:
+                        i = len(count)
+                        local_index[label] = i
+                        count.append(0)
+                        min_x.append(run_start)
+                        max_x.append(x - 1)
+                        min_y.append(y)
+                        max_y.append(y)
+                        sum_x.append(0)
+                        sum_y.append(0)
+                        first_pixel.append(row_offset + run_start)
+                if i < 0:
+                    continue
+                if run_start < min_x[i]:
+                    min_x[i] = run_start
+                if x - 1 > max_x[i]:
+                    max_x[i] = x - 1
+                # tiles are swept row by row, but a label can come back in a later tile
+                if y < min_y[i]:
+                    min_y[i] = y
+                    first_pixel[i] = row_offset + run_start
+                elif y == min_y[i] and row_offset + run_start < first_pixel[i]:
+                    first_pixel[i] = row_offset + run_start
+                if y > max_y[i]:
+                    max_y[i] = y
+                run_length = x - run_start
+                count[i] += run_length
+                sum_x[i] += run_length * (run_start + x - 1) // 2
+                sum_y[i] += run_length * y
+
+class LabelCensus(object):
+    def __init__(self, label_ids):
+        """label_ids: sorted list of the label ids present in the image, background 0 excluded."""
+        self.num_labels = len(label_ids) + 1   # dense index 0 is the background
+        num_labels = self.num_labels
+        self.label_ids = zeros(num_labels, 'i')
+        self.dense_of = {}
+        for dense, label in enumerate(label_ids, 1):
+            self.label_ids[dense] = label
+            self.dense_of[label] = dense
+        self.max_label_id = label_ids[-1] if label_ids else 0
+        self.count = zeros(num_labels, 'i')
+        self.min_x = zeros(num_labels, 'i')
+        self.max_x = zeros(num_labels, 'i')
+        self.min_y = zeros(num_labels, 'i')
+        self.max_y = zeros(num_labels, 'i')
+        self.sum_x = zeros(num_labels, 'l')
+        self.sum_y = zeros(num_labels, 'l')
+        self.first_pixel = zeros(num_labels, 'i')  # pixel index + 1, 0 = label not present
+
+    def _merge(self, partial):
+        """Merge the census of a disjoint part of the same image into this one."""
+        for label, i in partial.local_index.items():
+            dense = self.dense_of[label]
+            if not self.count[dense]:
+                self.first_pixel[dense] = partial.first_pixel[i] + 1
+                self.min_x[dense] = partial.min_x[i]
+                self.max_x[dense] = partial.max_x[i]
+                self.min_y[dense] = partial.min_y[i]
+                self.max_y[dense] = partial.max_y[i]
+            else:
+                self.first_pixel[dense] = min(self.first_pixel[dense], partial.first_pixel[i] + 1)
+                self.min_x[dense] = min(self.min_x[dense], partial.min_x[i])
+                self.max_x[dense] = max(self.max_x[dense], partial.max_x[i])
+                self.min_y[dense] = min(self.min_y[dense], partial.min_y[i])
+                self.max_y[dense] = max(self.max_y[dense], partial.max_y[i])
+            self.count[dense] += partial.count[i]
+            self.sum_x[dense] += partial.sum_x[i]
+            self.sum_y[dense] += partial.sum_y[i]
+
+    @staticmethod
+    def from_partials(partials):
+        label_ids = set()
+        for partial in partials:
+            label_ids.update(partial.local_index.keys())
+        census = LabelCensus(sorted(label_ids))
+        for partial in partials:
+            census._merge(partial)
+        return census
+
+    def labels(self):
+        """Dense indices of all labels present in the image (background 0 excluded)."""
+        return range(1, self.num_labels)
+
+    def label_id(self, dense):
+        """Original label id, i.e. the pixel value in the label image."""
+        return self.label_ids[dense]
+
+    def area(self, label):
+        return self.count[label]
+
+    def bounds(self, label):
+        """Bounding box as (x, y, width, height), like Roi.getBounds()."""
+        return (self.min_x[label], self.min_y[label],
+                self.max_x[label] - self.min_x[label] + 1,
+                self.max_y[label] - self.min_y[label] + 1)
+
+    def centroid(self, label):
+        """Centroid of the label pixels, pixel centers at +0.5, like ImageStatistics.xCentroid."""
+        n = float(self.count[label])
+        return self.sum_x[label] / n + 0.5, self.sum_y[label] / n + 0.5
+
+    def seed(self, label):
+        """Returns pixel index of the first pixel of the label in raster order, -1 if not present."""
+        return self.first_pixel[label] - 1
+
+    def translate_y(self, dy):
+        """
+        Moves the bounding boxes and centroids dy rows down, e.g. from band to image coordinates.
+        The seeds stay pixel indices in the swept pixels.
+        """
+        for label in self.labels():
+            self.min_y[label] += dy
+            self.max_y[label] += dy
+            self.sum_y[label] += dy * self.count[label]
+
+    def is_image_edge(self, label, edge_h, edge_v):
+        return (self.min_x[label] <= 0 or self.min_y[label] <= 0 or
+                self.max_x[label] + 1 >= edge_h or self.max_y[label] + 1 >= edge_v)
+
+class CensusWorker(Runnable):
+    def __init__(self, pixels, width, normalize, tile_queue):
+        """Takes tiles from the shared tile_queue until all tiles are done, keeps its own partial census."""
+        self.pixels = pixels
+        self.width = width
+        self.tile_queue = tile_queue
+        self.census = _PartialCensus(normalize)
+
+    def run(self):
+        census = self.census
+        next_tile = self.tile_queue.next()
+        while next_tile is not None:
+            _, (x0, y0, x1, y1) = next_tile
+            census.add_tile(self.pixels, self.width, x0, y0, x1, y1)
+            next_tile = self.tile_queue.next()
+
+def compute_census(ip, gvars):
+    """Census of the label image in ImageProcessor ip (8, 16, 24 or 32-bit), computed tile by tile in parallel."""
+    width = ip.getWidth()
+    height = ip.getHeight()
+    num_threads = num_threads_for(width * height, gvars)
+    tile_queue = TileQueue(make_tiles(width, height, gvars.get("tile_size", 512)))
+    normalize = label_normalizer(ip)
+
+    workers = [CensusWorker(ip.getPixels(), width, normalize, tile_queue) for t in range(num_threads)]
+    run_workers(workers)
+    return LabelCensus.from_partials([worker.census for worker in workers])
@@ -1,5 +1,4 @@
 from javax.swing import SwingWorker
-from java.lang import Thread,Runtime
 from ij import IJ
 
 import datetime
@@ -8,37 +7,218 @@ import math
 from ij.gui import Roi
 from TinyRoiManager import TinyRoiManager as RoiManager
 from RoiIo import RoiIo
-from RoiDetector import RoiDetector
+from RoiDetector import detect_with_wand, detect_with_contours
+from LabelCensus import compute_census
+from TiffLabelReader import TiffLabelReader
+from BandedDetection import iter_band_results
+from RoiCache import RoiCache
 from ij.gui import TextRoi
 
 from jarray import zeros
-from java.lang import String
+from java.lang import String, Runtime
 from java.awt import Color
+from java.util.concurrent import Callable, Executors
 
 from StopWatch import StopWatch
 
-def is_image_edge(roi, edge_h, edge_v):
-    bounds = roi.getBounds()
-    rx, ry, rw, rh = bounds.x, bounds.y, bounds.width, bounds.height
+class SliceToRois(Callable):
+    """
+    Label census and ROI detection of 1 slice of a label stack.
+    The slice is fetched when the task runs, so only the slices being converted are in memory
+    (a virtual stack is read from disk slice by slice).
+    """
+    def __init__(self, stack, slice_idx, gvars):
+        self.stack = stack
+        self.slice_idx = slice_idx
+        self.gvars = gvars
 
-    return (rx <= 0 or ry <= 0 or (rx + rw) >= edge_h or (ry + rh) >= edge_v)
+    def call(self):
+        gvars = self.gvars
+        ip = self.stack.getProcessor(self.slice_idx)
+        census = compute_census(ip, gvars)
+        roi_array = zeros(census.num_labels, Roi)
+        measurements = [None] * census.num_labels
+        if gvars.get("tracing_engine", "contour") == "wand":
+            detect_with_wand(ip, roi_array, gvars, gvars.get("scan_step", 7), census, measurements)
+        else:
+            detect_with_contours(ip, roi_array, gvars, census, measurements=measurements)
+        return census, roi_array, measurements
+
+class LabelToRois(object):
+    """
+    Converts a label image (or label stack) into ROIs in the TinyRoiManager rm, applying the
+    size and image edge filters of gvars. Has no UI: used by LabelToRoiTask and by the batch mode.
+    """
+    def __init__(self, imp_lbl, rm, gvars, stop_watch=None):
+        """stop_watch: StopWatch to time the steps, None in batch mode (the StopWatch is shared)"""
+        self.imp_lbl = imp_lbl
+        self.rm = rm
+        self.gvars = gvars
+        self.stop_watch = stop_watch
+        self.max_label_found = -1
+        self.deleted_too_small_counter=0
+        self.deleted_at_edge_counter =0
+        self.added_roi_counter =0
+
+    def _lap(self, message):
+        if self.stop_watch:
+            self.stop_watch.stop(message)
+            self.stop_watch.start()
+
+    def run(self):
+        rm = self.rm
+        gvars = self.gvars
+        edge_h = self.imp_lbl.getWidth() - 1
+        edge_v = self.imp_lbl.getHeight() -1
+
+        if isinstance(self.imp_lbl, TiffLabelReader):
+            self._convert_bands(rm, gvars, edge_h, edge_v)
+            self._lap("Computing and adding ROIs band by band")
+            return
+
+        if self.imp_lbl.getStackSize() > 1:
+            self._convert_stack(rm, gvars, edge_h, edge_v)
+            self._lap("Computing and adding ROIs of all slices")
+            return
+
+        ip = self.imp_lbl.getProcessor()
+
+        # area, bounding box, centroid and seed pixel of every label in 1 sweep
+        # the label ids (8, 16, 24 or 32-bit, possibly sparse) are remapped to dense indices 1..N
+        census = compute_census(ip, gvars)
+        labels = census.labels()
+        # the ROI storage grows with the number of labels, there is no fixed maximum number of ROIs
+        rm.ensure_capacity(len(labels))
+        self._lap("Label census")
+
+        # the detector threads measure every ROI right after tracing it
+        measurements = [None] * census.num_labels
+        if gvars.get("tracing_engine", "contour") == "wand":
+            step=gvars.get("scan_step", 7) # not all pixels are checked, every 'steps' are checked
+            # the census guarantees that labels skipped by the sparse scan are traced anyway
+            self.max_label_found = detect_with_wand(ip, rm.roi_array, gvars, step, census, measurements)
+        else:
+            self.max_label_found = detect_with_contours(ip, rm.roi_array, gvars, census, measurements=measurements)
+        max_label = census.max_label_id
+        rm.set_range_stop(num_of_rois=len(labels), max_label=max_label)
+        self._lap("Computing ROIs")
+
+        rows, label_positions, roi_measurements = [], [], []
+        for roi_idx in labels:
+            this_roi= rm.roi_array[roi_idx]
+            if not this_roi:
+                continue
+            roi_name = rm.roi_name(census.label_id(roi_idx))
+            this_roi.setName(roi_name)
+            state, tags = self._initial_state(rm, census, roi_idx, edge_h, edge_v)
+            rows.append((roi_name,roi_idx,this_roi,state,tags))
+            label_positions.append(census.centroid(roi_idx))
+            roi_measurements.append(measurements[roi_idx])
+        rm.add_many(rows, label_positions, roi_measurements)
+        self._lap("Adding ROIs")
+
+    def _initial_state(self, rm, census, roi_idx, edge_h, edge_v):
+        """(state, tags) of a new ROI after the size and image edge filters."""
+        gvars = self.gvars
+        if gvars['remove_small'] and census.area(roi_idx) < gvars['size_threshold']:
+            self.deleted_too_small_counter+=1
+            return rm.ROI_STATE_DELETED, {"small"}
+        if gvars['remove_edges'] and census.is_image_edge(roi_idx,edge_h,edge_v):
+            self.deleted_at_edge_counter +=1
+            return rm.ROI_STATE_DELETED, {"edge.image"}
+        self.added_roi_counter+=1
+        return rm.ROI_STATE_ACTIVE, set()
+
+    def _convert_bands(self, rm, gvars, edge_h, edge_v):
+        """
+        Converts a label image that is streamed band by band from a TiffLabelReader.
+        The ROIs are named when all bands are done and the highest label id is known.
+        """
+        new_rois = []  # (label id, roi, state, tags, label position, measurement)
+        max_label = 0
+        for census, closed, roi_array, measurements in iter_band_results(self.imp_lbl, gvars):
+            for dense in closed:
+                this_roi = roi_array[dense]
+                if not this_roi:
+                    continue
+                state, tags = self._initial_state(rm, census, dense, edge_h, edge_v)
+                new_rois.append((census.label_id(dense), this_roi, state, tags, census.centroid(dense), measurements[dense]))
+            max_label = max(max_label, census.max_label_id)
+
+        new_rois.sort()
+        rm.ensure_capacity(len(new_rois))
+        rm.set_range_stop(num_of_rois=len(new_rois), max_label=max_label)
+        rows, label_positions, roi_measurements = [], [], []
+        for idx, (label_id, this_roi, state, tags, label_position, measurement) in enumerate(new_rois, 1):
+            roi_name = rm.roi_name(label_id)
+            this_roi.setName(roi_name)
+            rows.append((roi_name,idx,this_roi,state,tags))
+            label_positions.append(label_position)
+            roi_measurements.append(measurement)
+        rm.add_many(rows, label_positions, roi_measurements)
+        self.max_label_found = len(new_rois)
+
+    def _convert_stack(self, rm, gvars, edge_h, edge_v):
+        """
+        Converts every slice of a label stack, slice_threads slices at a time.
+        ROIs are keyed by (slice, label): name "S" + slice + "-L" + label id, Roi position = slice.
+        """
+        stack = self.imp_lbl.getStack()
+        num_slices = stack.getSize()
+        slice_threads = max(1, min(gvars.get("slice_threads", 4), num_slices))
+        # the slices share the logical processors (or the threads given to this image in batch mode)
+        slice_gvars = dict(gvars)
+        available_threads = gvars.get("max_threads") or Runtime.getRuntime().availableProcessors()
+        slice_gvars["max_threads"] = max(1, available_threads // slice_threads)
+
+        pool = Executors.newFixedThreadPool(slice_threads)
+        try:
+            futures = [pool.submit(SliceToRois(stack, n, slice_gvars)) for n in range(1, num_slices + 1)]
+            results = [future.get() for future in futures]
+        finally:
+            pool.shutdown()
+        IJ.log("Label stack | #slices: " + str(num_slices) + " | #slices in parallel: " + str(slice_threads))
+
+        num_of_rois = sum(len(census.labels()) for census, _, _ in results)
+        max_label = max(census.max_label_id for census, _, _ in results)
+        rm.ensure_capacity(num_of_rois)
+        rm.set_range_stop(num_of_rois=num_of_rois, max_label=max_label, num_slices=num_slices)
+
+        idx = 0
+        rows, label_positions, roi_measurements = [], [], []
+        for slice_idx, (census, roi_array, measurements) in enumerate(results, 1):
+            for dense in census.labels():
+                this_roi = roi_array[dense]
+                if not this_roi:
+                    continue
+                idx += 1
+                roi_name = rm.roi_name(census.label_id(dense), slice_idx)
+                this_roi.setName(roi_name)
+                this_roi.setPosition(slice_idx)
+                state, tags = self._initial_state(rm, census, dense, edge_h, edge_v)
+                rows.append((roi_name,idx,this_roi,state,tags))
+                label_positions.append(census.centroid(dense))
+                roi_measurements.append(measurements[dense])
+        rm.add_many(rows, label_positions, roi_measurements)
+        self.max_label_found = idx
 
 class LabelToRoiTask(SwingWorker):
-    def __init__(self, imp_lbl, gvars,continuation_after_loading):
+    def __init__(self, imp_lbl, gvars,continuation_after_loading, use_cache=False):
+        """
+        use_cache: look the label image up in the RoiCache first (on the worker thread: hashing reads the
+        whole label file) and add the ROI set to the cache when it has been converted
+        """
         SwingWorker.__init__(self)
-        self.imp_lbl = imp_lbl.duplicate()
-        #self.roi_array = None
-        self.width= None
-        self.height = None
+        self.imp_lbl = imp_lbl
         self.good_to_start=False
-        self.roi_names = None
         self.gvars=gvars
         self.continuation_after_loading=continuation_after_loading
+        self.use_cache = use_cache
+        self.cache_key = None
+        self.converter = None
         self.max_label_found = -1
 
     def start(self):
-        self.width=self.imp_lbl.getWidth()
-        self.height = self.imp_lbl.getHeight()
         IJ.log("Computing ROIs started")
         self.good_to_start=True
         self.execute()
@@ -47,100 +227,48 @@ class LabelToRoiTask(SwingWorker):
         rm = RoiManager.getInstance2()
         rm.reset(-1)
         ri= RoiIo.getInstance()
-        gvars=self.gvars
         if not self.good_to_start:
             IJ.log("LabelToRoiTask: Use start to start")
             return
         self.good_to_start=False
-        
-        width=self.width
-        height=self.height
-        num_logical_processors = Runtime.getRuntime().availableProcessors()
-        StopWatch().start()
-
 
-        edge_h = width - 1
-        edge_v = height -1
-        
-        remove_edges=gvars['remove_edges']
-        remove_small=gvars['remove_small']
-        size_threshold=gvars['size_threshold']
-        
-        ip = self.imp_lbl.getProcessor()
-        pixels = ip.getPixels()
+        if self.use_cache:
+            cache = RoiCache(self.gvars)
+            self.cache_key = cache.key_for(self.gvars['path_label_image'], self.gvars)
+            path_cached_zip = cache.lookup(self.cache_key)
+            if path_cached_zip:
+                IJ.log("Label image converted before, reading ROIs from cache: " + path_cached_zip)
+                ri.load_from_zip(path_cached_zip, self.imp_lbl)
+                return
 
-        
-        step=7 # not all pixels are checked, every 'steps' are checked
-        
-        n_pixels = width * height
-        pixels_per_proc = gvars["pixels_per_logical_processor"]
-        num_threads = min(n_pixels // pixels_per_proc   + 1, num_logical_processors)
-        chunk_size = int((n_pixels + num_threads - 1) / num_threads)
-
-        start_idx = [t * chunk_size for t in range(num_threads)]
-        stop_idx = [min((t + 1) * chunk_size, n_pixels) for t in range(num_threads)]
-        runnables = [
-            RoiDetector(ip,pixels, rm.roi_array, start_idx[t], stop_idx[t], step, width)
-            for t in range(num_threads)
-        ]
-        threads = [Thread(r) for r in runnables]
-
-        for thread in threads:
-            thread.setPriority(Thread.MAX_PRIORITY)
-            thread.start()
-        IJ.log("#processors: "+str(num_logical_processors)+" | #threads started: "+ str(num_threads))
-        
-        for thread in threads:
-            thread.join()
-            
-        self.max_label_found = sum(r.counter for r in runnables)
-        rm.set_range_stop(num_of_rois=self.max_label_found)
+        # a stack is only read, slice by slice: no copy (a virtual stack stays on disk)
+        # a streamed label image (TiffLabelReader) is read band by band: no copy either
+        imp_lbl = self.imp_lbl
+        if not (isinstance(imp_lbl, TiffLabelReader) or imp_lbl.getStackSize() > 1):
+            imp_lbl = imp_lbl.duplicate()
 
-        StopWatch().stop("Computing ROIs")
         StopWatch().start()
-        
-        
-        # Calculate the number of digits for the name of the ROI (padding with zeros)
-        max_digits = len(str(self.max_label_found))
-        
-        self.deleted_too_small_counter=0
-        self.deleted_at_edge_counter =0
-        self.added_roi_counter =0
-        for roi_idx in range(1,rm.range_stop):
-            this_roi= rm.roi_array[roi_idx]
-            # 'None' rois should not be encountered
-            # if not this_roi:
-                # break
-            roi_name = "L" + str(roi_idx).zfill(max_digits)
-            this_roi.setName(roi_name)
-            stats = this_roi.getStatistics()
-            if remove_small and stats.area < size_threshold:
-                state= rm.ROI_STATE_DELETED
-                tags={"small"}
-                self.deleted_too_small_counter+=1
-            elif remove_edges and is_image_edge(this_roi,edge_h,edge_v):
-                state= rm.ROI_STATE_DELETED
-                tags={"edge.image"}
-                self.deleted_at_edge_counter +=1
-            else:
-                state = rm.ROI_STATE_ACTIVE
-                tags = set()
-                self.added_roi_counter+=1
-            rm.add_1_tuple(name_idx_roi_state_tag=(roi_name,roi_idx,this_roi,state,tags))
-
-        StopWatch().stop("Adding ROIs")
-        
+        self.converter = LabelToRois(imp_lbl, rm, self.gvars, StopWatch())
+        self.converter.run()
+        StopWatch().stop("Label image converted")
+        self.max_label_found = self.converter.max_label_found
+
         ## We save a temporary RoiSet
-        #rm=RoiManager.getInstance2()
         temp_roi_path = self.gvars['tempFile']
         ri.save_to_zip(temp_roi_path)
+        RoiCache(self.gvars).store(self.cache_key, temp_roi_path)
 
     def done(self):
         self.get()  #raise exception if abnormal completion
+        if self.converter is None:  # read from the RoiCache
+            self.continuation_after_loading()
+            return
 
-        print "Ignored too small ROIs: ",str(self.deleted_too_small_counter)
-        print "Ignored ROIS at edge  : ",str(self.deleted_at_edge_counter)
-        print "Added ROIs            : ",str(self.added_roi_counter)
+        print "Ignored too small ROIs: ",str(self.converter.deleted_too_small_counter)
+        print "Ignored ROIS at edge  : ",str(self.converter.deleted_at_edge_counter)
+        print "Added ROIs            : ",str(self.converter.added_roi_counter)
+        print "ROI storage           : ",RoiManager.getInstance2().roi_array.summary()
+        print "ROIs per tag          : ",RoiManager.getInstance2().tag_counts()
         
 
         
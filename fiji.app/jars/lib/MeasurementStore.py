@@ -0,0 +1,92 @@
+"""
+MeasurementStore.py
+
+Geometric measurements computed by the detector threads, right after an outline has been traced.
+- measure_traced_roi(roi): area and centroid (shoelace formula on the outline) + Feret values
+  for a traced outline, the shoelace area equals the pixel area of getStatistics()
+- outline_centroid(roi): only the centroid, e.g. to place the name label of an ROI,
+  polygon_centroid(xs, ys, n) the same for vertices read from a PolygonStore without a Roi
+- MeasurementStore: measurements by ROI name, kept by the TinyRoiManager. An entry is only used
+  as long as the outline it was measured on is still the outline of that name (PolygonStore generation).
+RoiMeasurements reads the store and only measures the ROIs that are not in it (e.g. read from a zip file).
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+# same order as RoiMeasurements.measurement_names, followed by the centroid
+MEASUREMENT_NAMES = ["Area", "Feret", "FeretAngle", "MinFeret", "FeretX", "FeretY"]
+AREA, FERET, FERET_ANGLE, MIN_FERET, FERET_X, FERET_Y, CENTROID_X, CENTROID_Y = range(8)
+
+def _shoelace(roi):
+    """(2 * signed area, centroid x, centroid y) of the outline of roi, the centre of the bounds if it has no area."""
+    poly = roi.getPolygon()
+    sum_cross, cx, cy = _shoelace_vertices(poly.xpoints, poly.ypoints, poly.npoints)
+    if sum_cross:
+        return sum_cross, cx, cy
+    bounds = roi.getBounds()
+    return 0, bounds.x + bounds.width / 2.0, bounds.y + bounds.height / 2.0
+
+def _shoelace_vertices(xs, ys, n):
+    """(2 * signed area, centroid x, centroid y) of the polygon with n vertices xs, ys; (0, None, None) if it has no area."""
+    sum_cross = sum_x = sum_y = 0
+    x0, y0 = xs[n - 1], ys[n - 1]
+    for i in range(n):
+        x1, y1 = xs[i], ys[i]
+        cross = x0 * y1 - x1 * y0
+        sum_cross += cross
+        sum_x += (x0 + x1) * cross
+        sum_y += (y0 + y1) * cross
+        x0, y0 = x1, y1
+    if sum_cross:
+        return sum_cross, sum_x / (3.0 * sum_cross), sum_y / (3.0 * sum_cross)
+    return 0, None, None
+
+def outline_centroid(roi):
+    """(xCentroid, yCentroid) of a traced outline, without getStatistics()."""
+    _, cx, cy = _shoelace(roi)
+    return cx, cy
+
+def polygon_centroid(xs, ys, n):
+    """outline_centroid of the outline with n vertices xs, ys (e.g. PolygonStore.outline), without a Roi."""
+    sum_cross, cx, cy = _shoelace_vertices(xs, ys, n)
+    if sum_cross:
+        return cx, cy
+    xs, ys = xs[:n], ys[:n]
+    return (min(xs) + max(xs)) / 2.0, (min(ys) + max(ys)) / 2.0
+
+def measure_traced_roi(roi):
+    """(Area, Feret, FeretAngle, MinFeret, FeretX, FeretY, xCentroid, yCentroid) of a traced outline."""
+    sum_cross, cx, cy = _shoelace(roi)
+    feret_values = roi.getFeretValues()
+    return (abs(sum_cross) / 2.0, feret_values[0], feret_values[1], feret_values[2], feret_values[3], feret_values[4], cx, cy)
+
+def translate_measurement(values, dx, dy):
+    """Measurement of the ROI moved over (dx, dy): only the Feret start point and the centroid move."""
+    values = list(values)
+    values[FERET_X] += dx
+    values[FERET_Y] += dy
+    values[CENTROID_X] += dx
+    values[CENTROID_Y] += dy
+    return tuple(values)
+
+class MeasurementStore(object):
+    def __init__(self):
+        self._by_name = {}  # ROI name -> (outline generation, measurement)
+
+    def clear(self):
+        self._by_name = {}
+
+    def put(self, roi_name, generation, values):
+        self._by_name[roi_name] = (generation, values)
+
+    def get(self, roi_name, generation):
+        """Measurement of roi_name, None if not measured or measured on another outline (the geometry changed)."""
+        entry = self._by_name.get(roi_name)
+        if entry is None or entry[0] != generation:
+            return None
+        return entry[1]
+
+    def __len__(self):
+        return len(self._by_name)
@@ -1,3 +1,18 @@
+"""
+MedianStats.py
+
+Median, quartiles and MAD (median absolute deviation) of measurement values.
+- median_stats_from_jarray: of a Java double array, by sorting copies
+- sorted_median, first_index, median_distance: of a sorted list of (value, name) entries, as kept by
+  RoiMeasurements per subset. median_distance finds the MAD in O(log N) without sorting the distances:
+  the distances below and above the median are 2 ascending sequences, kth_of_two searches their union
+Pure Python apart from java.util.Arrays, no ImageJ or Swing.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
 from java.util import Arrays
 from jarray import array
 
@@ -35,3 +50,52 @@ def median_stats_from_jarray(jarr, range_stop):
     # upper limit for filtering: Q3 + 1.5 * IQR
 
     return med, q1, q3, mad
+
+def sorted_median(entries, start, end):
+    """Median of the values of the sorted (value, name) entries[start:end]."""
+    count = end - start
+    mid = start + count // 2
+    if count % 2 == 1:
+        return entries[mid][0]
+    else:
+        return 0.5 * (entries[mid - 1][0] + entries[mid][0])
+
+def first_index(entries, value, strict=False):
+    """Index of the first of the sorted (value, name) entries with a value >= value (> value if strict)."""
+    lo, hi = 0, len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = entries[mid][0]
+        if v < value or (strict and v == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def kth_of_two(a, na, b, nb, k):
+    """k-th smallest (0-based) of the union of 2 ascending sequences, given as functions a(i), b(j)."""
+    lo, hi = max(0, k + 1 - nb), min(k + 1, na)
+    while lo < hi:
+        i = (lo + hi) // 2  # i taken from a, k + 1 - i from b
+        if a(i) < b(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    if i == 0:
+        return b(j - 1)
+    if j == 0:
+        return a(i - 1)
+    return max(a(i - 1), b(j - 1))
+
+def median_distance(entries, med):
+    """Median of |value - med| of the sorted (value, name) entries, in O(log N): the distances below and above
+    med are 2 ascending sequences."""
+    n = len(entries)
+    split = first_index(entries, med)
+    below = lambda i: med - entries[split - 1 - i][0]
+    above = lambda j: entries[split + j][0] - med
+    k = n // 2
+    if n % 2 == 1:
+        return kth_of_two(below, split, above, n - split, k)
+    return 0.5 * (kth_of_two(below, split, above, n - split, k - 1) + kth_of_two(below, split, above, n - split, k))
@@ -2,6 +2,7 @@ from ij import IJ
 #from ij.plugin.frame import RoiManager
 from java.awt.event import MouseAdapter
 from TinyRoiManager import TinyRoiManager as RoiManager
+from LabelCensus import label_normalizer
 #from RoiImage import RoiImage
 
 class ROIClickListener(MouseAdapter):
@@ -18,12 +19,14 @@ class ROIClickListener(MouseAdapter):
         self.panel = roi_image.panel
 
         self.label_imp = label_imp
-        self.label_pixels = label_imp.getProcessor().getPixels()
+        self.streamed = hasattr(label_imp, "label_at")  # TiffLabelReader: label image not in memory
+        if not self.streamed:
+            self.label_pixels = label_imp.getProcessor().getPixels()
+            self.normalize = label_normalizer(label_imp.getProcessor())
         self.width = label_imp.getWidth()
 
         self.rm = RoiManager.getInstance2()
         self.gvars = gvars
-        self.name_digits = self.rm.name_length - 1
         
         if self.rm is None:
             IJ.log("Mouse: ROI Manager must be open!")
@@ -45,12 +48,19 @@ class ROIClickListener(MouseAdapter):
         if not (0 <= x < self.width and 0 <= y < self.label_imp.getHeight()):
             IJ.log("Mouse clicked outside of image")
             return
-        idx = int(y) * self.width + int(x)
-        label_val = int(self.label_pixels[idx])
+        if self.streamed:
+            label_val = self.label_imp.label_at(int(x), int(y))
+        else:
+            idx = int(y) * self.width + int(x)
+            if self.label_imp.getStackSize() > 1:
+                self.label_pixels = self.label_imp.getProcessor().getPixels()  # pixels of the current slice
+            label_val = self.normalize(self.label_pixels[idx])
         
         if label_val <= 0:
             return
-        roi_name = "L" + str(label_val).zfill(self.name_digits)
+        # ROIs of a label stack are keyed by (slice, label)
+        slice_idx = self.label_imp.getCurrentSlice() if self.label_imp.getStackSize() > 1 else None
+        roi_name = self.rm.roi_name(label_val, slice_idx)
         roi = self.rm.get_roi(roi_name)
         if not roi:
             IJ.log("Mouse clicked, but no ROI associated with this location")
@@ -0,0 +1,115 @@
+"""
+PolygonSimplifier.py
+
+Vertex reduction of ROI outlines.
+- remove_collinear: lossless, removes repeated vertices and vertices on the straight line between
+  their neighbours. The outline is the same polygon: area and Feret values do not change.
+- simplify_for_display: Douglas-Peucker with a tolerance in pixels, only for drawing the overlay.
+  The ROIs themselves (measurements, saving) always keep the full outline.
+SimplificationStats counts the vertices before and after, to report the reduction.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import math
+
+from ij.gui import PolygonRoi
+from java.awt import Polygon
+from jarray import array
+
+class SimplificationStats(object):
+    """Vertex counts of 1 thread, summed with add()."""
+    def __init__(self):
+        self.num_rois = 0
+        self.vertices_in = 0
+        self.vertices_out = 0
+
+    def count(self, vertices_in, vertices_out):
+        self.num_rois += 1
+        self.vertices_in += vertices_in
+        self.vertices_out += vertices_out
+
+    def add(self, other):
+        self.num_rois += other.num_rois
+        self.vertices_in += other.vertices_in
+        self.vertices_out += other.vertices_out
+
+    def summary(self):
+        removed = self.vertices_in - self.vertices_out
+        percentage = 100.0 * removed / self.vertices_in if self.vertices_in else 0.0
+        return ("#ROIs: " + str(self.num_rois) + " | vertices: " + str(self.vertices_in) + " -> " + str(self.vertices_out) +
+                " | removed: " + str(removed) + " (" + str(round(percentage, 2)) + "%)")
+
+def remove_collinear(xs, ys, n):
+    """Returns (xs, ys, n) without repeated and collinear vertices (the input arrays if nothing is removed)."""
+    if n < 3:
+        return xs, ys, n
+    keep_x = []
+    keep_y = []
+    px, py = xs[n - 1], ys[n - 1]
+    for i in range(n):
+        x, y = xs[i], ys[i]
+        nx, ny = xs[(i + 1) % n], ys[(i + 1) % n]
+        if x == px and y == py:
+            continue  # repeated
+        if (x - px) * (ny - y) == (y - py) * (nx - x) and (x - px) * (nx - x) + (y - py) * (ny - y) > 0:
+            continue  # between the previous and the next vertex, on the line connecting them
+        keep_x.append(x)
+        keep_y.append(y)
+        px, py = x, y
+    if len(keep_x) == n:
+        return xs, ys, n
+    if len(keep_x) < 3:
+        return xs, ys, n  # degenerate (a line): leave it as it is
+    return array(keep_x, 'i'), array(keep_y, 'i'), len(keep_x)
+
+def simplify_roi(roi, stats=None):
+    """Lossless: the same roi if no vertex can be removed, otherwise a new ROI of the same type."""
+    poly = roi.getPolygon()
+    xs, ys, n = remove_collinear(poly.xpoints, poly.ypoints, poly.npoints)
+    if stats is not None:
+        stats.count(poly.npoints, n)
+    if n == poly.npoints:
+        return roi
+    return PolygonRoi(Polygon(xs, ys, n), roi.getType())
+
+def _distance_to_segment(x, y, x0, y0, x1, y1):
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(x - x0, y - y0)
+    return abs(dx * (y - y0) - dy * (x - x0)) / math.sqrt(length2)
+
+def simplify_for_display(xs, ys, n, tolerance):
+    """
+    Douglas-Peucker on a closed outline: the result stays within tolerance pixels of the outline.
+    Returns (xs, ys, n), the input arrays when nothing can be removed.
+    """
+    if n <= 4 or tolerance <= 0:
+        return xs, ys, n
+    # split the closed outline at vertex 0 and the vertex farthest from it
+    far = max(range(n), key=lambda i: (xs[i] - xs[0]) ** 2 + (ys[i] - ys[0]) ** 2)
+    keep = [False] * n
+    keep[0] = keep[far] = True
+    stack = [(0, far), (far, n)]  # vertex n is vertex 0 again
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = xs[first], ys[first]
+        x1, y1 = xs[last % n], ys[last % n]
+        max_distance, max_i = -1.0, first
+        for i in range(first + 1, last):
+            distance = _distance_to_segment(xs[i], ys[i], x0, y0, x1, y1)
+            if distance > max_distance:
+                max_distance, max_i = distance, i
+        if max_distance > tolerance:
+            keep[max_i] = True
+            stack.append((first, max_i))
+            stack.append((max_i, last))
+    kept = [i for i in range(n) if keep[i]]
+    if len(kept) == n:
+        return xs, ys, n
+    return [xs[i] for i in kept], [ys[i] for i in kept], len(kept)
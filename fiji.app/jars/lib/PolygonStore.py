@@ -0,0 +1,316 @@
+"""
+PolygonStore.py
+
+Columnar storage of the ROI outlines of the TinyRoiManager, indexed by dense ROI index.
+- the vertices of all outlines are appended to 1 flat int array of x and 1 of y coordinates,
+  offsets/counts give the vertices of an ROI, the bounding boxes are kept in a primitive int array
+- a PolygonRoi is only created when an ImageJ API needs one (roi_array[idx]) and kept in an
+  LRU cache of polygon_cache_size objects: tens of thousands of ROIs cost their coordinates, not
+  tens of thousands of Roi objects. outline(idx) returns the vertices without creating a Roi, e.g. to
+  paint the overlay, so painting or saving all ROIs does not churn the cache
+- ROIs that are not integer polygons (e.g. rectangles or sub-pixel ROIs read from a zip file) and ROIs
+  that have been pinned (properties changed in place) are kept as objects
+- generation(idx) changes whenever ROI idx gets another outline: caches of values computed on an
+  outline (measurements, display outlines) compare generations instead of Roi objects, a ROI that has
+  been evicted and created again is still the same outline. Generations are never reused, not even
+  after clear(): the same generation is always the same outline
+- freeze() returns a FrozenPolygonStore, the outlines as they are at that moment (for a RoiSnapshot):
+  the vertex arrays are only appended to or replaced, the other columns are copy-on-write
+Replacing an outline leaves its old vertices unused, they are removed by compacting the columns
+when there are more unused than used vertices.
+Thread-safe: the detector threads store their ROIs from several threads at the same time.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import threading
+from collections import OrderedDict
+
+from ij.gui import PolygonRoi
+from ij.io import RoiEncoder
+from java.awt import Polygon, Rectangle
+from java.lang import System
+from java.util import Arrays
+from jarray import zeros
+
+from ChunkedArray import ChunkedArray
+
+_MIN_COMPACT = 1 << 16  # do not compact for less unused vertices than this
+
+def _create_roi(xs, ys, n, roi_type, name, position):
+    roi = PolygonRoi(Polygon(xs, ys, n), roi_type)
+    if name:
+        roi.setName(name)
+    if position:
+        roi.setPosition(position)
+    return roi
+
+def _outline_of(roi):
+    polygon = roi.getPolygon()
+    return polygon.xpoints, polygon.ypoints, polygon.npoints
+
+def _outline_hash(xs, ys, offset, n, roi_type, position):
+    return hash((Arrays.hashCode(Arrays.copyOfRange(xs, offset, offset + n)),
+                 Arrays.hashCode(Arrays.copyOfRange(ys, offset, offset + n)), roi_type, position))
+
+class PolygonStore(object):
+    def __init__(self, names=None, cache_size=4096):
+        """
+        Parameters:
+        - names: ChunkedArray with the ROI names by dense index, the name of a created PolygonRoi
+        - cache_size: maximum number of created PolygonRoi objects kept
+        """
+        self.names = names
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        self._last_generation = 0  # not reset by clear()
+        self._init_columns()
+
+    def _init_columns(self):
+        self._xs = zeros(1024, 'i')
+        self._ys = zeros(1024, 'i')
+        self._size = 0                          # used length of _xs and _ys
+        self._unused = 0                        # vertices of replaced outlines
+        self._offsets = ChunkedArray('i', default=0)
+        self._counts = ChunkedArray('i', default=0)      # 0: no outline
+        self._bounds = ChunkedArray('i', default=0)      # x, y, width, height at 4 * idx
+        self._types = ChunkedArray('i', default=0)
+        self._positions = ChunkedArray('i', default=0)   # slice of a label stack, 0 for a single image
+        self._generations = ChunkedArray('i', default=0)
+        self._objects = {}                      # dense index -> Roi kept as object
+        self._cache = OrderedDict()             # dense index -> created PolygonRoi, least recently used first
+
+    def clear(self):
+        with self._lock:
+            self._init_columns()
+
+    def ensure_capacity(self, size):
+        """Allocate the columns for indices [0, size), e.g. before the detector threads start."""
+        for column in (self._offsets, self._counts, self._types, self._positions, self._generations):
+            column.ensure_capacity(size)
+        self._bounds.ensure_capacity(4 * size)
+
+    def _append(self, xs, ys, n):
+        if self._size + n > len(self._xs):
+            capacity = max(2 * len(self._xs), self._size + n)
+            self._xs = Arrays.copyOf(self._xs, capacity)
+            self._ys = Arrays.copyOf(self._ys, capacity)
+        offset = self._size
+        System.arraycopy(xs, 0, self._xs, offset, n)
+        System.arraycopy(ys, 0, self._ys, offset, n)
+        self._size += n
+        return offset
+
+    def _remember(self, idx, roi):
+        cache = self._cache
+        cache.pop(idx, None)
+        cache[idx] = roi
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def __setitem__(self, idx, roi):
+        polygon = roi.getPolygon() if type(roi) is PolygonRoi and not roi.subPixelResolution() else None
+        storable = polygon is not None and polygon.npoints > 0
+        bounds = roi.getBounds()
+        with self._lock:
+            if self._cache.get(idx) is roi or self._objects.get(idx) is roi:
+                self._positions[idx] = roi.getPosition()  # same outline, e.g. named after tracing
+                return
+            self._last_generation += 1
+            self._generations[idx] = self._last_generation
+            self._unused += self._counts[idx]
+            self._counts[idx] = 0
+            self._cache.pop(idx, None)
+            self._objects.pop(idx, None)
+            i = 4 * idx
+            self._bounds[i], self._bounds[i + 1], self._bounds[i + 2], self._bounds[i + 3] = \
+                bounds.x, bounds.y, bounds.width, bounds.height
+            self._positions[idx] = roi.getPosition()
+            if not storable:
+                self._objects[idx] = roi
+                return
+            n = polygon.npoints
+            self._offsets[idx] = self._append(polygon.xpoints, polygon.ypoints, n)
+            self._counts[idx] = n
+            self._types[idx] = roi.getType()
+            self._remember(idx, roi)
+            if self._unused > _MIN_COMPACT and self._unused > self._size - self._unused:
+                self._compact()
+
+    def __getitem__(self, idx):
+        while True:
+            with self._lock:
+                roi = self._objects.get(idx)
+                if roi is None:
+                    roi = self._cache.get(idx)
+                if roi is not None:
+                    self._remember(idx, roi)
+                    return roi
+                n = self._counts[idx]
+                if not n:
+                    return None
+                offset = self._offsets[idx]
+                xs = Arrays.copyOfRange(self._xs, offset, offset + n)
+                ys = Arrays.copyOfRange(self._ys, offset, offset + n)
+                roi_type, position, generation = self._types[idx], self._positions[idx], self._generations[idx]
+            # the Roi is created without holding the lock
+            roi = _create_roi(xs, ys, n, roi_type, self.names[idx] if self.names is not None else None, position)
+            with self._lock:
+                if self._generations[idx] != generation:
+                    continue  # replaced in the meantime
+                existing = self._objects.get(idx)
+                if existing is None:
+                    existing = self._cache.get(idx)
+                if existing is not None:
+                    return existing  # created by another thread in the meantime: 1 object per outline
+                self._remember(idx, roi)
+                return roi
+
+    def outline(self, idx):
+        """(xpoints, ypoints, npoints) of the outline of ROI idx without creating the Roi, None if it has none."""
+        with self._lock:
+            roi = self._objects.get(idx)
+            if roi is None:
+                n = self._counts[idx]
+                if not n:
+                    return None
+                offset = self._offsets[idx]
+                return Arrays.copyOfRange(self._xs, offset, offset + n), Arrays.copyOfRange(self._ys, offset, offset + n), n
+        return _outline_of(roi)
+
+    def _compact(self):
+        """Copies the used vertices into new columns, in dense index order."""
+        xs = zeros(max(1024, self._size - self._unused), 'i')
+        ys = zeros(len(xs), 'i')
+        size = 0
+        for chunk_idx in range(len(self._counts.chunks)):
+            if self._counts.chunks[chunk_idx] is None:
+                continue
+            first = chunk_idx << self._counts.chunk_bits
+            for idx in range(first, first + self._counts.chunk_size):
+                n = self._counts[idx]
+                if n:
+                    offset = self._offsets[idx]
+                    System.arraycopy(self._xs, offset, xs, size, n)
+                    System.arraycopy(self._ys, offset, ys, size, n)
+                    self._offsets[idx] = size
+                    size += n
+        self._xs, self._ys, self._size, self._unused = xs, ys, size, 0
+
+    def freeze(self, names=None):
+        """FrozenPolygonStore with the outlines as they are now, names: frozen names of the ROIs. Costs O(number of chunks)."""
+        with self._lock:
+            return FrozenPolygonStore(self, self.names if names is None else names, self._xs, self._ys,
+                                      self._offsets.freeze(), self._counts.freeze(), self._bounds.freeze(),
+                                      self._types.freeze(), self._positions.freeze(), self._generations.freeze(),
+                                      dict(self._objects))
+
+    def pin(self, idx):
+        """Keeps the Roi object of idx, e.g. before changing its properties in place."""
+        roi = self[idx]
+        if roi is not None:
+            with self._lock:
+                self._objects[idx] = roi
+        return roi
+
+    def generation(self, idx):
+        """Changes whenever idx gets another outline."""
+        return self._generations[idx]
+
+    def position(self, idx):
+        """Slice of a label stack ROI idx lies on, 0 for a single image."""
+        return self._positions[idx]
+
+    def outline_hash(self, idx):
+        """
+        Hash of the outline of ROI idx (vertices, type, slice), without creating the Roi: the same outline
+        gives the same hash in every session. An ROI kept as object is hashed on its encoded bytes.
+        """
+        with self._lock:
+            roi = self._objects.get(idx)
+            if roi is None:
+                return _outline_hash(self._xs, self._ys, self._offsets[idx], self._counts[idx], self._types[idx], self._positions[idx])
+        return Arrays.hashCode(RoiEncoder.saveAsByteArray(roi))
+
+    def bounds(self, idx):
+        """Bounding rectangle of ROI idx, without creating the Roi."""
+        i = 4 * idx
+        return Rectangle(self._bounds[i], self._bounds[i + 1], self._bounds[i + 2], self._bounds[i + 3])
+
+    def summary(self):
+        with self._lock:
+            return ("#vertices: " + str(self._size - self._unused) + " | #unused: " + str(self._unused) +
+                    " | #Roi objects: " + str(len(self._cache)) + " cached, " + str(len(self._objects)) + " kept")
+
+class FrozenPolygonStore(object):
+    """
+    Read-only view of the outlines of a PolygonStore at 1 moment (see PolygonStore.freeze).
+    While an outline is still the current one of the store its cached Roi is used, otherwise (replaced,
+    or the store has been cleared) a Roi is created from the frozen columns.
+    """
+    def __init__(self, store, names, xs, ys, offsets, counts, bounds, types, positions, generations, objects):
+        self._store = store
+        self.names = names
+        self._xs, self._ys = xs, ys
+        self._offsets, self._counts, self._bounds = offsets, counts, bounds
+        self._types, self._positions, self._generations = types, positions, generations
+        self._objects = objects
+
+    def generation(self, idx):
+        return self._generations[idx]
+
+    def bounds(self, idx):
+        i = 4 * idx
+        return Rectangle(self._bounds[i], self._bounds[i + 1], self._bounds[i + 2], self._bounds[i + 3])
+
+    def position(self, idx):
+        return self._positions[idx]
+
+    def has_outline(self, idx):
+        return idx in self._objects or self._counts[idx] > 0
+
+    def outline(self, idx):
+        """(xpoints, ypoints, npoints) of the outline of ROI idx without creating the Roi, None if it has none."""
+        roi = self._objects.get(idx)
+        if roi is not None:
+            return _outline_of(roi)
+        n = self._counts[idx]
+        if not n:
+            return None
+        offset = self._offsets[idx]
+        return Arrays.copyOfRange(self._xs, offset, offset + n), Arrays.copyOfRange(self._ys, offset, offset + n), n
+
+    def create_roi(self, idx):
+        """Roi of idx that is not kept by the store (e.g. to encode or measure it once), None if it has no outline."""
+        roi = self._objects.get(idx)
+        if roi is not None:
+            return roi
+        outline = self.outline(idx)
+        if outline is None:
+            return None
+        xs, ys, n = outline
+        return _create_roi(xs, ys, n, self._types[idx], self.names[idx] if self.names is not None else None, self._positions[idx])
+
+    def outline_hash(self, idx):
+        roi = self._objects.get(idx)
+        if roi is None:
+            return _outline_hash(self._xs, self._ys, self._offsets[idx], self._counts[idx], self._types[idx], self._positions[idx])
+        return Arrays.hashCode(RoiEncoder.saveAsByteArray(roi))
+
+    def __getitem__(self, idx):
+        roi = self._objects.get(idx)
+        if roi is not None:
+            return roi
+        n = self._counts[idx]
+        if not n:
+            return None
+        generation = self._generations[idx]
+        if self._store.generation(idx) == generation:
+            roi = self._store[idx]
+            if self._store.generation(idx) == generation:  # not replaced in the meantime
+                return roi
+        offset = self._offsets[idx]
+        return _create_roi(Arrays.copyOfRange(self._xs, offset, offset + n), Arrays.copyOfRange(self._ys, offset, offset + n),
+                           n, self._types[idx], self.names[idx] if self.names is not None else None, self._positions[idx])
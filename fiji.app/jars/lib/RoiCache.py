@@ -0,0 +1,105 @@
+"""
+RoiCache.py
+
+On-disk cache of converted label images: the ROI set computed from a label image only depends on
+the content of the label file, the filter settings (remove_small, remove_edges, size_threshold) and
+the tracing settings (tracing_engine, scan_step, simplify_outlines).
+- key: SHA-1 of the label file content + these settings. Hashing reads the whole label file: key_for
+  is called on a worker thread (LabelToRoiTask), not on the EDT
+- value: the ROI set as saved by RoiIo.save_to_zip (ROIs, states and tags), <key>.zip in the cache folder
+- the cache folder is bounded to roi_cache_max_bytes, the least recently used ROI sets are removed first
+  (a hit touches the file, so the modification time is the time of last use)
+Reopening a label image that was converted before loads the cached zip instead of tracing all outlines.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import os
+import hashlib
+import shutil
+import tempfile
+
+from ij import IJ
+from java.lang import System
+
+CACHE_VERSION = "1"            # change when the ROI detection changes: old cache entries are not used anymore
+_HASH_BLOCK_SIZE = 1 << 20
+
+class RoiCache(object):
+    def __init__(self, gvars):
+        self.enabled = gvars.get("roi_cache_enabled", True)
+        self.max_bytes = gvars.get("roi_cache_max_bytes", 2 << 30)
+        self.folder = gvars.get("roi_cache_dir") or os.path.join(System.getProperty("user.home"), "FijiLog", "RoiCache")
+
+    def key_for(self, path_label_image, gvars):
+        """Cache key of a label file converted with the filter and tracing settings of gvars, None when the cache is disabled."""
+        if not self.enabled:
+            return None
+        sha1 = hashlib.sha1()
+        with open(path_label_image, 'rb') as f:
+            block = f.read(_HASH_BLOCK_SIZE)
+            while block:
+                sha1.update(block)
+                block = f.read(_HASH_BLOCK_SIZE)
+        settings = "|".join([CACHE_VERSION, str(bool(gvars['remove_small'])), str(bool(gvars['remove_edges'])),
+                             str(gvars['size_threshold']), str(gvars.get("tracing_engine", "contour")),
+                             str(gvars.get("scan_step", 7)), str(bool(gvars.get("simplify_outlines", False)))])
+        sha1.update(settings)
+        return sha1.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".zip")
+
+    def lookup(self, key):
+        """Path of the cached ROI set of key, None on a miss."""
+        if key is None:
+            return None
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            os.utime(path, None)  # most recently used
+        except OSError:
+            pass
+        return path
+
+    def store(self, key, zip_path):
+        """Adds a copy of the ROI set zip_path under key, then evicts the least recently used ROI sets."""
+        if key is None:
+            return
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            # copy to a temp file in the cache folder first: a half written zip is never seen as a hit
+            fd, temp_path = tempfile.mkstemp(suffix=".part", dir=self.folder)
+            os.close(fd)
+            shutil.copyfile(zip_path, temp_path)
+            if os.path.exists(self._path(key)):
+                os.remove(temp_path)  # stored by another image with the same content in the meantime
+            else:
+                os.rename(temp_path, self._path(key))
+            self._evict()
+        except (IOError, OSError) as e:
+            IJ.log("ROI cache: could not store " + zip_path + " (" + str(e) + ")")
+
+    def _evict(self):
+        entries = []
+        for file_name in os.listdir(self.folder):
+            if not file_name.endswith(".zip"):
+                continue
+            path = os.path.join(self.folder, file_name)
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass  # removed by another thread
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -4,6 +4,15 @@ roi_detector.py
 Background worker that scans a labeled image for unprocessed regions and generates ROIs using ImageJ's Wand tool.
 unprocessed = not assigned to an ROI yet
 Intended to be run in parallel by multiple threads to speed up ROI detection.
+The image is split in 2-D tiles, the threads take tiles from a shared queue.
+A label is claimed with a compareAndSet on a shared ownership array before it is traced,
+so a label that straddles tiles is traced exactly once.
+
+The contour engine replaces the Wand calls: one raster sweep (the LabelCensus) finds the first pixel
+of every label, after which the ContourTracer follows each label boundary once (ContourDetector).
+Both detectors can measure each ROI right after tracing it (measurements array, see MeasurementStore),
+so the measuring is spread over the detector threads.
+With gvars["simplify_outlines"] the collinear vertices are removed first (lossless, see PolygonSimplifier).
 
 Author: Bart Vanderbeke & Elisa
 Copyright: © 2025
@@ -16,57 +25,239 @@ from ij import IJ
 from ij.gui import Wand, PolygonRoi, Roi
 from java.awt import Polygon
 from java.lang import Runnable
-from jarray import array
+from java.util.concurrent.atomic import AtomicIntegerArray
+
+from ContourTracer import ContourTracer
+from MeasurementStore import measure_traced_roi
+from PolygonSimplifier import SimplificationStats, simplify_roi
+from LabelCensus import compute_census, label_normalizer
+from TileWork import make_tiles, tile_index, TileQueue, num_threads_for, run_workers
 
 class RoiDetector(Runnable):
-    def __init__(self, ip, pixels, roi_array, start_idx, end_idx, step, width):
+    def __init__(self, ip, pixels, roi_array, claims, tile_queue, step, width, census, normalize, measurements=None,
+                 simplify_stats=None):
         """
         Initialize a parallel ROI detector.
 
         Parameters:
-        - imp: ImagePlus (label image)
-        - roi_array: shared array to store detected ROIs, indexed by label value
-        - start_idx: start pixel index (int)
-        - end_idx: end pixel index (exclusive)
-        - step: step size (usually number of threads)
+        - ip: ImageProcessor (label image)
+        - roi_array: shared array to store detected ROIs, indexed by dense label index
+        - claims: shared AtomicIntegerArray, indexed by dense label index, 1 = label is owned by a detector
+        - tile_queue: shared TileQueue, the detector processes tiles until the queue is empty
+        - step: only every step-th pixel (linear pixel index) is checked
         - width: image width (used for x/y coordinate calculation)
+        - census: LabelCensus of the label image, maps label ids to dense indices
+        - normalize: turns a raw pixel value into a label id (see label_normalizer)
+        - measurements: optional shared list, indexed by dense label index, receives measure_traced_roi of each ROI
+        - simplify_stats: SimplificationStats of this detector, None = no vertex simplification
         """
-        #self.imp = imp
+        self.census = census
+        self.measurements = measurements
+        self.simplify_stats = simplify_stats
+        self.normalize = normalize
         self.roi_array = roi_array
-        self.start_idx = start_idx
-        self.stop_idx = end_idx
+        self.claims = claims
+        self.tile_queue = tile_queue
         self.step_idx = step
         self.width = width
         self.counter = 0
-        #self.short_to_float = array([float(x) for x in range(len(roi_array))], 'f')
         self.wand = Wand(ip)
         self.pixels=pixels
 
     def run(self):
         """
-        Scan the assigned pixels for unprocessed labels and generate ROIs
+        Scan the assigned tiles for unclaimed labels and generate ROIs
         by tracing the boundary using ImageJ's Wand tool.
+        A label is traced only by the detector that wins the compareAndSet on its claim.
         """
         wand=self.wand
         pixels=self.pixels
-        current_pixel_value,x,y,target_value=0,0,0,0.0
-        #for pxl_idx in range(self.start_idx, self.stop_idx, self.step_idx):
-        pxl_idx = self.start_idx
-        while pxl_idx < self.stop_idx:        
-            current_pixel_value = pixels[pxl_idx]
-
-            if not self.roi_array[current_pixel_value]:
-                self.counter+=1
-
-                y = pxl_idx // self.width
-                x = pxl_idx % self.width
-                target_value = float(current_pixel_value)
-                #target_value = self.short_to_float[current_pixel_value]
-
-                wand.autoOutline(x, y, target_value, target_value, Wand.EIGHT_CONNECTED)
-
-                #if wand.npoints > 0:
-                poly = Polygon(wand.xpoints, wand.ypoints, wand.npoints)
-                roi = PolygonRoi(poly, Roi.TRACED_ROI)
-                self.roi_array[current_pixel_value] = roi
-            pxl_idx += self.step_idx
\ No newline at end of file
+        claims=self.claims
+        width=self.width
+        step=self.step_idx
+        dense_of=self.census.dense_of
+        normalize=self.normalize
+        measurements=self.measurements
+        simplify_stats=self.simplify_stats
+        next_tile = self.tile_queue.next()
+        while next_tile is not None:
+            _, (x0, y0, x1, y1) = next_tile
+            for y in range(y0, y1):
+                # keep the sampling grid of the linear pixel index, independent of the tiling
+                row_offset = y * width
+                x = x0 + (-(row_offset + x0)) % step
+                while x < x1:
+                    value = pixels[row_offset + x]
+                    label = normalize(value)
+                    dense = dense_of.get(label, 0)
+                    if claims.compareAndSet(dense, 0, 1):
+                        self.counter+=1
+                        # the Wand compares pixel values: a float label (e.g. 3.5) is traced at its raw value,
+                        # not at the truncated label id; bytes and shorts are signed in Java, their label id is the value
+                        target_value = value if isinstance(value, float) else float(label)
+                        wand.autoOutline(x, y, target_value, target_value, Wand.EIGHT_CONNECTED)
+                        poly = Polygon(wand.xpoints, wand.ypoints, wand.npoints)
+                        roi = PolygonRoi(poly, Roi.TRACED_ROI)
+                        if simplify_stats is not None:
+                            roi = simplify_roi(roi, simplify_stats)
+                        self.roi_array[dense] = roi
+                        if measurements is not None:
+                            measurements[dense] = measure_traced_roi(roi)
+                    x += step
+            next_tile = self.tile_queue.next()
+
+class ContourDetector(Runnable):
+    def __init__(self, tracer, roi_array, claims, tile_queue, labels_per_tile, seeds, width, measurements=None,
+                 simplify_stats=None):
+        """
+        Trace the outline of the labels whose seed pixel lies in the tiles taken from the tile queue.
+
+        Parameters:
+        - tracer: ContourTracer on the label image
+        - roi_array: shared array to store detected ROIs, indexed by dense label index
+        - claims: shared AtomicIntegerArray, indexed by dense label index, 1 = label is owned by a detector
+        - tile_queue: shared TileQueue
+        - labels_per_tile: labels_per_tile[tile_idx] = dense indices of the labels with their seed in that tile
+        - seeds: seeds[dense] = index + 1 of the first pixel of the label in raster order
+        - width: image width
+        - measurements: optional shared list, indexed by dense label index, receives measure_traced_roi of each ROI
+        - simplify_stats: SimplificationStats of this detector, None = no vertex simplification
+        """
+        self.tracer = tracer
+        self.measurements = measurements
+        self.simplify_stats = simplify_stats
+        self.roi_array = roi_array
+        self.claims = claims
+        self.tile_queue = tile_queue
+        self.labels_per_tile = labels_per_tile
+        self.seeds = seeds
+        self.width = width
+        self.counter = 0
+
+    def run(self):
+        tracer = self.tracer
+        claims = self.claims
+        width = self.width
+        measurements = self.measurements
+        simplify_stats = self.simplify_stats
+        next_tile = self.tile_queue.next()
+        while next_tile is not None:
+            tile_idx, _ = next_tile
+            for label in self.labels_per_tile[tile_idx]:
+                if claims.compareAndSet(label, 0, 1):
+                    pxl_idx = self.seeds[label] - 1
+                    roi = tracer.trace_roi(pxl_idx % width, pxl_idx // width)
+                    if simplify_stats is not None:
+                        roi = simplify_roi(roi, simplify_stats)
+                    self.roi_array[label] = roi
+                    # measured while the outline is still in the cache of this thread
+                    if measurements is not None:
+                        measurements[label] = measure_traced_roi(roi)
+                    self.counter += 1
+            next_tile = self.tile_queue.next()
+
+def _new_claims(num_labels):
+    claims = AtomicIntegerArray(num_labels)
+    claims.set(0, 1)  # background is never traced
+    return claims
+
+def _new_simplify_stats(gvars):
+    """SimplificationStats for 1 detector, None when the outlines are not simplified."""
+    return SimplificationStats() if gvars.get("simplify_outlines", False) else None
+
+def _log_simplify_stats(detectors, extra_stats=None):
+    stats = [d.simplify_stats for d in detectors if d.simplify_stats is not None]
+    if not stats:
+        return
+    total = SimplificationStats()
+    for s in stats + ([extra_stats] if extra_stats is not None else []):
+        total.add(s)
+    IJ.log("Outline simplification | " + total.summary())
+
+def detect_with_wand(ip, roi_array, gvars, step=7, census=None, measurements=None):
+    """
+    Sample every 'step'-th pixel and outline each new label with ImageJ's Wand.
+    The labels the sampling missed (narrower than the step on every row) are traced
+    afterwards from their census seed pixel, so no label is lost.
+    ROIs are stored at the dense label index of the census.
+    measurements: optional list of census.num_labels entries, filled with measure_traced_roi of each ROI.
+    Returns the number of ROIs found.
+    """
+    width = ip.getWidth()
+    height = ip.getHeight()
+    if census is None:
+        census = compute_census(ip, gvars)
+    num_threads = num_threads_for(width * height, gvars)
+    tile_queue = TileQueue(make_tiles(width, height, gvars.get("tile_size", 512)))
+    claims = _new_claims(census.num_labels)
+    normalize = label_normalizer(ip)
+
+    runnables = [
+        RoiDetector(ip, ip.getPixels(), roi_array, claims, tile_queue, step, width, census, normalize, measurements,
+                    _new_simplify_stats(gvars))
+        for t in range(num_threads)
+    ]
+    run_workers(runnables)
+    IJ.log("Wand engine | #threads: " + str(num_threads) + " | #tiles: " + str(len(tile_queue.tiles)) + " | step: " + str(step))
+    counter = sum(r.counter for r in runnables)
+
+    # completeness check: every label present in the image must have been claimed
+    labels = census.labels()
+    missing = [label for label in labels if not claims.get(label)]
+    wand = Wand(ip)
+    simplify_stats = _new_simplify_stats(gvars)
+    for label in missing:
+        claims.set(label, 1)
+        pxl_idx = census.seed(label)
+        target_value = float(census.label_id(label))
+        wand.autoOutline(pxl_idx % width, pxl_idx // width, target_value, target_value, Wand.EIGHT_CONNECTED)
+        poly = Polygon(wand.xpoints, wand.ypoints, wand.npoints)
+        roi_array[label] = PolygonRoi(poly, Roi.TRACED_ROI)
+        if simplify_stats is not None:
+            roi_array[label] = simplify_roi(roi_array[label], simplify_stats)
+        if measurements is not None:
+            measurements[label] = measure_traced_roi(roi_array[label])
+    _log_simplify_stats(runnables, simplify_stats)
+    num_labels = len(labels)
+    coverage = 100.0 * counter / num_labels if num_labels else 100.0
+    IJ.log("Sparse scan | step: " + str(step) + " | pixels checked: " + str((width * height + step - 1) // step) +
+           " | labels present: " + str(num_labels) + " | found by scan: " + str(counter) +
+           " (" + str(round(coverage, 2)) + "%) | traced afterwards: " + str(len(missing)))
+    return counter + len(missing)
+
+def detect_with_contours(ip, roi_array, gvars, census=None, labels=None, measurements=None):
+    """
+    One raster sweep (the census) finds the first pixel of every label, then every label boundary
+    is traced exactly once by the ContourTracer.
+    ROIs are stored at the dense label index of the census.
+    labels: dense indices of the labels to trace, default all labels of the census.
+    measurements: optional list of census.num_labels entries, filled with measure_traced_roi of each ROI.
+    Returns the number of ROIs found.
+    """
+    width = ip.getWidth()
+    height = ip.getHeight()
+    if census is None:
+        census = compute_census(ip, gvars)
+    num_threads = num_threads_for(width * height, gvars)
+    tile_size = gvars.get("tile_size", 512)
+    tiles = make_tiles(width, height, tile_size)
+
+    if labels is None:
+        labels = census.labels()
+    labels_per_tile = [[] for _ in tiles]
+    for label in labels:
+        pxl_idx = census.seed(label)
+        labels_per_tile[tile_index(pxl_idx % width, pxl_idx // width, width, tile_size)].append(label)
+
+    tracer = ContourTracer(ip.getPixels(), width, height)
+    tile_queue = TileQueue(tiles)
+    claims = _new_claims(census.num_labels)
+    detectors = [
+        ContourDetector(tracer, roi_array, claims, tile_queue, labels_per_tile, census.first_pixel, width, measurements,
+                        _new_simplify_stats(gvars))
+        for t in range(num_threads)
+    ]
+    run_workers(detectors)
+    _log_simplify_stats(detectors)
+    IJ.log("Contour engine | #threads: " + str(num_threads) + " | #tiles: " + str(len(tiles)) + " | #labels: " + str(len(labels)))
+    return sum(d.counter for d in detectors)
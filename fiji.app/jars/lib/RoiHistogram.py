@@ -2,8 +2,10 @@ class RoiHistogram:
     """
     Class to compute histogram data for all measurements from a RoiMeasurements object.
     This class prepares all data in the background to allow the plot to be hson or updated instantaneously
-    Each bin contains a list of ROI names that fall into that bin (not just a count).
+    Each bin contains the set of ROI names that fall into that bin (not just a count).
     Also computes oversampled x and y values for plotting.
+    apply_moves() only moves the ROIs whose subset changed to the bins of their new subset and redoes the
+    plot data of the changed subsets: the bin edges depend on subset "ALL", which does not change.
 
     Usage:
         hist = RoiHistogram(num_bins=20, num_x_values=200, measurements=msmts)
@@ -16,7 +18,7 @@ class RoiHistogram:
         self.num_bins = num_bins
         self.num_x_values = num_x_values
         self.roi_measurements = roi_measurements
-        self.bins = {}       # {measurement_name: list of bins, each bin = list of ROI names}
+        self.bins = {}       # {measurement_name: list of bins, each bin = set of ROI names}
         self.plot_data = {}  # {measurement_name: {"x": [...], "y": [...], "bin_edges": [...]}}
         self.bin_width = {}
         self.x_range = {}
@@ -24,7 +26,7 @@ class RoiHistogram:
         self.yMax = {}
         self.yMin = {}
     def compute(self):
-        self.bins = {}       # {measurement_name: list of bins, each bin = list of ROI names}
+        self.bins = {}       # {measurement_name: list of bins, each bin = set of ROI names}
         self.plot_data = {}  # {measurement_name: {"x": [...], "y": [...], "bin_edges": [...]}}
         self.bin_width = {}
         self.x_range = {}
@@ -44,46 +46,65 @@ class RoiHistogram:
             
             self.bin_start[msmt_name] =[ minval+(i * bin_width) for i in range(self.num_bins+1)]
             
-            x_step = x_range / float (self.num_x_values)
-            bin_idx_step = float(self.num_bins) / float(self.num_x_values)
             subset_names=self.roi_measurements.subset_stats.keys()
 
             for subset_name in subset_names:
                 # Prepare empty bins
-                self.bins.setdefault(subset_name, {})[msmt_name] = [[] for _ in range(self.num_bins)]
+                self.bins.setdefault(subset_name, {})[msmt_name] = [set() for _ in range(self.num_bins)]
 
                 roi_names = self.roi_measurements.roi_subset[subset_name]
 
                 for roi_name in roi_names:
                     val = self.roi_measurements.measurements[roi_name][msmt_name]
-                    bin_index = int((val - minval) / bin_width)
-                    bin_index = min(self.num_bins - 1, bin_index)
-                    self.bins[subset_name][msmt_name][bin_index].append(roi_name)
-
-                # Oversampled plotting data
-                x_plot = []
-                y_plot = []
-                # x_step is no longer needed here due to bin_idx_step usage
-                x_val = minval
-                bin_idx_float = 0.0
-
-                for x_idx in range(self.num_x_values + 1):
-                    # oversampled bin index stepping (avoiding repeated multiplies)
-                    bin_idx_float += bin_idx_step
-                    bin_idx = int(bin_idx_float)
-                    bin_idx = min(self.num_bins - 1, bin_idx)
-                    x_val +=  x_step
-                    x_plot.append(x_val)
-                    bin_content = self.bins[subset_name][msmt_name][bin_idx]
-                    frequency = len(bin_content)
-                    y_plot.append(frequency)
-
-                self.plot_data.setdefault(subset_name, {})[msmt_name] = {"x": x_plot, "y": y_plot}
-                self.yMax.setdefault(subset_name, {})[msmt_name] = max(y_plot) * 1.01
-                self.yMin.setdefault(subset_name, {})[msmt_name] = min(y_plot)
-
-                
-             
+                    self.bins[subset_name][msmt_name][self._bin_index(msmt_name, val)].add(roi_name)
+
+                self._compute_plot_data(subset_name, msmt_name)
+
+    def _bin_index(self, msmt_name, val):
+        if not self.bin_width[msmt_name]:
+            return 0  # all values are the same
+        bin_index = int((val - self.bin_start[msmt_name][0]) / self.bin_width[msmt_name])
+        return min(self.num_bins - 1, bin_index)
+
+    def _compute_plot_data(self, subset_name, msmt_name):
+        """Oversampled plotting data of 1 subset and measurement, from the bins."""
+        minval = self.bin_start[msmt_name][0]
+        x_step = self.x_range[msmt_name] / float (self.num_x_values)
+        bin_idx_step = float(self.num_bins) / float(self.num_x_values)
+        x_plot = []
+        y_plot = []
+        # x_step is no longer needed here due to bin_idx_step usage
+        x_val = minval
+        bin_idx_float = 0.0
+
+        for x_idx in range(self.num_x_values + 1):
+            # oversampled bin index stepping (avoiding repeated multiplies)
+            bin_idx_float += bin_idx_step
+            bin_idx = int(bin_idx_float)
+            bin_idx = min(self.num_bins - 1, bin_idx)
+            x_val +=  x_step
+            x_plot.append(x_val)
+            bin_content = self.bins[subset_name][msmt_name][bin_idx]
+            frequency = len(bin_content)
+            y_plot.append(frequency)
+
+        self.plot_data.setdefault(subset_name, {})[msmt_name] = {"x": x_plot, "y": y_plot}
+        self.yMax.setdefault(subset_name, {})[msmt_name] = max(y_plot) * 1.01
+        self.yMin.setdefault(subset_name, {})[msmt_name] = min(y_plot)
+
+    def apply_moves(self, moves):
+        """moves: [(roi name, old subset, new subset)] from RoiMeasurements.update_state_subsets, subset None: in no subset"""
+        for msmt_name in self.roi_measurements.measurement_names:
+            for roi_name, old_subset, new_subset in moves:
+                bin_index = self._bin_index(msmt_name, self.roi_measurements.measurements[roi_name][msmt_name])
+                if old_subset:
+                    self.bins[old_subset][msmt_name][bin_index].discard(roi_name)
+                if new_subset:
+                    self.bins[new_subset][msmt_name][bin_index].add(roi_name)
+        for subset_name in set(subset for _, old, new in moves for subset in (old, new) if subset):
+            for msmt_name in self.roi_measurements.measurement_names:
+                self._compute_plot_data(subset_name, msmt_name)
+
 from javax.swing import SwingWorker
 
 class ComputeHistogramDataWorker(SwingWorker):
@@ -1,6 +1,15 @@
 """
 Swing-based version of RoiImage with dynamic scaling, zoom support,
 and rectangle selection (rubberbanding) with callback.
+Only the ROIs in the visible part of the image are drawn (spatial index of the TinyRoiManager).
+With gvars["display_tolerance"] > 0 the outlines are drawn simplified (Douglas-Peucker, see PolygonSimplifier),
+the simplified outlines are cached per ROI.
+The ROI names are drawn as GlyphVectors of 1 shared font (the ImageJ default TextRoi font), laid out once
+per name and kept in an LRU cache, centred on the label position of the TinyRoiManager.
+The RoiImage listens to the change events of the TinyRoiManager and only repaints the part of the panel
+around the ROIs that changed; show() repaints everything only when the display settings change.
+Label stacks: only the ROIs of 1 slice (position) are drawn, Page Down / Page Up show the next / previous
+slice (and the same slice of the image when it is a stack too).
 
 Author: Bart Vanderbeke & Elisa
 Copyright: © 2025
@@ -10,14 +19,22 @@ Parts of the code in this project have been derived from chatGPT suggestions.
 
 """
 
+import math
+from collections import OrderedDict
+
 from javax.swing import JFrame, JPanel, WindowConstants, KeyStroke, AbstractAction
-from java.awt import Color,  RenderingHints, BasicStroke
+from java.awt import Color,  RenderingHints, BasicStroke, Font
 from java.awt.geom.Path2D import Float as java_float
 from java.awt.geom import AffineTransform
 from java.awt.event import WindowAdapter, MouseAdapter, MouseMotionAdapter, MouseEvent
 from java.awt import Dimension, Rectangle
 
+from ij import IJ
+from ij.gui import TextRoi
 from TinyRoiManager import TinyRoiManager
+from PolygonSimplifier import SimplificationStats, simplify_for_display
+
+_GLYPH_CACHE_SIZE = 8192  # laid out ROI names kept
 
 class RoiImagePanel(JPanel):
     def __init__(self, roi_image):
@@ -25,6 +42,7 @@ class RoiImagePanel(JPanel):
         self.roi_image = roi_image
         self.zoom_factor = 1.0
         self.register_zoom_keys()
+        self.register_slice_keys()
 
         # rubberband state
         self.dragging = False
@@ -64,6 +82,24 @@ class RoiImagePanel(JPanel):
         amap.put("zoom_out", ZoomOutAction())
         amap.put("zoom_reset", ZoomResetAction())
 
+    def register_slice_keys(self):
+        imap = self.getInputMap(JPanel.WHEN_IN_FOCUSED_WINDOW)
+        amap = self.getActionMap()
+
+        imap.put(KeyStroke.getKeyStroke("PAGE_DOWN"), "next_slice")
+        imap.put(KeyStroke.getKeyStroke("PAGE_UP"), "previous_slice")
+
+        class NextSliceAction(AbstractAction):
+            def actionPerformed(inner_self, e):
+                self.roi_image.set_position(self.roi_image.position + 1)
+
+        class PreviousSliceAction(AbstractAction):
+            def actionPerformed(inner_self, e):
+                self.roi_image.set_position(self.roi_image.position - 1)
+
+        amap.put("next_slice", NextSliceAction())
+        amap.put("previous_slice", PreviousSliceAction())
+
     def paintComponent(self, g):
         super(RoiImagePanel, self).paintComponent(g)
         g2 = g.create()
@@ -107,23 +143,28 @@ class RoiImagePanel(JPanel):
             rh = abs(sy - cy)
             g.drawRect(rx, ry, rw, rh)
 
-    def panelToImageCoordinates(self, px, py):
-        buffered = self.roi_image.getBufferedImage()
-        panel_width = self.getWidth()
-        panel_height = self.getHeight()
-
-        img_width = buffered.getWidth()
-        img_height = buffered.getHeight()
-
-        scale_x = float(panel_width) / img_width
-        scale_y = float(panel_height) / img_height
-        base_scale = min(scale_x, scale_y)
+    def _image_transform(self):
+        """(x_offset, y_offset, total_scale) of the image in the panel, as painted by paintComponent."""
+        processor = self.roi_image.getProcessor()  # only the size: no BufferedImage
+        img_width = processor.getWidth()
+        img_height = processor.getHeight()
+        base_scale = min(float(self.getWidth()) / img_width, float(self.getHeight()) / img_height)
         total_scale = base_scale * self.zoom_factor
+        x_offset = (self.getWidth() - int(img_width * total_scale)) // 2
+        y_offset = (self.getHeight() - int(img_height * total_scale)) // 2
+        return x_offset, y_offset, total_scale
+
+    def repaint_image_rectangle(self, rect):
+        """Repaints the part of the panel that shows rect (image coordinates)."""
+        x_offset, y_offset, total_scale = self._image_transform()
+        x0 = int(math.floor(x_offset + rect.x * total_scale)) - 1
+        y0 = int(math.floor(y_offset + rect.y * total_scale)) - 1
+        x1 = int(math.ceil(x_offset + (rect.x + rect.width) * total_scale)) + 1
+        y1 = int(math.ceil(y_offset + (rect.y + rect.height) * total_scale)) + 1
+        self.repaint(x0, y0, x1 - x0, y1 - y0)
 
-        new_w = int(img_width * total_scale)
-        new_h = int(img_height * total_scale)
-        x_offset = (panel_width - new_w) // 2
-        y_offset = (panel_height - new_h) // 2
+    def panelToImageCoordinates(self, px, py):
+        x_offset, y_offset, total_scale = self._image_transform()
 
         ix = (px - x_offset) / total_scale
         iy = (py - y_offset) / total_scale
@@ -188,9 +229,16 @@ class RoiImage:
             self.state_style_map = {}
 
         self.use_state_map = True
+        # slice of a label stack whose ROIs are drawn and selected, ROIs without a slice (0) are always drawn
+        self.position = self.imageplus.getCurrentSlice() if self.imageplus is not None else 1
         self.on_window_closing = on_window_closing
         self.visible = True
         self.on_rectangle_select = on_rectangle_select
+        self.display_tolerance = trm.gvars.get("display_tolerance", 0.0)
+        self._display_outlines = {}  # ROI name -> (outline generation, (xpoints, ypoints, npoints)) drawn for that ROI
+        self.label_font = Font(TextRoi.getDefaultFontName(), TextRoi.getDefaultFontStyle(), TextRoi.getDefaultFontSize())
+        self._label_glyphs = OrderedDict()  # ROI name -> (GlyphVector, dx, dy to centre it), least recently used first
+        self._shown_settings = None  # (overlay, show_labels, show_deleted) of the last show()
 
         self.frame = JFrame("RoiImage Viewer")
         self.panel = RoiImagePanel(self)
@@ -206,6 +254,33 @@ class RoiImage:
         self.panel.setPreferredSize(Dimension(self.processor.getWidth(), self.processor.getHeight()))
         self.frame.pack()
 
+        trm.add_change_listener(self._on_rois_changed)
+        class ClosedListener(WindowAdapter):
+            def windowClosed(inner_self, event):
+                self.trm.remove_change_listener(self._on_rois_changed)
+        self.frame.addWindowListener(ClosedListener())
+
+    def _on_rois_changed(self, event):
+        """Change listener of the TinyRoiManager: repaints the changed ROIs (Swing repaint can be called from any thread)."""
+        if event.reset:
+            self.panel.repaint()
+            return
+        dirty = None
+        roi_array = self.trm.roi_array
+        for idx in event.changes:
+            bounds = roi_array.bounds(idx)
+            dirty = bounds if dirty is None else dirty.union(bounds)
+        if dirty is None:
+            return
+        margin = self._overlay_margin()
+        dirty.grow(margin, margin)
+        self.panel.repaint_image_rectangle(dirty)
+
+    def _overlay_margin(self):
+        """Image pixels an ROI can be drawn outside of its bounds: the outline of a selected ROI is drawn wider and its name can stick out."""
+        max_stroke = max(stroke for _, stroke in self.state_style_map.values()) if self.state_style_map else 1.0
+        return int(math.ceil(max_stroke)) + self.label_font.getSize() * (self.trm.name_length or 1)
+
     def getFrame(self):
         return self.frame
 
@@ -219,21 +294,38 @@ class RoiImage:
             TinyRoiManager.ROI_STATE_SELECTED
         ]
 
+        display_stats = SimplificationStats()
+        # viewport culling: only the ROIs in the visible part of the image (clip in image coordinates)
+        # everything is read from 1 snapshot by dense index: a reset or edit on another thread while painting
+        # does not change the ROIs that are drawn
+        clip = g2d.getClipBounds()
+        if clip is not None:
+            # an ROI just outside of the clip can still draw its stroke or name into it
+            margin = self._overlay_margin()
+            clip.grow(margin, margin)
+            snapshot, indices = self.trm.intersecting(clip)
+        else:
+            snapshot = self.trm.snapshot()
+            indices = snapshot.indices(*state_order)
+        visible_rois = list(snapshot.entries_at(indices))
         for target_state in state_order:
-            for name, roi, state, tags in self.trm.iter_all():
+            for idx, name, state, tags in visible_rois:
                 if state != target_state:
                     continue
                 if state == TinyRoiManager.ROI_STATE_DELETED and not self.show_deleted:
                     continue
+                if snapshot.roi_array.position(idx) not in (0, self.position):
+                    continue  # other slice of a label stack
+                # the vertices are read from the outline columns: painting does not create Roi objects
+                outline = snapshot.roi_array.outline(idx)
+                if outline is None:
+                    continue
 
                 color, stroke = self._get_style_for_state(state)
                 g2d.setColor(color)
                 g2d.setStroke(BasicStroke(stroke))
 
-                polygon = roi.getPolygon()
-                xpoints = polygon.xpoints
-                ypoints = polygon.ypoints
-                n = polygon.npoints
+                xpoints, ypoints, n = self._display_outline(snapshot, idx, name, outline, display_stats)
 
                 path = java_float()
                 path.moveTo(xpoints[0], ypoints[0])
@@ -243,11 +335,52 @@ class RoiImage:
                 g2d.draw(path)
 
                 if self.show_labels:
-                    label = self.trm.label_array[self.trm.name_to_index[name]]
-                    font = label.getCurrentFont()
-                    g2d.setFont(font)
-                    g2d.setColor(color)
-                    g2d.drawString(label.getText(), label.getXBase(), label.getYBase())
+                    x, y = snapshot.label_position(idx)
+                    glyphs, dx, dy = self._label(name, g2d)
+                    g2d.drawGlyphVector(glyphs, x + dx, y + dy)
+        if display_stats.num_rois:
+            IJ.log("Display outlines | tolerance: " + str(self.display_tolerance) + " | " + display_stats.summary())
+
+    def set_position(self, position):
+        """Shows the ROIs of slice position of a label stack (and that slice of the image if it is a stack)."""
+        num_slices = max(self.trm.num_slices, self.imageplus.getStackSize() if self.imageplus is not None else 1)
+        position = min(max(position, 1), num_slices)
+        if position == self.position:
+            return
+        self.position = position
+        if self.imageplus is not None and position <= self.imageplus.getStackSize():
+            self.imageplus.setSlice(position)
+            self.processor = self.imageplus.getProcessor()
+        self.frame.setTitle("RoiImage Viewer - slice " + str(position) + "/" + str(num_slices))
+        self.panel.repaint()
+
+    def _display_outline(self, snapshot, idx, name, outline, display_stats):
+        """(xpoints, ypoints, npoints) to draw for outline (of ROI idx): the outline itself or its cached simplified version."""
+        if self.display_tolerance <= 0:
+            return outline
+        # compare the outline generation: the vertices are new arrays on every paint
+        generation = snapshot.roi_array.generation(idx)
+        cached = self._display_outlines.get(name)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        xpoints, ypoints, npoints = outline
+        simplified = simplify_for_display(xpoints, ypoints, npoints, self.display_tolerance)
+        display_stats.count(npoints, simplified[2])
+        self._display_outlines[name] = (generation, simplified)
+        return simplified
+
+    def _label(self, name, g2d):
+        """(GlyphVector, dx, dy) of the name label: drawn at label position + (dx, dy) it is centred on that position."""
+        cache = self._label_glyphs
+        cached = cache.pop(name, None)
+        if cached is None:
+            glyphs = self.label_font.createGlyphVector(g2d.getFontRenderContext(), name)
+            bounds = glyphs.getLogicalBounds()
+            cached = (glyphs, -bounds.getWidth() / 2.0, -bounds.getY() - bounds.getHeight() / 2.0)
+            if len(cache) >= _GLYPH_CACHE_SIZE:
+                cache.popitem(last=False)
+        cache[name] = cached
+        return cached
 
     def _get_style_for_state(self, state):
         if self.use_state_map and state in self.state_style_map:
@@ -267,7 +400,10 @@ class RoiImage:
         self.show_labels = show_labels
         self.show_deleted = show_deleted
         self.overlay_enabled = overlay
-        self.panel.repaint()
+        settings = (overlay, show_labels, show_deleted)
+        if settings != self._shown_settings or not self.frame.isVisible():
+            self.panel.repaint()  # the changed ROIs themselves are repainted by _on_rois_changed
+        self._shown_settings = settings
         self.frame.setVisible(True)
 
     def setVisible(self, flag):
@@ -6,6 +6,13 @@ Integrates with TinyRoiManager. Supports multiple loading strategies depending o
 - With Lxxxx.roi naming and tags.json
 - With Lxxxx.roi naming
 - With no naming: infers labels from pixel-value at centroid position of an ROI in label image.
+Saving encodes the ROIs in memory and streams them into a ZipOutputStream, tags.json last.
+Loading decodes the ROIs from the bytes of the zip entries, nothing is extracted to TEMP: 1 reader
+thread reads the entries into a bounded queue, a pool of decoder threads decodes them (_decode_entries).
+Incremental save: tags.json holds a fingerprint of the saved outlines. When the target zip (or the last
+zip loaded or saved) has the same fingerprint, its .roi entries are copied as raw bytes and only
+tags.json is written again.
+Every save writes <path>.part and then moves it over path: an interrupted save never leaves a broken zip.
 
 Author: Bart Vanderbeke & Elisa
 Copyright: © 2025
@@ -14,21 +21,32 @@ License: MIT
 Parts of the code in this project have been derived from chatGPT suggestions.
 """
 
-import zipfile
 import os
 import json
+import threading
+import zipfile
 
 from ij import IJ
 from ij.io import RoiEncoder, RoiDecoder
 from ij.gui import PolygonRoi, Roi
-from ij.gui import TextRoi
 
-from java.awt import Polygon
 from java.awt import Color
-from java.lang import Thread, Runnable
+from java.io import BufferedOutputStream, DataInputStream, FileOutputStream
+from java.lang import String, Runtime
+from java.util import Collections
+from java.util.concurrent import ArrayBlockingQueue, Callable, Executors
+from java.nio.file import AtomicMoveNotSupportedException, Files, Paths, StandardCopyOption
+from java.util.zip import ZipEntry, ZipFile, ZipOutputStream
+from jarray import zeros
 
 from StopWatch import StopWatch
 from TinyRoiManager import TinyRoiManager
+from LabelCensus import label_normalizer
+
+_END_OF_ENTRIES = (0, None, None)  # queued once per decoder thread after the last entry
+_FINGERPRINT_KEY = "geometry_fingerprint"  # tags.json: fingerprint of the outlines in the zip
+_FNV_PRIME = 1099511628211
+_MASK_64 = (1 << 64) - 1
 
 class RoiIo(object):
     _shared_instance=None
@@ -43,50 +61,117 @@ class RoiIo(object):
             IJ.log("RoiIo: singleton instance had already been created. This new call is ignored.")
             return
         self._gvars = gvars
-        self._clean_up_list=[]
         self._rm = TinyRoiManager.getInstance2()
         self._imp_lbl=None
-        self._temp_dir = os.getenv('TEMP') or './tmp'
 
     @staticmethod
     def getInstance():
         return RoiIo._shared_instance
 
-    def _delete_later(self):
-        def delete_job():
-            try:
-                for f in self._clean_up_list:
-                    if os.path.exists(f):
-                        os.remove(f)
-            except Exception as e:
-                print("Could not delete: " + f + " - " + str(e))
-        thread = Thread(delete_job, "DeleteJobThread")
-        thread.start()
-
-    def save_to_zip(self,path, exclude_deleted=False):
-        self._clean_up_list = []
-        with self._rm.lock:
-            tag_json = {}
-            with zipfile.ZipFile(path, 'w') as zip_file:
-                for i in range(1,self._rm.range_stop):
-                    if self._rm.roi_array[i] and (not exclude_deleted or self._rm.states[i] != self._rm.ROI_STATE_DELETED):
-                        tag_json["range_stop"] = self._rm.range_stop
-                        name = self._rm.index_to_name[i]
-                        roi = self._rm.roi_array[i]
-                        roi_path = os.path.join(self._temp_dir , name + ".roi")
-                        RoiEncoder.save(roi, roi_path)
-                        zip_file.write(roi_path, arcname=name + ".roi")
-                        self._clean_up_list.append(roi_path)
-                        json_value = [self._rm.state_to_str(self._rm.states[i])] + list(self._rm.tags[i])
-                        tag_json[name] = json_value
-                json_data = json.dumps(tag_json)
-                
-                tags_path = os.path.join(self._temp_dir , "tags.json")
-                with open(tags_path, 'w') as f:
-                    f.write(json_data)
-                zip_file.write(tags_path, arcname="tags.json")
-                self._clean_up_list.append(tags_path)
-        self._delete_later()
+    def save_to_zip(self,path, exclude_deleted=False, rm=None, incremental=True, snapshot=None):
+        """
+        rm: the TinyRoiManager to save, default the shared instance (batch mode passes a detached manager)
+        snapshot: RoiSnapshot of rm to save, default the current one (AutoSave takes it when the save is requested)
+        incremental: when path or the last zip loaded into or saved from rm (rm.reference_zip, kept per manager:
+        the batch workers save detached managers concurrently) holds the same outlines (geometry fingerprint),
+        only tags.json is written again, see _save_tags_only.
+        Otherwise every ROI is encoded into a byte array and streamed into the zip, followed by tags.json.
+        The ROIs are read from a snapshot, the manager is not locked while writing.
+        """
+        rm = self._rm if rm is None else rm
+        states = (rm.ROI_STATE_ACTIVE, rm.ROI_STATE_SELECTED) if exclude_deleted else rm.ALL_STATES
+        snapshot = rm.snapshot() if snapshot is None else snapshot
+        indices = list(snapshot.indices(*states))
+        tag_json = {}
+        if indices:
+            tag_json["range_stop"] = snapshot.range_stop
+            tag_json[_FINGERPRINT_KEY] = self._geometry_fingerprint(snapshot, indices)
+        for i in indices:
+            tag_json[snapshot.index_to_name[i]] = [rm.state_to_str(snapshot.states[i])] + list(snapshot.tags(i))
+        json_data = json.dumps(tag_json)
+
+        if incremental and indices:
+            for source in (path, rm.reference_zip):
+                if source and self._save_tags_only(source, path, tag_json[_FINGERPRINT_KEY], json_data):
+                    rm.reference_zip = path
+                    return
+
+        part_path = path + ".part"
+        zip_out = ZipOutputStream(BufferedOutputStream(FileOutputStream(part_path), 1 << 16))
+        try:
+            for i in indices:
+                # a Roi that is not kept in the cache of the PolygonStore: saving does not evict the painted ROIs
+                roi = snapshot.roi_array.create_roi(i)
+                if roi is not None:
+                    self._write_zip_entry(zip_out, snapshot.index_to_name[i] + ".roi", RoiEncoder.saveAsByteArray(roi))
+            self._write_zip_entry(zip_out, "tags.json", String(json_data).getBytes("UTF-8"))
+        finally:
+            zip_out.close()
+        self._move_into_place(part_path, path)
+        rm.reference_zip = path
+
+    @staticmethod
+    def _move_into_place(part_path, path):
+        """Replaces path by the completely written part_path, atomically where the file system supports it."""
+        source, target = Paths.get(part_path), Paths.get(path)
+        try:
+            Files.move(source, target, StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE)
+        except AtomicMoveNotSupportedException:
+            Files.move(source, target, StandardCopyOption.REPLACE_EXISTING)
+
+    @staticmethod
+    def _geometry_fingerprint(snapshot, indices):
+        """64 bit FNV-1a style hash of the names and outlines of the ROIs at indices, as a hex string."""
+        h = len(indices)
+        for i in indices:
+            for value in (hash(snapshot.index_to_name[i]), snapshot.roi_array.outline_hash(i)):
+                h = ((h ^ (value & 0xFFFFFFFF)) * _FNV_PRIME) & _MASK_64
+        return "%016x" % h
+
+    def _save_tags_only(self, source, path, fingerprint, json_data):
+        """
+        Incremental save into path. Only possible when the zip source holds the outlines of fingerprint and
+        tags.json is its last entry: the bytes before tags.json (the .roi entries) are copied as they are,
+        without decoding or recompressing, followed by the new tags.json and the central directory.
+        The zip is written next to path and then moved over it (source can be path itself).
+        Returns False when the zip has to be written completely.
+        """
+        if not os.path.isfile(source):
+            return False
+        try:
+            with zipfile.ZipFile(source) as old_zip:
+                infos = old_zip.infolist()
+                if not infos or infos[-1].filename != "tags.json":
+                    return False
+                if json.loads(old_zip.read("tags.json")).get(_FINGERPRINT_KEY) != fingerprint:
+                    return False
+        except (zipfile.BadZipfile, ValueError, IOError):
+            return False
+
+        part_path = path + ".part"
+        with open(source, 'rb') as src:
+            with open(part_path, 'wb') as dst:
+                remaining = infos[-1].header_offset
+                while remaining > 0:
+                    data = src.read(min(remaining, 1 << 20))
+                    if not data:
+                        raise IOError("RoiIo: " + source + " is shorter than its central directory says")
+                    dst.write(data)
+                    remaining -= len(data)
+                new_zip = zipfile.ZipFile(dst, 'w', zipfile.ZIP_DEFLATED)
+                for info in infos[:-1]:  # same offsets: the entries are at the same place in the copy
+                    new_zip.filelist.append(info)
+                    new_zip.NameToInfo[info.filename] = info
+                new_zip.writestr("tags.json", json_data)
+                new_zip.close()
+        self._move_into_place(part_path, path)
+        return True
+
+    @staticmethod
+    def _write_zip_entry(zip_out, name, data):
+        zip_out.putNextEntry(ZipEntry(name))
+        zip_out.write(data, 0, len(data))
+        zip_out.closeEntry()
 
     def _is_valid_roi_name(self,name):
         return (
@@ -98,18 +183,96 @@ class RoiIo(object):
     def _all_L_names(self,entry_list):
         return all(self._is_valid_roi_name(n) for n in entry_list)
         
-    def _extract_rois(self,zip_file, roi_entries):
-        for entry in roi_entries:
-            zip_file.extract(entry, self._temp_dir)
-        roi_paths = [os.path.join(self._temp_dir, entry) for entry in roi_entries]
-        self._clean_up_list.extend(roi_paths)
-        return roi_paths       
+    @staticmethod
+    def _read_entry(zip_file, entry):
+        """Bytes of the zip entry named entry, read into memory."""
+        zip_entry = zip_file.getEntry(entry)
+        data = zeros(zip_entry.getSize(), 'b')
+        stream = DataInputStream(zip_file.getInputStream(zip_entry))
+        try:
+            stream.readFully(data)
+        finally:
+            stream.close()
+        return data
+
+    @staticmethod
+    def _decode_roi(data, entry):
+        """
+        The ROI encoded in data (the bytes of zip entry entry), named after the entry if the ROI has no name.
+        An integer PolygonRoi is used as decoded, a sub-pixel one gets an integer outline.
+        """
+        roi = RoiDecoder.openFromByteArray(data)
+        if roi is None:
+            raise IOError("RoiIo: could not decode " + entry)
+        if type(roi) is PolygonRoi and roi.subPixelResolution():
+            decoded = roi
+            roi = PolygonRoi(decoded.getPolygon(), decoded.getType())
+            roi.setName(decoded.getName())
+            roi.setPosition(decoded.getPosition())
+        if not roi.getName():
+            roi.setName(os.path.splitext(entry)[0])
+        return roi
+
+    def _decode_entries(self, zip_file, roi_entries, make_row, add_rows=None):
+        """
+        Decodes roi_entries (dense indices 1..N) and adds the ROIs to the manager, returns when all are added.
+        Producer/consumer on a bounded pool: 1 reader reads the entry bytes from zip_file (sequential reads of
+        1 handle) into a bounded queue, the decoder threads decode them, make_row(idx, entry, roi) returns
+        ((name, idx, roi, state, tags), label position or None), and add their rows per load_zip_batch_size ROIs.
+        add_rows(rows, label_positions) replaces the manager's add_many, e.g. to collect the rows first.
+        """
+        batch_size = self._gvars["load_zip_batch_size"]
+        available_threads = self._gvars.get("max_threads") or Runtime.getRuntime().availableProcessors()
+        num_threads = max(1, min(available_threads, (len(roi_entries) + batch_size - 1) // batch_size))
+        queue = ArrayBlockingQueue(num_threads * batch_size)  # bounds the bytes read ahead of the decoders
+        add_rows = add_rows or self._rm.add_many
+
+        class EntryReader(Callable):
+            def call(inner_self):
+                try:
+                    for idx, entry in enumerate(roi_entries, 1):
+                        queue.put((idx, entry, self._read_entry(zip_file, entry)))
+                finally:
+                    for _ in range(num_threads):
+                        queue.put(_END_OF_ENTRIES)
+
+        class EntryDecoder(Callable):
+            def call(inner_self):
+                # the ROIs are added per batch: 1 critical section per batch
+                rows, label_positions = [], []
+                idx, entry, data = queue.take()
+                try:
+                    while data is not None:
+                        row, label_position = make_row(idx, entry, self._decode_roi(data, entry))
+                        rows.append(row)
+                        label_positions.append(label_position)
+                        if len(rows) >= batch_size:
+                            add_rows(rows, label_positions)
+                            rows, label_positions = [], []
+                        idx, entry, data = queue.take()
+                except:
+                    while data is not None:  # keep the reader going until it has queued the end
+                        idx, entry, data = queue.take()
+                    raise
+                if rows:
+                    add_rows(rows, label_positions)
+                return None
+
+        pool = Executors.newFixedThreadPool(num_threads + 1)
+        try:
+            futures = [pool.submit(EntryReader())] + [pool.submit(EntryDecoder()) for _ in range(num_threads)]
+            for future in futures:
+                future.get()
+        finally:
+            pool.shutdown()
+        IJ.log("Reading ROIs | #ROIs: " + str(len(roi_entries)) + " | #decoder threads: " + str(num_threads))
 
     def load_from_zip(self,path,imp_lbl):
         self._imp_lbl=imp_lbl
 
-        with zipfile.ZipFile(path, 'r') as zip_file:
-            entries = zip_file.namelist()
+        zip_file = ZipFile(path)
+        try:
+            entries = [e.getName() for e in Collections.list(zip_file.entries())]
             roi_entries = [e for e in entries if e.endswith(".roi")]
 
             if "tags.json" in entries:
@@ -118,46 +281,40 @@ class RoiIo(object):
                 self._load_zip_with_L_names(zip_file, roi_entries)
             else:
                 self._load_zip_without_tags(zip_file, roi_entries)
-
-        self._delete_later()
+        finally:
+            zip_file.close()
+        self._rm.reference_zip = path
+
+        # ROIs are stored at dense indices 1..N, the names keep the label ids (which can have gaps)
+        if self._rm.name_to_index:
+            keys = [self._rm.parse_roi_name(name) for name in self._rm.name_to_index]
+            label_ids = [label_id for _, label_id in keys if label_id is not None]
+            slices = [slice_idx for slice_idx, _ in keys if slice_idx is not None]
+            self._rm.set_range_stop(max(self._rm.name_to_index.values()),
+                                    max_label=max(label_ids) if label_ids else None,
+                                    num_slices=max(slices) if slices else 1)
         #self._rm.range_stop += 1
 
     def _load_zip_with_tags(self,zip_file, roi_entries):
         StopWatch().start("Reading ROIs: tags and state detected")
         print "Reading ROIs: tags and state detected"
-        tags_path = os.path.join(self._temp_dir, "tags.json")
-
-        with open(tags_path, 'wb') as f:
-            f.write(zip_file.read("tags.json"))
-        with open(tags_path, 'r') as f:
-            tag_json = json.load(f)
+        tag_json = json.loads(String(self._read_entry(zip_file, "tags.json"), "UTF-8").toString())
 
-        self._clean_up_list.append(tags_path)
-
-        roi_paths = self._extract_rois(zip_file, roi_entries)
-        if not (roi_paths and roi_entries):
+        if not roi_entries:
             print "Reading ROIs: no data in ROI file"
             return
-        self._rm.reset(num_of_rois=len(roi_paths))
-
-        for entry, roi_path in zip(roi_entries, roi_paths):
-            roi0 = RoiDecoder(roi_path).getRoi()
-            roi_name = roi0.getName() or os.path.splitext(entry)[0]
-            idx = int(roi_name[1:])
-           
-            p0 = roi0.getPolygon()
-            p = Polygon(p0.xpoints, p0.ypoints, p0.npoints)
-            roi = PolygonRoi(p, roi0.getType())
-            roi.setName(roi_name)
+        self._rm.reset(num_of_rois=len(roi_entries))
 
+        def make_row(idx, entry, roi):
+            roi_name = roi.getName()  # the decoded ROI keeps the slice of a label stack
             if roi_name in tag_json:
                 state = self._rm.str_to_state(tag_json[roi_name][0])
                 tags = set(tag_json[roi_name][1:])
             else:
                 state = self._rm.ROI_STATE_ACTIVE
                 tags = set()
-            self._rm.add_1_tuple(name_idx_roi_state_tag=(roi_name,idx,roi,state,tags))
-      
+            return (roi_name,idx,roi,state,tags), None
+        self._decode_entries(zip_file, roi_entries, make_row)
 
         StopWatch().stop("Reading ROIs") 
 
@@ -165,35 +322,16 @@ class RoiIo(object):
         StopWatch().start()
         print "Reading ROIs: all roi files have a name Lxxxx.roi, there were no tags or states detected"
         
-        roi_paths = self._extract_rois(zip_file, roi_entries)
-        if not (roi_entries and roi_paths):
+        if not roi_entries:
             print "Reading ROIs: no data in ROI file"
             return
         num_of_rois=len(roi_entries)
         self._rm.reset(num_of_rois)
 
-        max_digits=len(str(num_of_rois))
-        dummy = TextRoi(0, 0, "L" + str(9).zfill(max_digits))
-        b=dummy.getBounds()
-        shift_y =  - b.height // 2
-        dummy = None
+        def make_row(roi_idx, entry, roi):
+            return (roi.getName(),roi_idx,roi,self._rm.ROI_STATE_ACTIVE,set()), None
+        self._decode_entries(zip_file, roi_entries, make_row)
 
-
-        for entry, roi_path in zip(roi_entries, roi_paths):
-            roi0 = RoiDecoder(roi_path).getRoi()
-            roi_name = roi0.getName() or os.path.splitext(entry)[0]
-            roi_idx = int(roi_name[1:])
-
-            p0 = roi0.getPolygon()
-            p = Polygon(p0.xpoints, p0.ypoints, p0.npoints)
-            roi = PolygonRoi(p, roi0.getType())
-            roi.setName(roi_name)
-
-            state = self._rm.ROI_STATE_ACTIVE
-            tags = set()
-
-            self._rm.add_1_tuple(name_idx_roi_state_tag=(roi_name,roi_idx,roi,state,tags))
-        
         
         StopWatch().stop("Reading ROIs")
 
@@ -209,8 +347,14 @@ class RoiIo(object):
         StopWatch().start()
         print "Reading ROIs: ROI files have no names like Lxxxx.roi"
         
-        ip = self._imp_lbl.getProcessor()
-        pixels = ip.getPixels()
+        if hasattr(self._imp_lbl, "label_at"):
+            # streamed label image (TiffLabelReader), not in memory
+            label_at = self._imp_lbl.label_at
+        else:
+            ip = self._imp_lbl.getProcessor()
+            pixels = ip.getPixels()
+            normalize = label_normalizer(ip)
+            label_at = lambda x, y: normalize(pixels[y * width + x])
         width = self._imp_lbl.getWidth()
         height = self._imp_lbl.getHeight()
         edge_h = width - 1
@@ -220,61 +364,64 @@ class RoiIo(object):
         
         max_digits = len(str(num_of_rois))
 
-        dummy = TextRoi(0, 0, "L" + str(9).zfill(max_digits))
-        b = dummy.getBounds()
-        shift_y = -b.height // 2
-
-        load_zip_batch_size = self._gvars["load_zip_batch_size"]
-        batches = [roi_entries[i:i + load_zip_batch_size] for i in range(0, num_of_rois, load_zip_batch_size)]
-
-        threads = []
-        
         remove_edges=self._gvars['remove_edges']
         remove_small=self._gvars['remove_small']
         size_threshold=self._gvars['size_threshold']
-        
-        for batch in batches:
-            def make_task(entries=batch):
-                class BatchTask(Runnable):
-                    def run(inner_self):
-                    
-                        for entry in entries:
-                            zip_file.extract(entry, self._temp_dir)
-                        roi_paths = [os.path.join(self._temp_dir, entry) for entry in entries]
-                        self._clean_up_list.extend(roi_paths)
-                        #roi_paths = _extract_rois(zip_file, entries)
-
-                        for entry, roi_path in zip(entries, roi_paths):
-                            roi0 = RoiDecoder(roi_path).getRoi()
-                            p0 = roi0.getPolygon()
-                            p = Polygon(p0.xpoints, p0.ypoints, p0.npoints)
-                            roi = PolygonRoi(p, roi0.getType())
-                            stats = roi.getStatistics()
-                            x = int(stats.xCentroid)
-                            y = int(stats.yCentroid)
-                            pixel_idx = y * width + x
-                            idx = pixels[pixel_idx]
-                            roi_name = "L" + str(idx).zfill(max_digits)
-                            roi.setName(roi_name)
-
-                            if remove_small and stats.area < size_threshold:
-                                state= self._rm.ROI_STATE_DELETED
-                                tags={"small"}
-                            elif remove_edges and is_image_edge(roi,edge_h,edge_v):
-                                state= self._rm.ROI_STATE_DELETED
-                                tags={"edge.image"}
-                            else:
-                                state = self._rm.ROI_STATE_ACTIVE
-                                tags = set()
-                            self._rm.add_1_tuple(name_idx_roi_state_tag=(roi_name,idx,roi,state,tags))
-
-                return BatchTask()
-
-            t = Thread(make_task())
-            threads.append(t)
-            t.start()
-
-        for t in threads:
-            t.join()
+
+        # an ROI is named after the label under its centroid, unless that name is already taken (2 ROIs of 1 label,
+        # or a concave ROI whose centroid lies on another label) or it is background: then after its zip entry.
+        # The decoder threads only collect the label ids, the names are given in entry order once all are decoded:
+        # which ROI keeps the label name does not depend on the timing of the threads
+        decoded_lock = threading.Lock()
+        decoded = []
+
+        def collect(rows, label_positions):
+            with decoded_lock:
+                decoded.extend(zip(rows, label_positions))
+
+        def make_row(idx, entry, roi):
+            stats = roi.getStatistics()
+            x = int(stats.xCentroid)
+            y = int(stats.yCentroid)
+            label_id = label_at(x, y)
+
+            if remove_small and stats.area < size_threshold:
+                state= self._rm.ROI_STATE_DELETED
+                tags={"small"}
+            elif remove_edges and is_image_edge(roi,edge_h,edge_v):
+                state= self._rm.ROI_STATE_DELETED
+                tags={"edge.image"}
+            else:
+                state = self._rm.ROI_STATE_ACTIVE
+                tags = set()
+            return (label_id,idx,roi,state,tags), (stats.xCentroid, stats.yCentroid)
+        self._decode_entries(zip_file, roi_entries, make_row, add_rows=collect)
+
+        decoded.sort(key=lambda row_and_position: row_and_position[0][1])
+        taken_names = set()
+        renamed = []
+        batch_size = self._gvars["load_zip_batch_size"]
+        rows, label_positions = [], []
+        for (label_id, idx, roi, state, tags), label_position in decoded:
+            roi_name = "L" + str(label_id).zfill(max_digits)
+            if label_id == 0 or roi_name in taken_names:
+                renamed.append(roi_name)
+                roi_name = base_name = roi_entries[idx - 1][:-len(".roi")]
+                suffix = idx
+                while roi_name in taken_names:
+                    roi_name = base_name + "_" + str(suffix)
+                    suffix += 1
+            taken_names.add(roi_name)
+            roi.setName(roi_name)
+            rows.append((roi_name,idx,roi,state,tags))
+            label_positions.append(label_position)
+            if len(rows) >= batch_size:
+                self._rm.add_many(rows, label_positions)
+                rows, label_positions = [], []
+        if rows:
+            self._rm.add_many(rows, label_positions)
+        if renamed:
+            IJ.log("Reading ROIs: " + str(len(renamed)) + " ROIs named after their zip entry, the label under their centroid " +
+                   "was background or already used (e.g. " + renamed[0] + ")")
         #self._rm.range_stop += 1
         StopWatch().stop("Reading ROIs")
@@ -1,4 +1,11 @@
 """
+RoiMeasurements.py
+
+Measurements of the ROIs and their statistics, for all ROIs and per subset (ACTIVE, DELETED).
+The ACTIVE and DELETED subsets follow the state changes of the TinyRoiManager: the measurements listen
+to its change events and only move the changed ROIs between the subsets. Per subset and measurement the
+values are kept sorted with their sums, so the statistics (incl. median, quartiles, MAD and outliers)
+of a subset are updated without going over all ROIs again.
 
 Author: Bart Vanderbeke & Elisa
 Copyright: © 2025
@@ -10,6 +17,7 @@ Parts of the code in this project have been derived from chatGPT suggestions.
 import math
 import os
 import threading
+import bisect
 from ij import IJ
 
 from javax.swing import JTable, JScrollPane, JFrame
@@ -20,6 +28,8 @@ from format import format_number
 from RoiHistogram import RoiHistogram
 from HistogramPlotFrame import HistogramPlotFrame
 from TinyRoiManager import TinyRoiManager as RoiManager
+from MeasurementStore import AREA, FERET, FERET_Y
+from MedianStats import sorted_median, first_index, median_distance
 
 
 import time
@@ -29,6 +39,10 @@ def get_timestamp_string():
     """Return current time as a string in yyyymmddHHMMSS format."""
     return time.strftime("%Y%m%d%H%M%S")
 
+# subsets that follow the state of the ROIs (selected ROIs are in neither)
+_STATE_SUBSETS = [(RoiManager.ROI_STATE_ACTIVE, "ACTIVE"), (RoiManager.ROI_STATE_DELETED, "DELETED")]
+_SUBSET_OF_STATE = dict(_STATE_SUBSETS)
+
 class RoiMeasurements:
     """
     Class to compute and store multiple measurements (e.g., Area, Feret, FeretAngle, etc.)
@@ -40,7 +54,8 @@ class RoiMeasurements:
     - Computes mean and standard deviation per measurement across all ROIs in a single pass
     """
     
-    def __init__(self,gvars):
+    def __init__(self,gvars,rm=None):
+        """rm: the TinyRoiManager to measure, default the shared instance (batch mode passes a detached manager)"""
 
 
         self.measurement_names=["Area","Feret", "FeretAngle", "MinFeret", "FeretX", "FeretY"]
@@ -53,11 +68,21 @@ class RoiMeasurements:
         self.RecalculateWorker =None
         self.outliers= {}
         self.gvars=gvars
+        previous = gvars.get("Measurements")
+        if previous is not None and previous is not self:
+            previous.detach()  # replaced: no longer follows the changes of the ROIs
         self.gvars["Measurements"]=self
+        self.rm = rm
+        self._subset_entries = {}  # [subset_name][msmt_name] --> sorted [(value, roi name)]
+        self._subset_sums = {}     # [subset_name][msmt_name] --> [sum of values, sum of squares]
+        self._changes_lock = threading.Lock()
+        # held while the subsets and the histogram bins are changed: 1 recalculation at a time
+        self.update_lock = threading.Lock()
+        self._pending_changes = None  # dense index -> state before the change since the subsets were computed, None: compute from scratch
 
     def compute_measurements_all(self):
 
-        rm = RoiManager.getInstance2()
+        rm = RoiManager.getInstance2() if self.rm is None else self.rm
         self.roi_subset["ALL"] = []
 
         self.Initialized = False
@@ -85,13 +110,25 @@ class RoiMeasurements:
 
         raw_values = {msmt_name: [] for msmt_name in self.measurement_names}
 
-        for N, (roi_name, roi, state, tags) in enumerate(rm.iter_all()):
+        # ROIs traced by the detector threads have been measured there already
+        # only the ROIs without a stored measurement get a Roi, 1 that is not kept by the PolygonStore
+        num_measured_here = 0
+        snapshot = rm.snapshot()
+        for N, (idx, roi_name, state, tags) in enumerate(snapshot.entries(*rm.ALL_STATES)):
             msmt = {}
             squared = {}
 
+            stored = rm.measurement(roi_name)
+            if stored is None:
+                roi = snapshot.roi_array.create_roi(idx)
+                val = roi.getStatistics().area
+                feret_values = roi.getFeretValues()
+                num_measured_here += 1
+            else:
+                val = stored[AREA]
+                feret_values = stored[FERET:FERET_Y + 1]
+
             msmt_name = "Area"
-            roi_stats = roi.getStatistics()
-            val = roi_stats.area
             msmt[msmt_name] = val
             val2 = val * val
             squared["Area"] = val2
@@ -103,7 +140,6 @@ class RoiMeasurements:
             _stat["Max"] = _stat["Max"] if _stat["Max"] >= val else val
             raw_values[msmt_name].append(val)
 
-            feret_values = roi.getFeretValues()
             msmt_names = self.measurement_names_wo_area
             for i, msmt_name in enumerate(msmt_names):
                 val = feret_values[i]
@@ -122,6 +158,7 @@ class RoiMeasurements:
             self.roi_subset["ALL"].append(roi_name)
 
         N = N + 1 if N >= 0 else 1
+        IJ.log("Measurements | #ROIs measured by the detector threads: " + str(len(self.roi_subset["ALL"]) - num_measured_here) + " | measured now: " + str(num_measured_here))
         N_minus_1 = N - 1 if N > 1 else 1
 
         for msmt_name in self.measurement_names:
@@ -164,22 +201,50 @@ class RoiMeasurements:
             IJ.log("RoiMeasurements: Measurements not initialised")
             return
 
-        if roi_subset_names:
-            self.subset_stats[subset_name] = {
-                msmt_name: {
-                    "N": 0,
-                    "Average": 0.0,
-                    "Stdev": 0.0,
-                    "Min": float('inf'),
-                    "Max": float('-inf'),
-                    "Median": 0.0,
-                    "Q1": 0.0,
-                    "Q3": 0.0,
-                    "MAD": 0.0,
-                    "num_outliers": 0
-                } for msmt_name in self.measurement_names
-            }
-        else:
+        self.roi_subset[subset_name] = set()
+        self._subset_entries[subset_name] = {msmt_name: [] for msmt_name in self.measurement_names}
+        self._subset_sums[subset_name] = {msmt_name: [0.0, 0.0] for msmt_name in self.measurement_names}
+        for roi_name in roi_subset_names:
+            if roi_name not in self.measurements:
+                IJ.log("Subset computation failed on ROI: " + roi_name)
+                raise KeyError
+            self._add_to_subset(subset_name, roi_name, keep_sorted=False)
+        for entries in self._subset_entries[subset_name].values():
+            entries.sort()
+        self._finish_subset_stats(subset_name)
+
+    def _add_to_subset(self, subset_name, roi_name, keep_sorted=True):
+        if roi_name in self.roi_subset[subset_name]:
+            return
+        self.roi_subset[subset_name].add(roi_name)
+        for msmt_name in self.measurement_names:
+            val = self.measurements[roi_name][msmt_name]
+            sums = self._subset_sums[subset_name][msmt_name]
+            sums[0] += val
+            sums[1] += self.squared_measurements[roi_name][msmt_name]
+            entries = self._subset_entries[subset_name][msmt_name]
+            if keep_sorted:
+                bisect.insort(entries, (val, roi_name))
+            else:
+                entries.append((val, roi_name))
+
+    def _remove_from_subset(self, subset_name, roi_name):
+        if roi_name not in self.roi_subset[subset_name]:
+            return
+        self.roi_subset[subset_name].discard(roi_name)
+        for msmt_name in self.measurement_names:
+            val = self.measurements[roi_name][msmt_name]
+            sums = self._subset_sums[subset_name][msmt_name]
+            sums[0] -= val
+            sums[1] -= self.squared_measurements[roi_name][msmt_name]
+            entries = self._subset_entries[subset_name][msmt_name]
+            del entries[bisect.bisect_left(entries, (val, roi_name))]
+
+    def _finish_subset_stats(self, subset_name):
+        """Statistics and outliers of a subset from its sorted values and sums."""
+        N = len(self.roi_subset[subset_name])
+        self.outliers[subset_name] = {msmt_name: [] for msmt_name in self.measurement_names}
+        if not N:
             self.subset_stats[subset_name] = {
                 msmt_name: {
                     "N": 0,
@@ -193,99 +258,106 @@ class RoiMeasurements:
                     "num_outliers": 0
                 } for msmt_name in self.measurement_names
             }
-            self.roi_subset[subset_name] = []
             return
 
-        self.roi_subset[subset_name] = roi_subset_names
-
-        # Verzamel ruwe waarden voor robuuste statistiek
-        if not hasattr(self, "_subset_raw_values"):
-            self._subset_raw_values = {}
-        self._subset_raw_values[subset_name] = {
-            msmt_name: [] for msmt_name in self.measurement_names
-        }
-
-        for roi_name in self.roi_subset[subset_name]:
-            stat = self.subset_stats[subset_name]
-            if roi_name in self.measurements:
-                measurements = self.measurements[roi_name]
-            else:
-                IJ.log("Subset computation failed on ROI: " + roi_name)
-                raise KeyError
-
-            squared_measurements = self.squared_measurements[roi_name]
-
-            for msmt_name in self.measurement_names:
-                val = measurements[msmt_name]
-                val2 = squared_measurements[msmt_name]
-                _stat = stat[msmt_name]
-                _stat["Average"] += val
-                _stat["Stdev"] += val2
-                _stat["Min"] = _stat["Min"] if _stat["Min"] <= val else val
-                _stat["Max"] = _stat["Max"] if _stat["Max"] >= val else val
-                self._subset_raw_values[subset_name][msmt_name].append(val)
-
-        l = len(self.roi_subset[subset_name])
-        N = l if l > 0 else 1
         N_minus_1 = N - 1 if N > 1 else 1
-
-        # Turn the sums (of squares) into actual stats
+        stat = {}
         for msmt_name in self.measurement_names:
-            stat = self.subset_stats[subset_name]
-            _stat = stat[msmt_name]
-
-            sum_x = _stat["Average"]
-            sum_x2 = _stat["Stdev"]
+            entries = self._subset_entries[subset_name][msmt_name]
+            sum_x, sum_x2 = self._subset_sums[subset_name][msmt_name]
             mean = sum_x / N
-
-            variance = (sum_x2 - (sum_x * sum_x / N)) / N_minus_1
-            _stat["Average"] = mean
-            _stat["Stdev"] = math.sqrt(variance)
-            _stat["N"] = N
+            # the sums are updated incrementally: rounding can make a zero variance slightly negative
+            variance = max(0.0, (sum_x2 - (sum_x * sum_x / N)) / N_minus_1)
 
             # Robust statistics (median, Q1, Q3, MAD)
-            values = self._subset_raw_values[subset_name][msmt_name]
-            if values:
-                sorted_values = sorted(values)
-                def median(lst, start, end):
-                    count = end - start
-                    mid = start + count // 2
-                    if count % 2 == 1:
-                        return lst[mid]
-                    else:
-                        return 0.5 * (lst[mid - 1] + lst[mid])
-
-                med = median(sorted_values, 0, N)
-                q1 = median(sorted_values, 0, N // 2)
-                q3 = median(sorted_values, (N + 1) // 2, N)
-                mad = median(sorted([abs(x - med) for x in sorted_values]), 0, N)
-
-                _stat["Median"] = med
-                _stat["Q1"] = q1
-                _stat["Q3"] = q3
-                _stat["MAD"] = mad
-
-        #subset_name = "ACTIVE"
-        self.outliers[subset_name]= {}
-        stat = self.subset_stats[subset_name]
-        for msmt_name in self.measurement_names:
-            _stat = stat[msmt_name]
-            iqr = _stat["Q3"]- _stat["Q1"]
-            median = _stat["Median"]
-            upper_limit = median + 1.5 * iqr
-            lower_limit = median - 1.5 * iqr
-            rois_in_subset =  self.roi_subset[subset_name]
-            self.outliers[subset_name][msmt_name]=[]
-            for roi_name in rois_in_subset:
-                val = self.measurements[roi_name][msmt_name]
-                if val < lower_limit or val > upper_limit:
-                    self.outliers[subset_name][msmt_name].append(roi_name)
-            _stat["num_outliers"]=len(self.outliers[subset_name][msmt_name])
+            # https://en.wikipedia.org/wiki/Median_absolute_deviation
+            med = sorted_median(entries, 0, N)
+            q1 = sorted_median(entries, 0, N // 2)
+            q3 = sorted_median(entries, (N + 1) // 2, N)
+            mad = median_distance(entries, med)
+
+            # outliers: further than 1.5 * IQR from the median, at both ends of the sorted values
+            iqr = q3 - q1
+            lower = first_index(entries, med - 1.5 * iqr)
+            upper = first_index(entries, med + 1.5 * iqr, strict=True)
+            outliers = [roi_name for _, roi_name in entries[:lower]] + [roi_name for _, roi_name in entries[upper:]]
+            self.outliers[subset_name][msmt_name] = outliers
+
+            stat[msmt_name] = {
+                "N": N,
+                "Average": mean,
+                "Stdev": math.sqrt(variance),
+                "Min": entries[0][0],
+                "Max": entries[-1][0],
+                "Median": med,
+                "Q1": q1,
+                "Q3": q3,
+                "MAD": mad,
+                "num_outliers": len(outliers)
+            }
+        self.subset_stats[subset_name] = stat
+
+    def compute_state_subsets(self):
+        """The ACTIVE and DELETED subsets from scratch, from the current states of the ROIs."""
+        rm = RoiManager.getInstance2() if self.rm is None else self.rm
+        with self._changes_lock:
+            self._pending_changes = {}  # the changes from now on are applied by update_state_subsets
+        rm.add_change_listener(self._on_rois_changed)
+        for state, subset_name in _STATE_SUBSETS:
+            roi_subset = [name for (_, name, _, _) in rm.snapshot().entries(state)]
+            self.compute_measurements_subset(subset_name, roi_subset)
+
+    def detach(self):
+        """Stops listening to the changes of the ROIs, compute_state_subsets listens again."""
+        rm = RoiManager.getInstance2() if self.rm is None else self.rm
+        if rm is not None:
+            rm.remove_change_listener(self._on_rois_changed)
+
+    def _on_rois_changed(self, event):
+        """Change listener of the TinyRoiManager: remembers the state before the change of every changed ROI."""
+        with self._changes_lock:
+            if event.reset:
+                self._pending_changes = None  # other ROIs: compute everything again
+                self.detach()  # until then the changes are not needed
+            elif self._pending_changes is not None:
+                for idx, old_state in event.changes.items():
+                    self._pending_changes.setdefault(idx, old_state)
+
+    def update_state_subsets(self):
+        """
+        Moves the ROIs whose state changed since the last update between the ACTIVE and DELETED subsets.
+        Returns the moves [(roi name, old subset, new subset)], subset None for a selected ROI.
+        Returns None when the subsets had to be computed from scratch.
+        """
+        rm = RoiManager.getInstance2() if self.rm is None else self.rm
+        with self._changes_lock:
+            changes = self._pending_changes
+            self._pending_changes = {} if changes is not None else None
+        if changes is None or not all(subset_name in self._subset_entries for _, subset_name in _STATE_SUBSETS):
+            self.compute_state_subsets()
+            return None
+
+        moves = []
+        for idx, old_state in changes.items():
+            roi_name = rm.index_to_name[idx]
+            if roi_name not in self.measurements:
+                continue
+            old_subset = _SUBSET_OF_STATE.get(old_state)
+            new_subset = _SUBSET_OF_STATE.get(rm.states[idx])
+            if old_subset == new_subset:
+                continue
+            if old_subset:
+                self._remove_from_subset(old_subset, roi_name)
+            if new_subset:
+                self._add_to_subset(new_subset, roi_name)
+            moves.append((roi_name, old_subset, new_subset))
+        for subset_name in set(subset for _, old, new in moves for subset in (old, new) if subset):
+            self._finish_subset_stats(subset_name)
+        return moves
 
-        
-        
     def save_all(self, full_path):
-        rm = RoiManager.getInstance2()
+        """Writes the measurements to Msmts/<timestamp>_<image name>.csv next to full_path, returns the csv path."""
+        rm = RoiManager.getInstance2() if self.rm is None else self.rm
         all_but_ext, _ = os.path.splitext(full_path)
         now=get_timestamp_string()
         msmts_folder = os.path.dirname(all_but_ext)+"/Msmts/"
@@ -304,6 +376,7 @@ class RoiMeasurements:
                 row = [roi_name] + [format_number(self.measurements[roi_name][name]) for name in self.measurement_names] + [roi_state_str]+ [roi_tag_str]
                 f.write(';'.join(row) + '\n')
         IJ.log("Measurements written to : "+full_name)
+        return full_name
 
     def save_subset(self, subset_name, full_path):
 
@@ -356,15 +429,9 @@ class ComputeAllWorker(SwingWorker):
     
     def doInBackground(self, continuation=None):
         StopWatch().start("")
-        self.msmts.compute_measurements_all()
-        rm = RoiManager.getInstance2()
-
-        roi_subset=[name for (name, roi, state, tags) in rm.iter_by_state(RoiManager.ROI_STATE_ACTIVE)]
-        self.msmts.compute_measurements_subset("ACTIVE", roi_subset)
-
-        roi_subset=[name for (name, roi, state, tags) in rm.iter_by_state(RoiManager.ROI_STATE_DELETED)]
-
-        self.msmts.compute_measurements_subset("DELETED", roi_subset)
+        with self.msmts.update_lock:
+            self.msmts.compute_measurements_all()
+            self.msmts.compute_state_subsets()
 
     def done(self):
         StopWatch().stop("Computing measurements")
@@ -389,7 +456,8 @@ class ComputeHistAllWorker(SwingWorker):
     
     def doInBackground(self):
         StopWatch().start("")
-        self.hist_data.compute()
+        with self.msmts.update_lock:
+            self.hist_data.compute()
 
     def done(self):
         StopWatch().stop("Computing histogram")
@@ -427,17 +495,18 @@ class RecalculateWorker():
             self.hist_data = hist_data
 
         def doInBackground(self):
-            rm = RoiManager.getInstance2()
             StopWatch().start()
             self.start_time = datetime.datetime.now()
 
-            roi_subset = [name for (name, roi, state, tags) in rm.iter_by_state(RoiManager.ROI_STATE_ACTIVE)]
-            self.msmts.compute_measurements_subset("ACTIVE", roi_subset)
-            
-            roi_subset = [name for (name, roi, state, tags) in rm.iter_by_state(RoiManager.ROI_STATE_DELETED)]
-            self.msmts.compute_measurements_subset("DELETED", roi_subset)
-
-            self.hist_data.compute()
+            # only the ROIs whose state changed since the last time are moved between the subsets and bins
+            # each data_have_changed starts a worker: the lock keeps 2 of them from changing the sorted lists at once
+            with self.msmts.update_lock:
+                moves = self.msmts.update_state_subsets()
+                if moves is None or not self.hist_data.bins:
+                    self.hist_data.compute()
+                else:
+                    self.hist_data.apply_moves(moves)
+                    IJ.log("Recomputing histograms | #ROIs moved: " + str(len(moves)))
 
         def done(self):
         
@@ -0,0 +1,98 @@
+"""
+SpatialIndex.py
+
+Uniform grid over the bounding boxes of the ROIs, kept up to date by the TinyRoiManager.
+An ROI is registered in every grid cell its bounding box touches. A rectangle query only visits the
+cells that overlap the rectangle, so its cost is proportional to the number of ROIs near the rectangle,
+not to the total number of ROIs.
+- intersecting(rect): dense indices of the ROIs whose bounding box overlaps rect (e.g. viewport culling)
+- within(rect): dense indices of the ROIs whose bounding box lies completely inside rect (rectangle selection)
+- near(idx, distance): dense indices of the ROIs within distance pixels of the bounding box of ROI idx
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+class SpatialIndex(object):
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self._cells = {}   # (cell x, cell y) -> list of dense indices
+        self._bounds = {}  # dense index -> (x0, y0, x1, y1), x1 = x + width
+        self._max_x = self._max_y = 0  # a query never visits cells beyond the ROIs
+
+    def clear(self):
+        self._cells = {}
+        self._bounds = {}
+        self._max_x = self._max_y = 0
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def _cell_keys(self, x0, y0, x1, y1):
+        cell_size = self.cell_size
+        for cy in range(y0 // cell_size, y1 // cell_size + 1):
+            for cx in range(x0 // cell_size, x1 // cell_size + 1):
+                yield cx, cy
+
+    def insert(self, idx, bounds):
+        """Registers ROI idx with its bounding box bounds (java.awt.Rectangle), replaces a previous entry of idx."""
+        if idx in self._bounds:
+            self.remove(idx)
+        box = (bounds.x, bounds.y, bounds.x + bounds.width, bounds.y + bounds.height)
+        self._bounds[idx] = box
+        self._max_x = max(self._max_x, box[2])
+        self._max_y = max(self._max_y, box[3])
+        for key in self._cell_keys(*box):
+            self._cells.setdefault(key, []).append(idx)
+
+    def remove(self, idx):
+        box = self._bounds.pop(idx, None)
+        if box is None:
+            return
+        for key in self._cell_keys(*box):
+            members = self._cells.get(key)
+            if members is not None:
+                members.remove(idx)
+                if not members:
+                    del self._cells[key]
+
+    def _candidates(self, x0, y0, x1, y1):
+        candidates = set()
+        cells = self._cells
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self._max_x), min(y1, self._max_y)
+        if x1 < x0 or y1 < y0:
+            return candidates
+        for key in self._cell_keys(x0, y0, x1, y1):
+            members = cells.get(key)
+            if members:
+                candidates.update(members)
+        return candidates
+
+    def intersecting(self, rect):
+        """Sorted dense indices of the ROIs whose bounding box overlaps (or touches) rect."""
+        x0, y0 = rect.x, rect.y
+        x1, y1 = rect.x + rect.width, rect.y + rect.height
+        bounds = self._bounds
+        return sorted(idx for idx in self._candidates(x0, y0, x1, y1)
+                      if bounds[idx][0] <= x1 and bounds[idx][2] >= x0 and bounds[idx][1] <= y1 and bounds[idx][3] >= y0)
+
+    def within(self, rect):
+        """Sorted dense indices of the ROIs whose bounding box lies completely inside rect."""
+        x0, y0 = rect.x, rect.y
+        x1, y1 = rect.x + rect.width, rect.y + rect.height
+        bounds = self._bounds
+        return sorted(idx for idx in self._candidates(x0, y0, x1, y1)
+                      if bounds[idx][0] >= x0 and bounds[idx][2] <= x1 and bounds[idx][1] >= y0 and bounds[idx][3] <= y1)
+
+    def near(self, idx, distance):
+        """Sorted dense indices of the other ROIs whose bounding box lies within distance of the one of ROI idx."""
+        box = self._bounds.get(idx)
+        if box is None:
+            return []
+        x0, y0, x1, y1 = box[0] - distance, box[1] - distance, box[2] + distance, box[3] + distance
+        bounds = self._bounds
+        return sorted(other for other in self._candidates(x0, y0, x1, y1)
+                      if other != idx and bounds[other][0] <= x1 and bounds[other][2] >= x0 and
+                      bounds[other][1] <= y1 and bounds[other][3] >= y0)
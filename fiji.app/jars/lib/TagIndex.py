@@ -0,0 +1,91 @@
+"""
+TagIndex.py
+
+Interned tags of the ROIs of a TinyRoiManager.
+- every tag ("small", "edge.image", the F-key labels, ...) gets a bit number the first time it is used:
+  the tags of an ROI are 1 bitmask in a primitive long array of the manager, a constant amount of
+  memory per ROI instead of a Python set
+- reverse index: tag -> BitSet of the dense indices of the ROIs with that tag, so "all ROIs tagged fold"
+  and the number of ROIs per tag do not scan the ROIs
+- decode(mask) returns the tag names as a frozenset, 1 shared frozenset per distinct mask
+Tag numbers are never reused, a mask decodes to the same names for the lifetime of the index.
+Not thread-safe on its own: the TinyRoiManager only changes it while holding its lock.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+from java.util import BitSet
+
+MAX_TAGS = 63  # bits of a Java long without the sign bit
+
+class TagIndex(object):
+    def __init__(self):
+        self._bits = {}          # tag -> bit number
+        self._tags = []          # bit number -> tag
+        self._members = []       # bit number -> BitSet of dense indices
+        self._decoded = {0: frozenset()}  # mask -> frozenset of tag names
+
+    def __len__(self):
+        return len(self._tags)
+
+    def tags(self):
+        """All tags that have been used, in the order they were interned."""
+        return list(self._tags)
+
+    def intern(self, tag):
+        """Bit number of tag, a new one for a tag that has not been used before."""
+        bit = self._bits.get(tag)
+        if bit is None:
+            if len(self._tags) >= MAX_TAGS:
+                raise ValueError("TagIndex: more than " + str(MAX_TAGS) + " different tags, cannot add " + str(tag))
+            bit = len(self._tags)
+            self._tags.append(tag)
+            self._members.append(BitSet())
+            self._bits[tag] = bit
+        return bit
+
+    def encode(self, tags):
+        """Bitmask of the tag names tags, interning the new ones."""
+        mask = 0
+        for tag in tags:
+            mask |= 1 << self.intern(tag)
+        return mask
+
+    def decode(self, mask):
+        """frozenset of the tag names in mask."""
+        names = self._decoded.get(mask)
+        if names is None:
+            names = frozenset(self._tags[bit] for bit in range(len(self._tags)) if mask & (1 << bit))
+            self._decoded[mask] = names
+        return names
+
+    def update(self, idx, old_mask, new_mask):
+        """ROI idx had the tags of old_mask and has the ones of new_mask now."""
+        changed = old_mask ^ new_mask
+        bit = 0
+        while changed:
+            if changed & 1:
+                if new_mask & (1 << bit):
+                    self._members[bit].set(idx)
+                else:
+                    self._members[bit].clear(idx)
+            changed >>= 1
+            bit += 1
+
+    def members(self, tag):
+        """BitSet of the dense indices of the ROIs with tag (not a copy), None for a tag that is not used."""
+        bit = self._bits.get(tag)
+        return self._members[bit] if bit is not None else None
+
+    def count(self, tag, state_members=None):
+        """Number of ROIs with tag, only the ones that are also in the BitSet state_members if given."""
+        members = self.members(tag)
+        if members is None:
+            return 0
+        if state_members is None:
+            return members.cardinality()
+        others = members.clone()
+        others.andNot(state_members)
+        return members.cardinality() - others.cardinality()
@@ -0,0 +1,297 @@
+"""
+TiffLabelReader.py
+
+Reads a TIFF label image band by band (a band = a range of rows), without loading the whole image.
+- strip and tile organised TIFF files, 1 sample per pixel, 8, 16 or 32-bit (integer or float)
+- compression: none, LZW, PackBits, Deflate/Adobe Deflate, with or without horizontal predictor
+- uncompressed strips/tiles are memory mapped: only the pages of the requested rows are read
+- only the first image (IFD) of the file is read, BigTIFF is not supported
+- label_at(x, y) keeps the last decoded strip or tile per thread: looking up the labels of many
+  points (e.g. ROI centroids, in the order the ROIs were traced) decodes every block about once
+Memory use of read_band(y0, y1) is the band itself plus one decoded strip or tile.
+Thread-safe: the file is read with positional reads of 1 FileChannel, every thread has its own
+ImageJ ImageReader (LZW and PackBits decoders) and its own last decoded block.
+
+Usage:
+    reader = TiffLabelReader(path)
+    ip = reader.read_band(0, 1024)     # ImageProcessor with rows 0 ... 1023
+    reader.close()
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import os
+import threading
+
+from ij import IJ
+from java.io import RandomAccessFile
+from java.nio import ByteBuffer, ByteOrder
+from java.nio.channels import FileChannel
+from java.util.zip import Inflater
+from ij.io import FileInfo, ImageReader
+from ij.process import ByteProcessor, ShortProcessor, FloatProcessor
+
+from jarray import zeros
+
+from LabelCensus import float_label
+
+# TIFF tags used
+_IMAGE_WIDTH = 256
+_IMAGE_LENGTH = 257
+_BITS_PER_SAMPLE = 258
+_COMPRESSION = 259
+_STRIP_OFFSETS = 273
+_SAMPLES_PER_PIXEL = 277
+_ROWS_PER_STRIP = 278
+_STRIP_BYTE_COUNTS = 279
+_PREDICTOR = 317
+_TILE_WIDTH = 322
+_TILE_LENGTH = 323
+_TILE_OFFSETS = 324
+_TILE_BYTE_COUNTS = 325
+_SAMPLE_FORMAT = 339
+
+# compression schemes
+_NONE = 1
+_LZW = 5
+_DEFLATE = 8
+_PACKBITS = 32773
+_DEFLATE_ADOBE = 32946
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+def is_tiff_file(path):
+    return path.lower().endswith((".tif", ".tiff"))
+
+def open_label_image(path, gvars):
+    """
+    TiffLabelReader for a TIFF label image larger than gvars["streaming_label_bytes"],
+    otherwise the ImagePlus (None if the image cannot be opened).
+    """
+    if is_tiff_file(path) and os.path.getsize(path) > gvars.get("streaming_label_bytes", 1 << 30):
+        try:
+            reader = TiffLabelReader(path)
+            IJ.log("Label image is streamed band by band: " + path)
+            return reader
+        except IOError as e:
+            IJ.log("Cannot stream label image (" + str(e) + "), loading it")
+    return IJ.openImage(path)
+
+class TiffLabelReader(object):
+    def __init__(self, path):
+        self.path = path
+        self._file = RandomAccessFile(path, "r")
+        self._channel = self._file.getChannel()
+        self._local = threading.local()  # per thread: ImageReader, (block index, decoded block) of label_at
+        self._parse_header()
+
+    def _image_reader(self):
+        """LZW and PackBits decoders of ImageJ, 1 per thread: an ImageReader is not thread-safe."""
+        reader = getattr(self._local, "image_reader", None)
+        if reader is None:
+            reader = self._local.image_reader = ImageReader(FileInfo())
+        return reader
+
+    def close(self):
+        self._channel.close()
+        self._file.close()
+
+    # --- ImagePlus like accessors, used where the label image itself is not loaded ---
+    def getWidth(self):
+        return self.width
+
+    def getHeight(self):
+        return self.height
+
+    def getBitDepth(self):
+        return self.bits_per_sample
+
+    def getStackSize(self):
+        return 1
+
+    def label_at(self, x, y):
+        """Label id of pixel (x,y), read from the last strip or tile decoded by this thread when it holds (x,y)."""
+        block_row, block_col = y // self.block_height, x // self.block_width
+        block_idx = block_row * self.blocks_across + block_col
+        cached = getattr(self._local, "block", None)
+        if cached is not None and cached[0] == block_idx:
+            buf = cached[1]
+        else:
+            block_y = block_row * self.block_height
+            buf = self._block_bytes(block_idx, min(self.block_height, self.height - block_y))
+            self._local.block = (block_idx, buf)
+        pos = ((y - block_row * self.block_height) * self.block_width + x - block_col * self.block_width) * self.bytes_per_pixel
+        if self.bits_per_sample == 8:
+            return buf.get(pos) & 0xff
+        if self.bits_per_sample == 16:
+            return buf.getShort(pos) & 0xffff
+        if self.is_float:
+            return float_label(buf.getFloat(pos))
+        return buf.getInt(pos)
+
+    # --- header ---
+    def _read_buffer(self, offset, length):
+        buf = ByteBuffer.allocate(length)
+        while buf.hasRemaining():
+            if self._channel.read(buf, offset + buf.position()) < 0:
+                raise IOError("Unexpected end of TIFF file: " + self.path)
+        buf.flip()
+        return buf.order(self.byte_order)
+
+    def _uint32(self, buf, pos):
+        return buf.getInt(pos) & 0xffffffff
+
+    def _tag_values(self, buf, entry_pos):
+        tag_type = buf.getShort(entry_pos + 2) & 0xffff
+        count = self._uint32(buf, entry_pos + 4)
+        size = _TYPE_SIZES.get(tag_type, 1) * count
+        if size <= 4:
+            data, pos = buf, entry_pos + 8
+        else:
+            data, pos = self._read_buffer(self._uint32(buf, entry_pos + 8), size), 0
+        if tag_type == 3:
+            return [data.getShort(pos + 2 * i) & 0xffff for i in range(count)]
+        if tag_type == 4:
+            return [self._uint32(data, pos + 4 * i) for i in range(count)]
+        return [data.get(pos + i) & 0xff for i in range(count)]
+
+    def _parse_header(self):
+        self.byte_order = ByteOrder.BIG_ENDIAN
+        header = self._read_buffer(0, 8)
+        if header.getShort(0) == 0x4949:  # "II"
+            self.byte_order = ByteOrder.LITTLE_ENDIAN
+            header.order(self.byte_order)
+        magic = header.getShort(2) & 0xffff
+        if magic != 42:
+            raise IOError("Not a TIFF file or BigTIFF (not supported): " + self.path)
+        ifd_offset = self._uint32(header, 4)
+
+        num_entries = self._read_buffer(ifd_offset, 2).getShort(0) & 0xffff
+        ifd = self._read_buffer(ifd_offset + 2, 12 * num_entries)
+        tags = {}
+        for i in range(num_entries):
+            tags[ifd.getShort(12 * i) & 0xffff] = self._tag_values(ifd, 12 * i)
+
+        self.width = tags[_IMAGE_WIDTH][0]
+        self.height = tags[_IMAGE_LENGTH][0]
+        self.bits_per_sample = tags.get(_BITS_PER_SAMPLE, [1])[0]
+        self.compression = tags.get(_COMPRESSION, [_NONE])[0]
+        self.predictor = tags.get(_PREDICTOR, [1])[0]
+        self.is_float = tags.get(_SAMPLE_FORMAT, [1])[0] == 3
+        if tags.get(_SAMPLES_PER_PIXEL, [1])[0] != 1:
+            raise IOError("Label image must have 1 sample per pixel: " + self.path)
+        if self.bits_per_sample not in (8, 16, 32):
+            raise IOError("Label image must be 8, 16 or 32-bit: " + self.path)
+        if self.compression not in (_NONE, _LZW, _DEFLATE, _PACKBITS, _DEFLATE_ADOBE):
+            raise IOError("TIFF compression " + str(self.compression) + " not supported: " + self.path)
+        if self.predictor not in (1, 2):
+            raise IOError("TIFF predictor " + str(self.predictor) + " not supported: " + self.path)
+        self.bytes_per_pixel = self.bits_per_sample // 8
+
+        # strips are handled as tiles of the full image width
+        if _TILE_OFFSETS in tags:
+            self.block_width = tags[_TILE_WIDTH][0]
+            self.block_height = tags[_TILE_LENGTH][0]
+            self.block_offsets = tags[_TILE_OFFSETS]
+            self.block_byte_counts = tags[_TILE_BYTE_COUNTS]
+        else:
+            self.block_width = self.width
+            self.block_height = min(tags.get(_ROWS_PER_STRIP, [self.height])[0], self.height)
+            self.block_offsets = tags[_STRIP_OFFSETS]
+            self.block_byte_counts = tags[_STRIP_BYTE_COUNTS]
+        self.blocks_across = (self.width + self.block_width - 1) // self.block_width
+
+    # --- pixel data ---
+    def _block_bytes(self, block_idx, rows):
+        """Bytes of the first 'rows' rows of a strip or tile, as a ByteBuffer."""
+        offset = self.block_offsets[block_idx]
+        row_bytes = self.block_width * self.bytes_per_pixel
+        if self.compression == _NONE:
+            return self._channel.map(FileChannel.MapMode.READ_ONLY, offset, rows * row_bytes).order(self.byte_order)
+
+        compressed = zeros(self.block_byte_counts[block_idx], 'b')
+        self._read_buffer(offset, len(compressed)).get(compressed)
+        expected = self.block_height * row_bytes
+        if self.compression == _LZW:
+            data = self._image_reader().lzwUncompress(compressed)
+        elif self.compression == _PACKBITS:
+            data = self._image_reader().packBitsUncompress(compressed, expected)
+        else:
+            inflater = Inflater()
+            inflater.setInput(compressed)
+            data = zeros(expected, 'b')
+            inflater.inflate(data)
+            inflater.end()
+        buf = ByteBuffer.wrap(data).order(self.byte_order)
+        if self.predictor == 2:
+            self._undo_predictor(buf, min(rows, len(data) // row_bytes))
+        return buf
+
+    def _undo_predictor(self, buf, rows):
+        """Horizontal differencing: every sample is stored as the difference with its left neighbour."""
+        width = self.block_width
+        size = self.bytes_per_pixel
+        get, put = {1: (buf.get, buf.put), 2: (buf.getShort, buf.putShort), 4: (buf.getInt, buf.putInt)}[size]
+        half = 1 << (8 * size - 1)
+        mask = (1 << (8 * size)) - 1
+        for row in range(rows):
+            pos = row * width * size
+            previous = get(pos)
+            for x in range(1, width):
+                pos += size
+                # wrap around like the sample type (signed byte, short or int)
+                previous = ((get(pos) + previous + half) & mask) - half
+                put(pos, previous)
+
+    def _copy_rows(self, buf, pixels, band_y0, block_x, block_y, y0, y1):
+        """Copy the rows [y0,y1) (image coordinates) of a block into the pixels of the band starting at row band_y0."""
+        width = self.width
+        block_width = self.block_width
+        num_cols = min(block_width, width - block_x)
+        if self.bits_per_sample == 8:
+            view = buf
+        elif self.bits_per_sample == 16:
+            view = buf.asShortBuffer()
+        elif self.is_float:
+            view = buf.asFloatBuffer()
+        else:
+            view = buf.asIntBuffer()
+        for y in range(y0, y1):
+            view.position((y - block_y) * block_width)
+            view.get(pixels, (y - band_y0) * width + block_x, num_cols)
+
+    def read_band(self, y0, y1):
+        """ImageProcessor with the rows [y0, y1) of the label image."""
+        y1 = min(y1, self.height)
+        num_pixels = self.width * (y1 - y0)
+        if self.bits_per_sample == 8:
+            pixels = zeros(num_pixels, 'b')
+        elif self.bits_per_sample == 16:
+            pixels = zeros(num_pixels, 'h')
+        elif self.is_float:
+            pixels = zeros(num_pixels, 'f')
+        else:
+            pixels = zeros(num_pixels, 'i')
+
+        for block_row in range(y0 // self.block_height, (y1 - 1) // self.block_height + 1):
+            block_y = block_row * self.block_height
+            rows = min(self.block_height, y1 - block_y)
+            for block_col in range(self.blocks_across):
+                buf = self._block_bytes(block_row * self.blocks_across + block_col, rows)
+                self._copy_rows(buf, pixels, y0, block_col * self.block_width, block_y,
+                                max(y0, block_y), min(y1, block_y + self.block_height))
+        return self.make_processor(pixels, y1 - y0)
+
+    def make_processor(self, pixels, height):
+        """ImageProcessor for band pixels of this image: 8-bit, 16-bit or 32-bit (float, like ImageJ opens 32-bit labels)."""
+        if self.bits_per_sample == 8:
+            return ByteProcessor(self.width, height, pixels)
+        if self.bits_per_sample == 16:
+            return ShortProcessor(self.width, height, pixels, None)
+        return FloatProcessor(self.width, height, pixels)
+
+    def new_pixels(self, num_pixels):
+        """Empty pixel array of the type of ImageProcessor.getPixels() of a band (float for 32-bit labels)."""
+        return zeros(num_pixels, {8: 'b', 16: 'h'}.get(self.bits_per_sample, 'f'))
@@ -0,0 +1,54 @@
+"""
+TileWork.py
+
+Helpers to split a label image in 2-D tiles and to process the tiles with a fixed set of
+worker threads. The tiles are handed out through one shared atomic counter: a worker that
+finishes early simply takes the next tile, so a tile with many or large labels does not
+stall the other workers.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+from java.lang import Thread, Runtime
+from java.util.concurrent.atomic import AtomicInteger
+
+def make_tiles(width, height, tile_size):
+    """Returns the tiles as (x0, y0, x1, y1) tuples (x1, y1 exclusive), in raster order."""
+    return [(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            for y0 in range(0, height, tile_size)
+            for x0 in range(0, width, tile_size)]
+
+def tile_index(x, y, width, tile_size):
+    """Index in make_tiles(...) of the tile that holds pixel (x,y)."""
+    tiles_per_row = (width + tile_size - 1) // tile_size
+    return (y // tile_size) * tiles_per_row + x // tile_size
+
+class TileQueue(object):
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self._next = AtomicInteger(0)
+
+    def next(self):
+        """Returns (tile_idx, tile) of the next unprocessed tile or None when all tiles are taken."""
+        tile_idx = self._next.getAndIncrement()
+        if tile_idx >= len(self.tiles):
+            return None
+        return tile_idx, self.tiles[tile_idx]
+
+def num_threads_for(n_pixels, gvars):
+    """gvars["max_threads"] (optional) caps the number of threads, e.g. when several slices are converted at once."""
+    num_logical_processors = Runtime.getRuntime().availableProcessors()
+    max_threads = gvars.get("max_threads") or num_logical_processors
+    pixels_per_proc = gvars["pixels_per_logical_processor"]
+    return min(n_pixels // pixels_per_proc + 1, num_logical_processors, max_threads)
+
+def run_workers(runnables):
+    """Start one thread per runnable and wait until all are finished."""
+    threads = [Thread(r) for r in runnables]
+    for thread in threads:
+        thread.setPriority(Thread.MAX_PRIORITY)
+        thread.start()
+    for thread in threads:
+        thread.join()
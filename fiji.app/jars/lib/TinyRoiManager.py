@@ -6,6 +6,26 @@ tags, and provides fast access and manipulation. This class is designed to be ef
 batch-processing large amounts of ROIs in headless or semi-automated workflows.
 
 It uses parallel arrays for ROI data, allowing quick state toggling, filtering, and metadata storage.
+The parallel arrays are chunked and grow with the number of ROIs, there is no fixed maximum number of ROIs.
+The outlines are stored in columns (PolygonStore): roi_array[idx] only creates a PolygonRoi when it is
+needed and keeps the last polygon_cache_size of them.
+The name labels are not objects either: only their positions are kept (label_x, label_y), from the
+centroids that are known when the ROI is added (label census, measurement) or else computed from the
+outline the first time the label is drawn. RoiImage draws the names with cached glyphs.
+ROIs are indexed by a dense index 1..N; the ROI name ("L" + label id) keeps the original label id.
+ROIs of a label stack are keyed by (slice, label): "S" + slice + "-L" + label id.
+Every state (active, selected, deleted) has a live count and a BitSet of its members, updated on each
+state transition (_set_state): counting costs O(1), iterating a state costs O(members of that state).
+The tags are interned in a TagIndex: per ROI 1 bitmask in a primitive array (tag_masks) and per tag a
+BitSet of the ROIs with that tag, so filtering and counting by tag do not scan the ROIs.
+Readers iterate over an immutable RoiSnapshot (copy-on-write of the state, tag and name arrays) without
+holding the lock: painting and statistics do not block each other or the writers. Every change bumps
+the version, the next reader publishes a new snapshot.
+After every change the change listeners receive a RoiChangeEvent with the dense indices whose state or
+tags changed (and their state before the change): measurements, histograms and the overlay only redo
+the work for those ROIs.
+The bounding boxes of the ROIs are kept in a SpatialIndex (uniform grid): rectangle selection, viewport
+culling and neighbourhood queries only visit the ROIs near the rectangle.
 Supports singleton pattern for global access within a session.
 
 Author: Bart Vanderbeke & Elisa
@@ -24,23 +44,116 @@ import math
 from ij import IJ
 from ij.io import RoiEncoder, RoiDecoder
 from ij.gui import PolygonRoi, Roi
-from ij.gui import TextRoi
 from java.awt import Polygon
 from java.awt import Rectangle
-from java.awt import Color
 
 from java.lang import String
 from java.lang import Thread, Runnable
+from java.util import BitSet
 
 from jarray import zeros
 
 from StopWatch import StopWatch
+from ChunkedArray import ChunkedArray
+from MeasurementStore import MeasurementStore, polygon_centroid, CENTROID_X, CENTROID_Y
+from SpatialIndex import SpatialIndex
+from PolygonStore import PolygonStore
+from TagIndex import TagIndex
+
+def _iter_members(member_sets):
+    """Ascending dense indices in the union of the disjoint BitSets member_sets."""
+    if len(member_sets) == 1:
+        members = member_sets[0]
+        idx = members.nextSetBit(1)
+        while idx >= 0:
+            yield idx
+            idx = members.nextSetBit(idx + 1)
+        return
+    next_idx = [m.nextSetBit(1) for m in member_sets]
+    while True:
+        pending = [i for i in next_idx if i >= 0]
+        if not pending:
+            return
+        idx = min(pending)
+        yield idx
+        next_idx = [m.nextSetBit(idx + 1) if i == idx else i for m, i in zip(member_sets, next_idx)]
+
+class RoiSnapshot(object):
+    """
+    Immutable view of the ROIs at 1 version of a TinyRoiManager, iterated without locking.
+    States, tag masks and names are frozen copy-on-write arrays, the state members are BitSet copies and
+    the outlines a FrozenPolygonStore: a reset or a replaced outline in the manager does not change a snapshot.
+    The tags of a row are decoded by the TagIndex of the manager (a frozenset of tag names).
+    range_stop is the one of the manager when the snapshot was taken (saved in tags.json).
+    """
+    def __init__(self, manager, version, range_stop, roi_array, index_to_name, states, tag_masks, tag_index, state_members):
+        self._manager = manager
+        self.version = version
+        self.range_stop = range_stop
+        self.roi_array = roi_array
+        self.index_to_name = index_to_name
+        self.states = states
+        self.tag_masks = tag_masks
+        self.tag_index = tag_index
+        self.state_members = state_members
+
+    def tags(self, i):
+        """Tag names of ROI i in this snapshot."""
+        return self.tag_index.decode(self.tag_masks[i])
+
+    def label_position(self, i):
+        """(x, y) of the name label of ROI i of this snapshot, None if it has no outline."""
+        return self._manager._label_position_in(i, self.roi_array)
+
+    def indices(self, *states):
+        """Ascending dense indices of the ROIs in the given states, e.g. to read names and states without the Rois."""
+        return _iter_members([self.state_members[state] for state in states])
+
+    def entries(self, *states):
+        """(dense index, name, state, tags) of the ROIs in the given states: rows without creating the Rois."""
+        return self._entries(self.indices(*states))
+
+    def entries_at(self, indices):
+        """(dense index, name, state, tags) of the ROIs at the given dense indices that are present in this snapshot."""
+        return self._entries(i for i in indices if self.state_members[self.states[i]].get(i))
+
+    def _entries(self, indices):
+        for i in indices:
+            if self.roi_array.has_outline(i):
+                yield i, self.index_to_name[i], self.states[i], self.tags(i)
+
+    def _rows(self, indices):
+        for i in indices:
+            roi = self.roi_array[i]
+            if roi is not None:
+                yield self.index_to_name[i], roi, self.states[i], self.tags(i)
+
+    def rows(self, *states):
+        """(name, roi, state, tags) of the ROIs in the given states, by ascending dense index."""
+        return self._rows(self.indices(*states))
+
+    def rows_at(self, indices):
+        """(name, roi, state, tags) of the ROIs at the given dense indices that are present in this snapshot."""
+        return self._rows(i for i in indices if self.state_members[self.states[i]].get(i))
+
+class RoiChangeEvent(object):
+    """
+    Sent to the change listeners of a TinyRoiManager after a change.
+    - changes: dense index -> state before the change (None for an ROI that has been added) of every ROI
+      whose state or tags changed, the current state is in the manager
+    - reset: True after reset(), all ROIs have changed (changes is empty)
+    """
+    def __init__(self, version, changes, reset=False):
+        self.version = version
+        self.changes = changes
+        self.reset = reset
 
 class TinyRoiManager(object):
     # ROI state constants
     ROI_STATE_ACTIVE = 0
     ROI_STATE_DELETED = -1
     ROI_STATE_SELECTED = +1
+    ALL_STATES = (ROI_STATE_ACTIVE, ROI_STATE_DELETED, ROI_STATE_SELECTED)
 
     # Singleton instance reference
     _singleton_instance = None
@@ -52,53 +165,188 @@ class TinyRoiManager(object):
         return cls._singleton_instance
 
     def __init__(self, gvars):
-        if hasattr(self, "reserved_size"):
+        if hasattr(self, "roi_array"):
             IJ.log("TinyRoiManager: singleton instance had already been created & initialized. This new call is ignored.")
             return
 
-        self.reserved_size = gvars["max_number_of_rois"]
-
-        self.roi_array = zeros(self.reserved_size, Roi)
-        self.label_array = zeros(self.reserved_size, TextRoi)
-        self.states = zeros(self.reserved_size, 'b')
-        self.reason_of_selection = zeros(self.reserved_size, String)
-        self.tags = [set() for _ in range(self.reserved_size)]
+        # growable parallel arrays, indexed by dense ROI index, chunks are allocated on first use
+        self.index_to_name = ChunkedArray(String)
+        self.roi_array = PolygonStore(self.index_to_name, gvars.get("polygon_cache_size", 4096))
+        self.label_x = ChunkedArray('f', default=-1.0)  # position of the name label, < 0: not known yet
+        self.label_y = ChunkedArray('f', default=-1.0)
+        self.states = ChunkedArray('b', default=0)
+        self.reason_of_selection = ChunkedArray(String)
+        self.tag_masks = ChunkedArray('l', default=0)  # bit i set: the ROI has tag i of tag_index
+        self.tag_index = TagIndex()
 
         self.name_to_index = {}
-        self.index_to_name = zeros(self.reserved_size, String)
+        self.measurement_store = MeasurementStore()  # measurements computed by the detector threads
+        self.spatial_index = SpatialIndex(gvars.get("spatial_cell_size", 128))
         self.lock = threading.Lock()
-        self.range_stop = -1  # highest label number + 1
+        self._init_state_sets()
+        self._version = 0       # bumped by every change
+        self._snapshot = None   # RoiSnapshot of the last version that was read
+        self._listeners = []    # called with a RoiChangeEvent after every change
+        self._changes = {}      # dense index -> state before the change, not yet sent to the listeners
+        self.range_stop = -1  # number of ROIs + 1
+        self.reference_zip = None  # last zip loaded into or saved from this manager, see RoiIo.save_to_zip
+
+        self._init_placeholder()
+        self.name_length = None
+        self.slice_digits = 0  # 0: single label image, ROI names have no slice part
+        self.num_slices = 1
 
+    def _init_placeholder(self):
         # Initialize index 0 with placeholder empty ROI
         empty_poly = Polygon()
         empty_roi = PolygonRoi(empty_poly, Roi.TRACED_ROI)
         empty_roi.setName("EMPTY")
-        self.roi_array[0] = empty_roi
-        
-        self.label_array[0] = TextRoi(0, 0, "NOT ME")
-        self.label_shift_y = None
-        self.name_length = None
-        
+        self.roi_array[0] = empty_roi  # no vertices: kept as object
+
+    def _init_state_sets(self):
+        # state -> dense indices of the ROIs in that state, state -> number of ROIs in that state
+        self.state_members = dict((state, BitSet()) for state in self.ALL_STATES)
+        self.state_counts = dict((state, 0) for state in self.ALL_STATES)
+
+    def _set_state(self, idx, state):
+        """The only place where the state of an ROI changes: keeps the state counts and members up to date."""
+        old_state = self.states[idx]
+        old_members = self.state_members[old_state]
+        present = old_members.get(idx)
+        if present:
+            old_members.clear(idx)
+            self.state_counts[old_state] -= 1
+        if self._listeners and idx not in self._changes:
+            self._changes[idx] = old_state if present else None
+        self.states[idx] = state
+        self.state_members[state].set(idx)
+        self.state_counts[state] += 1
+        self._version += 1
+
+    def _set_tags(self, idx, mask):
+        """The only place where the tags of an ROI change: keeps the tag index up to date."""
+        old_mask = self.tag_masks[idx]
+        if old_mask == mask:
+            return
+        self.tag_index.update(idx, old_mask, mask)
+        self.tag_masks[idx] = mask
+        if self._listeners and idx not in self._changes:
+            self._changes[idx] = self.states[idx]
+        self._version += 1
+
+    def _add_tag(self, idx, tag):
+        self._set_tags(idx, self.tag_masks[idx] | (1 << self.tag_index.intern(tag)))
+
+    def add_change_listener(self, listener):
+        """listener(RoiChangeEvent) is called after every change, on the thread that made the change."""
+        with self.lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        with self.lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _publish(self, reset=False):
+        """Sends the changes since the last call to the listeners. Called after releasing the lock."""
+        with self.lock:
+            changes, self._changes = self._changes, {}
+            listeners = list(self._listeners)
+            version = self._version
+        if not (changes or reset):
+            return
+        event = RoiChangeEvent(version, {} if reset else changes, reset)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                IJ.log("TinyRoiManager: change listener failed: " + str(e))
+
+    def _indices(self, *states):
+        """Dense indices of the ROIs in the given states, ascending (an ROI is a member of exactly 1 state)."""
+        return _iter_members([self.state_members[state] for state in states])
+
+    def snapshot(self):
+        """RoiSnapshot of the current version, a new one is only made after a change."""
+        with self.lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self):
+        # the caller holds self.lock (not re-entrant)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self._version:
+            names = self.index_to_name.freeze()
+            snapshot = RoiSnapshot(self, self._version, self.range_stop, self.roi_array.freeze(names), names,
+                                   self.states.freeze(), self.tag_masks.freeze(), self.tag_index,
+                                   dict((state, members.clone()) for state, members in self.state_members.items()))
+            self._snapshot = snapshot
+        return snapshot
+
+    def count(self, state):
+        """Number of ROIs in state."""
+        return self.state_counts[state]
 
     def reset(self,num_of_rois):
         """Clears all ROIs from index 1 onward, preserving index 0."""
         """0 is a dummy"""
         with self.lock:
-            cleanup_range = max(self.range_stop,num_of_rois+1)
-            for idx in range(1,cleanup_range):
-                self.roi_array[idx] = None
-                self.states[idx] = 0
-                self.tags[idx] = set()
-                self.reason_of_selection[idx] = ""
-        self.set_range_stop(num_of_rois)    
-
-    def set_range_stop(self,num_of_rois):
+            for array in (self.roi_array, self.label_x, self.label_y, self.states,
+                          self.reason_of_selection, self.tag_masks, self.index_to_name):
+                array.clear()
+            self.tag_index = TagIndex()  # snapshots keep decoding with the old one
+            self.name_to_index = {}
+            self.measurement_store.clear()
+            self.spatial_index.clear()
+            self._init_state_sets()
+            self._version += 1
+            self._init_placeholder()
+            self._set_range_stop(num_of_rois)
+        self._publish(reset=True)
+
+    def ensure_capacity(self, num_of_rois):
+        """Allocates room for ROIs 0 ... num_of_rois, e.g. before detector threads fill roi_array."""
+        self.roi_array.ensure_capacity(num_of_rois + 1)
+
+    def set_range_stop(self,num_of_rois,max_label=None,num_slices=1):
+        """max_label: highest label id in the ROI names, defaults to num_of_rois"""
+        """num_slices: number of slices of a label stack, 1 for a single label image"""
+        with self.lock:
+            self._set_range_stop(num_of_rois, max_label, num_slices)
+            self._snapshot = None  # the next snapshot has the new range_stop
+
+    def _set_range_stop(self, num_of_rois, max_label=None, num_slices=1):
         self.range_stop = num_of_rois + 1
-        max_digits = len(str(num_of_rois))
+        max_digits = len(str(num_of_rois if max_label is None else max_label))
         self.name_length=max_digits+1
-        text_roi_dummy = TextRoi(0, 0, "L" + str(9).zfill(max_digits))
-        b = text_roi_dummy.getBounds()
-        self.label_shift_y = b.height // 4
+        self.slice_digits = len(str(num_slices)) if num_slices > 1 else 0
+        self.num_slices = num_slices
+
+    def roi_name(self, label_id, slice_idx=None):
+        """Name of the ROI of label_id (on slice slice_idx of a label stack)."""
+        name = "L" + str(label_id).zfill(self.name_length - 1)
+        if slice_idx is None or not self.slice_digits:
+            return name
+        return "S" + str(slice_idx).zfill(self.slice_digits) + "-" + name
+
+    @staticmethod
+    def parse_roi_name(name):
+        """Returns (slice_idx, label_id) of an ROI name, None for the parts that are missing."""
+        slice_idx = None
+        if name.startswith("S") and "-" in name:
+            slice_part, name = name.split("-", 1)
+            if slice_part[1:].isdigit():
+                slice_idx = int(slice_part[1:])
+        label_id = int(name[1:]) if name.startswith("L") and name[1:].isdigit() else None
+        return slice_idx, label_id
+
+    @classmethod
+    def create_detached(cls, gvars):
+        """New manager outside of the singleton, e.g. 1 per image in batch mode."""
+        instance = super(TinyRoiManager, cls).__new__(cls)
+        instance.gvars = gvars
+        instance.__init__(gvars)
+        return instance
 
     @staticmethod
     def getInstance2():
@@ -132,52 +380,68 @@ class TinyRoiManager(object):
             rois_or_names = [rois_or_names]
         return [r.getName() if hasattr(r, 'getName') else r for r in rois_or_names]
 
-    def select_within(self, rectangle, additive=False):
-        """Select all ROIs whose bounding rectangles are fully within the given rectangle."""
+    def select_within(self, rectangle, additive=False, position=0):
+        """
+        Select all ROIs whose bounding rectangles are fully within the given rectangle.
+        position: only the ROIs on that slice of a label stack (and the ones without a slice), 0: all slices.
+        """
         with self.lock:
             if not additive:
-                self.unselect_all()
+                self._unselect_all()
 
-            rect_xmin = rectangle.x
-            rect_ymin = rectangle.y
-            rect_xmax = rectangle.x + rectangle.width
-            rect_ymax = rectangle.y + rectangle.height
-
-            for idx in range(1, self.range_stop):
-                if self.states[idx] != self.ROI_STATE_ACTIVE:
+            for idx in self.spatial_index.within(rectangle):
+                if position and self.roi_array.position(idx) not in (0, position):
                     continue
-                roi = self.roi_array[idx]
-                bounds = roi.getBounds()
-                if (rect_xmin <= bounds.x and
-                    rect_ymin <= bounds.y and
-                    rect_xmax >= bounds.x + bounds.width and
-                    rect_ymax >= bounds.y + bounds.height):
-                    self.states[idx] = self.ROI_STATE_SELECTED
+                if self.states[idx] == self.ROI_STATE_ACTIVE:
+                    self._set_state(idx, self.ROI_STATE_SELECTED)
                     self.reason_of_selection[idx] = "manual"
+        self._publish()
+
+    def iter_intersecting(self, rectangle):
+        """Iterator over the ROIs (any state) whose bounding rectangle overlaps the given rectangle, e.g. the viewport."""
+        snapshot, indices = self.intersecting(rectangle)
+        return snapshot.rows_at(indices)
+
+    def intersecting(self, rectangle):
+        """(snapshot, dense indices) of the ROIs (any state) whose bounding rectangle overlaps rectangle, e.g. to paint the viewport."""
+        with self.lock:
+            return self._snapshot_locked(), self.spatial_index.intersecting(rectangle)
+
+    def neighbours(self, name, distance):
+        """Names of the ROIs whose bounding rectangle lies within distance pixels of the one of ROI name."""
+        with self.lock:
+            idx = self.name_to_index.get(name)
+            if idx is None:
+                return []
+            return [self.index_to_name[i] for i in self.spatial_index.near(idx, distance)]
 
     def unselect_all(self):
         """Sets all selected ROIs back to active."""
         with self.lock:
-            for idx in range(1, self.range_stop):
-                if self.states[idx] == self.ROI_STATE_SELECTED:
-                    self.states[idx] = self.ROI_STATE_ACTIVE
-                    self.reason_of_selection[idx] = ""
+            self._unselect_all()
+        self._publish()
+
+    def _unselect_all(self):
+        for idx in list(self._indices(self.ROI_STATE_SELECTED)):
+            self._set_state(idx, self.ROI_STATE_ACTIVE)
+            self.reason_of_selection[idx] = ""
 
     def select(self, rois_or_names, reason_of_selection=None, additive=False):
         """Selects the specified ROIs, optionally preserving previous selections."""
         with self.lock:
             names = self._resolve_names(rois_or_names)
             if not additive:
-                self.unselect_all()
+                self._unselect_all()
             for name in names:
                 if name in self.name_to_index:
                     idx = self.name_to_index[name]
                     if self.states[idx] == self.ROI_STATE_DELETED:
                         continue
-                    self.states[idx] = self.ROI_STATE_SELECTED
+                    self._set_state(idx, self.ROI_STATE_SELECTED)
                     if reason_of_selection:
                         self.reason_of_selection[idx] = reason_of_selection
                         #self.tags[idx].add(tag)
+        self._publish()
 
     def toggle(self, rois_or_names):
         """toggles the selction of the specified ROIs, preserving previous selections."""
@@ -190,11 +454,12 @@ class TinyRoiManager(object):
                         IJ.log("oops! "+name+" already deleted")
                         continue
                     if self.states[idx] == self.ROI_STATE_ACTIVE:
-                        self.states[idx] = self.ROI_STATE_SELECTED
+                        self._set_state(idx, self.ROI_STATE_SELECTED)
                         self.reason_of_selection[idx] = "manual"
                     else:
-                        self.states[idx] = self.ROI_STATE_ACTIVE
+                        self._set_state(idx, self.ROI_STATE_ACTIVE)
                         self.reason_of_selection[idx] = ""
+        self._publish()
 
     def add(self, rois):
         """Adds ROIs to the manager, setting their state to active."""
@@ -204,10 +469,12 @@ class TinyRoiManager(object):
                     name = roi.getName()
                     idx = self.name_to_index[name]
                     self.roi_array[idx] = roi
-                    self.states[idx] = self.ROI_STATE_ACTIVE
-                    self.tags[idx] = set()
+                    self._set_state(idx, self.ROI_STATE_ACTIVE)
+                    self.spatial_index.insert(idx, roi.getBounds())
+                    self._set_tags(idx, 0)
                 else:
                     IJ.log("Empty ROI encountered")
+        self._publish()
 
     def add_tuple(self, roi_state_tag_list):
         """Adds ROIs with associated state and tags."""
@@ -216,27 +483,78 @@ class TinyRoiManager(object):
                 name = roi.getName()
                 idx = self.name_to_index[name]
                 self.roi_array[idx] = roi
-                self.states[idx] = state
-                self.tags[idx] = set(tags)
+                self._set_state(idx, state)
+                self.spatial_index.insert(idx, roi.getBounds())
+                self._set_tags(idx, self.tag_index.encode(tags))
+        self._publish()
 
-    def add_1_tuple(self, name_idx_roi_state_tag):
+    def add_1_tuple(self, name_idx_roi_state_tag, label_position=None, measurement=None):
         """Adds  1 ROI with associated state and tags."""
-        """trimmed version to be efficient."""
-        #with self.lock:
-        roi_name, idx,roi, state, tags= name_idx_roi_state_tag
-        self.name_to_index[roi_name] = idx
-        self.index_to_name[idx] = roi_name
-        self.roi_array[idx] = roi
-        self.states[idx] = state
-        self.tags[idx] = set(tags)
-        # create a TextRoi to show the name of the ROI on the image overlay
-        stats = roi.getStatistics()
-        x = int(stats.xCentroid)
-        y = int(stats.yCentroid)
-        label_roi = TextRoi(x, y + self.label_shift_y, roi_name)
-        label_roi.setJustification(TextRoi.CENTER)
-        label_roi.setColor(Color.WHITE)
-        self.label_array[idx] = label_roi
+        """label_position, measurement: see add_many"""
+        self.add_many([name_idx_roi_state_tag], [label_position], [measurement])
+
+    def add_many(self, name_idx_roi_state_tags, label_positions=None, measurements=None):
+        """
+        Adds a batch of ROIs, e.g. the ROIs read by 1 loader thread. Can be called from several threads.
+        Parameters:
+        - name_idx_roi_state_tags: (name, dense index, roi, state, tags) per ROI
+        - label_positions: (x, y) of the name label per ROI, e.g. the centroid from a LabelCensus, None if not known
+        - measurements: measure_traced_roi values per ROI computed by a detector thread (kept in the
+          measurement store), None if not measured
+        Without a label position the centroid of the measurement is used, or else it is computed when the
+        label is drawn. The outlines are stored before and the label positions after 1 critical section
+        for the whole batch (the arrays frozen by snapshot() are only written while holding the lock).
+        """
+        roi_array = self.roi_array
+        bounds = []
+        for roi_name, idx, roi, state, tags in name_idx_roi_state_tags:
+            roi_array[idx] = roi
+            bounds.append(roi_array.bounds(idx))
+        with self.lock:
+            for (roi_name, idx, roi, state, tags), box in zip(name_idx_roi_state_tags, bounds):
+                self.name_to_index[roi_name] = idx
+                self.index_to_name[idx] = roi_name
+                self._set_state(idx, state)
+                self._set_tags(idx, self.tag_index.encode(tags))
+                self.spatial_index.insert(idx, box)
+        self._publish()
+        for i, (roi_name, idx, roi, state, tags) in enumerate(name_idx_roi_state_tags):
+            label_position = label_positions[i] if label_positions else None
+            measurement = measurements[i] if measurements else None
+            if measurement is not None:
+                self.measurement_store.put(roi_name, roi_array.generation(idx), measurement)
+                if not label_position:
+                    label_position = (measurement[CENTROID_X], measurement[CENTROID_Y])
+            if label_position:
+                # y first: label_position() reads x to know whether the position is there
+                self.label_y[idx] = label_position[1]
+                self.label_x[idx] = label_position[0]
+            else:
+                self.label_x[idx] = -1.0  # e.g. read from a zip file: computed when drawn
+
+    def label_position(self, idx):
+        """(x, y) of the name label of ROI idx: its centroid, None if idx has no outline."""
+        return self._label_position_in(idx, self.roi_array)
+
+    def _label_position_in(self, idx, outlines):
+        """
+        Label position of ROI idx with its outline in outlines (the PolygonStore or the frozen one of a snapshot).
+        The position kept by the manager is only used, and a computed one only kept, while it is the same outline.
+        """
+        generation = outlines.generation(idx)
+        current = self.roi_array.generation(idx) == generation
+        if current:
+            x = self.label_x[idx]
+            if x >= 0:
+                return x, self.label_y[idx]
+        outline = outlines.outline(idx)
+        if outline is None:
+            return None
+        x, y = polygon_centroid(*outline)
+        if current and self.roi_array.generation(idx) == generation:
+            self.label_y[idx] = y
+            self.label_x[idx] = x
+        return x, y
 
 
 
@@ -246,10 +564,11 @@ class TinyRoiManager(object):
             for name in self._resolve_names(rois_or_names):
                 if name in self.name_to_index:
                     idx = self.name_to_index[name]
-                    self.states[idx] = self.ROI_STATE_DELETED
+                    self._set_state(idx, self.ROI_STATE_DELETED)
                     if self.reason_of_selection[idx]:
-                        self.tags[idx].add(self.reason_of_selection[idx])
+                        self._add_tag(idx, self.reason_of_selection[idx])
                         self.reason_of_selection[idx]=""
+        self._publish()
 
     def change(self, rois_or_names, properties):
         """Modifies attributes of ROIs based on a property dictionary."""
@@ -257,29 +576,32 @@ class TinyRoiManager(object):
             for name in self._resolve_names(rois_or_names):
                 if name in self.name_to_index:
                     idx = self.name_to_index[name]
-                    roi = self.roi_array[idx]
+                    roi = self.roi_array.pin(idx)  # the changed properties are not in the outline columns
                     self.reason_of_selection[idx]="" 
                     for key, value in properties.items():
                         setattr(roi, key, value)
+                    if self._listeners:
+                        self._changes.setdefault(idx, self.states[idx])  # to be redrawn
+        self._publish()
 
     def delete_selected(self,tag=None):
         """Marks all selected ROIs as deleted."""
         """Optionally adds a reason_of_selection or tag motivating the delete"""
         with self.lock:
+                # only selected ROIs have a reason of selection
                 if tag:
                     IJ.log("delete_selected with tag: "+str(tag))
-                    for idx, state in enumerate(self.states):
-                        if state == self.ROI_STATE_SELECTED:
-                            self.states[idx] = self.ROI_STATE_DELETED
-                            self.tags[idx].add(tag)
+                    for idx in list(self._indices(self.ROI_STATE_SELECTED)):
+                        self._set_state(idx, self.ROI_STATE_DELETED)
+                        self._add_tag(idx, tag)
                         self.reason_of_selection[idx]=""
                 else:
-                    for idx, state in enumerate(self.states):
-                        if state == self.ROI_STATE_SELECTED:
-                            self.states[idx] = self.ROI_STATE_DELETED
-                            if self.reason_of_selection[idx]:
-                                self.tags[idx].add(self.reason_of_selection[idx])
-                                self.reason_of_selection[idx]=""    
+                    for idx in list(self._indices(self.ROI_STATE_SELECTED)):
+                        self._set_state(idx, self.ROI_STATE_DELETED)
+                        if self.reason_of_selection[idx]:
+                            self._add_tag(idx, self.reason_of_selection[idx])
+                            self.reason_of_selection[idx]=""
+        self._publish()
 
     def get_state(self, name):
         """Returns the current state of the ROI with the given name."""
@@ -294,50 +616,70 @@ class TinyRoiManager(object):
             idx = self.name_to_index.get(name)
             return self.roi_array[idx] if idx is not None else None
 
+    def measurement(self, name):
+        """measure_traced_roi values stored for the current outline of ROI name, None if not measured yet."""
+        idx = self.name_to_index.get(name)
+        if idx is None:
+            return None
+        return self.measurement_store.get(name, self.roi_array.generation(idx))
+
     def get_tuple(self, name):
         """Returns (roi, state, tags) tuple for the given ROI name."""
         with self.lock:
             idx = self.name_to_index.get(name)
-            return (self.roi_array[idx], self.states[idx], self.tags[idx]) if idx is not None else None
+            return (self.roi_array[idx], self.states[idx], self.tags_of(idx)) if idx is not None else None
+
+    def tags_of(self, idx):
+        """frozenset of the tag names of ROI idx."""
+        return self.tag_index.decode(self.tag_masks[idx])
+
+    def iter_by_tag(self, tag, *states):
+        """Iterator over the ROIs with tag (in the given states, default all), over a snapshot."""
+        with self.lock:
+            members = self.tag_index.members(tag)
+            if members is None:
+                return iter([])
+            members = members.clone()
+        snapshot = self.snapshot()  # after releasing self.lock, snapshot() takes it again
+        states = states or self.ALL_STATES
+        return (row for row in snapshot.rows_at(_iter_members([members])) if row[2] in states)
+
+    def count_tag(self, tag, state=None):
+        """Number of ROIs with tag (in state if given), from the tag index."""
+        with self.lock:
+            return self.tag_index.count(tag, None if state is None else self.state_members[state])
+
+    def tag_counts(self, state=None):
+        """tag -> number of ROIs with that tag (in state if given), for every tag that has been used."""
+        with self.lock:
+            state_members = None if state is None else self.state_members[state]
+            return dict((tag, self.tag_index.count(tag, state_members)) for tag in self.tag_index.tags())
 
     def __len__(self):
         """Returns the number of non-deleted ROIs."""
-        with self.lock:
-            return sum(1 for i in range(1, self.range_stop)
-                       if self.roi_array[i] and self.states[i] != self.ROI_STATE_DELETED)
+        return self.state_counts[self.ROI_STATE_ACTIVE] + self.state_counts[self.ROI_STATE_SELECTED]
 
     def __iter__(self):
-        """Iterator over all active (non-deleted) ROIs."""
-        with self.lock:
-            for i in range(1, self.range_stop):
-                if self.roi_array[i] and self.states[i] != self.ROI_STATE_DELETED:
-                    yield (self.index_to_name[i], self.roi_array[i], self.states[i], self.tags[i])
+        """Iterator over all active (non-deleted) ROIs, over a snapshot: no lock is held while iterating."""
+        return self.snapshot().rows(self.ROI_STATE_ACTIVE, self.ROI_STATE_SELECTED)
 
     def iter_all(self):
-        """Iterator over all ROIs regardless of state."""
-        with self.lock:
-            for i in range(1, self.range_stop):
-                if self.roi_array[i]:
-                    yield (self.index_to_name[i], self.roi_array[i], self.states[i], self.tags[i])
+        """Iterator over all ROIs regardless of state, over a snapshot."""
+        return self.snapshot().rows(*self.ALL_STATES)
 
 
 
     def map_over_rois(self, func):
         """Applies a function to all active (non-deleted) ROIs and returns a list of results."""
-        with self.lock:
-            return [func(self.roi_array[i]) for i in range(1, self.range_stop)
-                    if self.roi_array[i] and self.states[i] != self.ROI_STATE_DELETED]
+        return [func(roi) for (_, roi, _, _) in self.snapshot().rows(self.ROI_STATE_ACTIVE, self.ROI_STATE_SELECTED)]
 
     def get_sample(self):
         """Returns the ROI at index 1 for quick inspection or testing."""
         return self.roi_array[1]
 
     def iter_by_state(self, target_state):
-        """Iterator over ROIs matching the specified state."""
-        with self.lock:
-            for i in range(1, self.range_stop):
-                if self.roi_array[i] and self.states[i] == target_state:
-                    yield (self.index_to_name[i], self.roi_array[i], self.states[i], self.tags[i])
+        """Iterator over ROIs matching the specified state, over a snapshot."""
+        return self.snapshot().rows(target_state)
         
     # def select_by_filter(self, filterfn_idx, additive=False):
             # if additive:
@@ -0,0 +1,55 @@
+#@ File (label="Folder with original and label images", style="directory") batch_folder
+#@ Boolean (label="Remove at edge", value=true) remove_edges
+#@ Boolean (label="Remove small", value=true) remove_small
+#@ Integer (label="Size threshold (pixels)", value=100) size_threshold
+"""
+Edit_Rois_Batch.py
+
+Headless batch mode of Edit_Rois: converts all label images in a folder into
+<original>_RoiSet.zip files and measurement files, and writes one summary report.
+Label images are paired with the original images by the same suffix rules as the file choosers
+(_label.png, _label.tif, _label.tiff, _label.jpg, _cp_masks.png).
+
+Inside Fiji (also headless):
+    ImageJ --headless --run Edit_Rois_Batch.py "batch_folder='C:/data/exp1',remove_edges=true,remove_small=true,size_threshold=100"
+Standalone:
+    java -cp "%CLASSPATH%" org.python.util.jython plugins\\Edit_Rois_Batch.py C:/data/exp1 [size_threshold]
+
+- the file 'Edit_Rois_Batch.py' must be stored in Fiji's plugin folder
+- the other files must be stored in jars/lib
+
+"""
+
+import sys
+import os
+
+def add_libs_if_needed():
+    if 'ij' in sys.modules:
+        return
+    try:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        base_dir = os.getcwd()
+    libs_path = os.path.abspath(os.path.join(base_dir, "..", "jars", "lib"))
+    if libs_path not in sys.path:
+        sys.path.insert(0, libs_path)
+
+add_libs_if_needed()
+
+from EditRoisBatch import run_batch
+
+try:
+    # script parameters, set by Fiji
+    folder = batch_folder.getAbsolutePath()
+    settings = {"remove_edges": remove_edges, "remove_small": remove_small, "size_threshold": size_threshold}
+except NameError:
+    # standalone: folder [size_threshold]
+    if len(sys.argv) < 2:
+        print "Usage: Edit_Rois_Batch.py folder [size_threshold]"
+        sys.exit(1)
+    folder = sys.argv[1]
+    settings = {}
+    if len(sys.argv) > 2:
+        settings["size_threshold"] = int(sys.argv[2])
+
+run_batch(folder, settings)
@@ -0,0 +1,79 @@
+"""
+test_ChunkedArray.py
+
+Checks of ChunkedArray, in particular that a frozen snapshot never changes (copy-on-write chunks).
+Runs under Jython without ImageJ, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import random
+import threading
+import unittest
+
+from ChunkedArray import ChunkedArray
+
+class ChunkedArrayTest(unittest.TestCase):
+    def test_default_and_growth(self):
+        a = ChunkedArray('i', default=-1, chunk_bits=2)
+        self.assertEqual(a[100], -1)
+        self.assertEqual(len(a), 0)
+        a[9] = 3
+        self.assertEqual((a[9], a[8], len(a), a.allocated_chunks()), (3, -1, 12, 1))
+        self.assertEqual(len(list(a)), 12)
+        a.ensure_capacity(20)
+        self.assertEqual(a.allocated_chunks(), 5)
+        a.clear()
+        self.assertEqual(a[9], -1)
+
+    def test_python_objects(self):
+        a = ChunkedArray()
+        a[5] = set([1])
+        self.assertEqual((a[5], a[4]), (set([1]), None))
+
+    def test_freeze(self):
+        rnd = random.Random(11)
+        a = ChunkedArray('i', default=0, chunk_bits=3)
+        model = {}
+        snapshots = []
+        for step in range(3000):
+            idx = rnd.randint(0, 200)
+            a[idx] = model[idx] = rnd.randint(1, 1000)
+            if step % 250 == 0:
+                snapshots.append((a.freeze(), dict(model)))
+            if step == 2000:
+                a.clear()
+                model = {}
+        for frozen, expected in snapshots:
+            for idx in range(0, 220):
+                self.assertEqual(frozen[idx], expected.get(idx, 0))
+        for idx in range(0, 220):
+            self.assertEqual(a[idx], model.get(idx, 0))
+
+    def test_freeze_while_writing(self):
+        # a write racing with freeze() must not land in a chunk that the snapshot shares
+        a = ChunkedArray('i', default=0, chunk_bits=2)
+        stop = []
+        def write():
+            value = 0
+            while not stop:
+                value += 1
+                for idx in range(32):
+                    a[idx] = value
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            snapshots = []
+            for _ in range(300):
+                frozen = a.freeze()
+                snapshots.append((frozen, [frozen[idx] for idx in range(32)]))
+        finally:
+            stop.append(True)
+            writer.join()
+        for frozen, values in snapshots:
+            self.assertEqual([frozen[idx] for idx in range(32)], values)
+
+if __name__ == "__main__":
+    unittest.main()
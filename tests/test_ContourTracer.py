@@ -0,0 +1,74 @@
+"""
+test_ContourTracer.py
+
+Randomized checks of ContourTracer on small label images: every traced outline is axis aligned, only has
+corner vertices and encloses the pixels of its 8-connected region with the holes filled (shoelace area).
+ContourTracer imports ij.gui (trace_roi): skipped when ImageJ is not on the class path, e.g. run it with
+the Jython of Fiji and ij.jar on the class path, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import random
+import unittest
+
+try:
+    from ContourTracer import ContourTracer
+except ImportError:
+    ContourTracer = None
+
+def _filled_region_area(pixels, width, height, seed):
+    """Number of pixels of the 8-connected region of seed, with the holes filled."""
+    value = pixels[seed]
+    region = set([seed])
+    todo = [seed]
+    while todo:
+        i = todo.pop()
+        x, y = i % width, i // width
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                nx, ny = x + dx, y + dy
+                j = ny * width + nx
+                if 0 <= nx < width and 0 <= ny < height and j not in region and pixels[j] == value:
+                    region.add(j)
+                    todo.append(j)
+    # outside: 4-connected from the border of the padded image, over pixels not in the region
+    outside = set([(-1, -1)])
+    todo = [(-1, -1)]
+    while todo:
+        x, y = todo.pop()
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nx, ny = x + dx, y + dy
+            if (-1 <= nx <= width and -1 <= ny <= height and (nx, ny) not in outside and
+                    not (0 <= nx < width and 0 <= ny < height and ny * width + nx in region)):
+                outside.add((nx, ny))
+                todo.append((nx, ny))
+    return width * height - sum(1 for x, y in outside if 0 <= x < width and 0 <= y < height)
+
+@unittest.skipIf(ContourTracer is None, "ImageJ (ij.gui) is not available")
+class ContourTracerTest(unittest.TestCase):
+    def test_random_label_images(self):
+        rnd = random.Random(1)
+        for _ in range(300):
+            width, height = rnd.randint(1, 14), rnd.randint(1, 14)
+            labels = [0, 0] + list(range(1, rnd.randint(1, 4) + 1))
+            pixels = [rnd.choice(labels) for _ in range(width * height)]
+            tracer = ContourTracer(pixels, width, height)
+            traced = set()
+            for i, value in enumerate(pixels):
+                if value == 0 or value in traced:
+                    continue
+                traced.add(value)  # i is the first pixel of the first region of value in raster order
+                xs, ys, n = tracer.trace(i % width, i // width)
+                area = 0
+                for k in range(n):
+                    previous, vertex, following = (xs[k - 1], ys[k - 1]), (xs[k], ys[k]), (xs[(k + 1) % n], ys[(k + 1) % n])
+                    self.assertTrue(previous[0] == vertex[0] or previous[1] == vertex[1])
+                    self.assertFalse(previous[0] == vertex[0] == following[0] or previous[1] == vertex[1] == following[1])
+                    area += vertex[0] * following[1] - following[0] * vertex[1]
+                self.assertEqual(area / 2.0, _filled_region_area(pixels, width, height, i))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+test_MedianStats.py
+
+Randomized checks of the O(log N) MAD search of MedianStats against sorting the distances.
+Runs under Jython without ImageJ, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import random
+import unittest
+
+from MedianStats import sorted_median, first_index, kth_of_two, median_distance
+
+def _brute_median(values):
+    values = sorted(values)
+    n = len(values)
+    return values[n // 2] if n % 2 else 0.5 * (values[n // 2 - 1] + values[n // 2])
+
+def _random_values(rnd):
+    n = rnd.randint(1, 40)
+    if rnd.random() < 0.5:
+        return [rnd.randint(0, 6) for _ in range(n)]  # many ties
+    return [rnd.random() * 100.0 for _ in range(n)]
+
+class MedianStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(20250101)
+
+    def test_sorted_median(self):
+        for _ in range(500):
+            values = sorted(_random_values(self.rnd))
+            entries = [(v, "L%d" % i) for i, v in enumerate(values)]
+            self.assertEqual(sorted_median(entries, 0, len(entries)), _brute_median(values))
+
+    def test_first_index(self):
+        for _ in range(500):
+            entries = [(v, "") for v in sorted(_random_values(self.rnd))]
+            value = self.rnd.choice([entries[0][0] - 1, entries[-1][0] + 1, self.rnd.choice(entries)[0], self.rnd.random() * 100.0])
+            self.assertEqual(first_index(entries, value), sum(1 for v, _ in entries if v < value))
+            self.assertEqual(first_index(entries, value, strict=True), sum(1 for v, _ in entries if v <= value))
+
+    def test_kth_of_two(self):
+        for _ in range(500):
+            a = sorted(self.rnd.randint(0, 20) for _ in range(self.rnd.randint(0, 15)))
+            b = sorted(self.rnd.randint(0, 20) for _ in range(self.rnd.randint(0, 15)))
+            if not a and not b:
+                continue
+            union = sorted(a + b)
+            for k in range(len(union)):
+                self.assertEqual(kth_of_two(lambda i: a[i], len(a), lambda j: b[j], len(b), k), union[k])
+
+    def test_median_distance(self):
+        for _ in range(1000):
+            values = sorted(_random_values(self.rnd))
+            entries = [(v, "L%d" % i) for i, v in enumerate(values)]
+            med = sorted_median(entries, 0, len(entries))
+            expected = _brute_median([abs(v - med) for v in values])
+            self.assertAlmostEqual(median_distance(entries, med), expected, places=9)
+
+if __name__ == "__main__":
+    unittest.main()
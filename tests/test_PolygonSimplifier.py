@@ -0,0 +1,62 @@
+"""
+test_PolygonSimplifier.py
+
+Checks of the lossless (remove_collinear) and the display (Douglas-Peucker) simplification of outlines.
+PolygonSimplifier imports ij.gui (simplify_roi): skipped when ImageJ is not on the class path, e.g. run it
+with the Jython of Fiji and ij.jar on the class path, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import math
+import random
+import unittest
+
+try:
+    from PolygonSimplifier import remove_collinear, simplify_for_display
+except ImportError:
+    remove_collinear = simplify_for_display = None
+
+def _distance_to_segment(x, y, x0, y0, x1, y1):
+    """Distance of (x,y) to the segment (x0,y0)-(x1,y1)."""
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / float(length2)))
+    return math.hypot(x - x0 - t * dx, y - y0 - t * dy)
+
+def _staircase(steps):
+    """Closed outline of a staircase: many vertices close to its diagonal."""
+    xs = [0] + [v for k in range(steps) for v in (k, k + 1)] + [steps]
+    ys = [0] + [v for k in range(steps) for v in (k + 1, k + 1)] + [0]
+    return xs, ys, len(xs)
+
+@unittest.skipIf(remove_collinear is None, "ImageJ (ij.gui) is not available")
+class PolygonSimplifierTest(unittest.TestCase):
+    def test_remove_collinear(self):
+        xs, ys, n = remove_collinear([0, 1, 2, 2, 2, 1, 0, 0], [0, 0, 0, 1, 2, 2, 2, 1], 8)
+        self.assertEqual((list(xs), list(ys), n), ([0, 2, 2, 0], [0, 0, 2, 2], 4))
+        xs, ys, n = remove_collinear([0, 2, 2, 3, 2, 2, 0], [0, 0, 1, 1, 1, 2, 2], 7)
+        self.assertTrue((3, 1) in zip(xs[:n], ys[:n]))  # the tip of a spike is kept
+        square = ([0, 2, 2, 0], [0, 0, 2, 2], 4)
+        self.assertTrue(remove_collinear(*square)[0] is square[0])  # nothing removed: the same arrays
+
+    def test_simplify_for_display_within_tolerance(self):
+        rnd = random.Random(5)
+        for _ in range(50):
+            xs, ys, n = _staircase(rnd.randint(3, 30))
+            tolerance = rnd.choice([0.5, 0.75, 1.0, 2.0])
+            sx, sy, m = simplify_for_display(xs, ys, n, tolerance)
+            self.assertTrue(m <= n)
+            kept = list(zip(sx[:m], sy[:m]))
+            for x, y in zip(xs, ys):  # every vertex lies within tolerance of the simplified outline
+                distance = min(_distance_to_segment(x, y, kept[k][0], kept[k][1], kept[(k + 1) % m][0], kept[(k + 1) % m][1])
+                               for k in range(m))
+                self.assertTrue(distance <= tolerance + 1e-9, (x, y, distance, tolerance))
+        xs, ys, n = _staircase(9)
+        self.assertTrue(simplify_for_display(xs, ys, n, 0.75)[2] < n)
+        self.assertTrue(simplify_for_display(xs, ys, n, 0)[0] is xs)
+
+if __name__ == "__main__":
+    unittest.main()
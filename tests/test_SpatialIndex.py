@@ -0,0 +1,76 @@
+"""
+test_SpatialIndex.py
+
+Randomized checks of the SpatialIndex queries against testing every bounding box.
+Runs under Jython without ImageJ, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import random
+import unittest
+
+from java.awt import Rectangle
+
+from SpatialIndex import SpatialIndex
+
+def _overlaps(b, x0, y0, x1, y1):
+    return b.x <= x1 and b.x + b.width >= x0 and b.y <= y1 and b.y + b.height >= y0
+
+class SpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(7)
+        self.index = SpatialIndex(cell_size=16)
+        self.boxes = {}
+        for idx in range(1, 400):
+            self._insert(idx)
+        for idx in self.rnd.sample(sorted(self.boxes), 40):  # moved
+            self._insert(idx)
+        for idx in self.rnd.sample(sorted(self.boxes), 40):
+            self.index.remove(idx)
+            del self.boxes[idx]
+
+    def _insert(self, idx):
+        rnd = self.rnd
+        box = Rectangle(rnd.randint(0, 300), rnd.randint(0, 300), rnd.randint(0, 40), rnd.randint(0, 40))
+        self.boxes[idx] = box
+        self.index.insert(idx, box)
+
+    def _random_rect(self):
+        rnd = self.rnd
+        return Rectangle(rnd.randint(-30, 330), rnd.randint(-30, 330), rnd.randint(0, 120), rnd.randint(0, 120))
+
+    def test_len(self):
+        self.assertEqual(len(self.index), len(self.boxes))
+
+    def test_intersecting(self):
+        for _ in range(300):
+            r = self._random_rect()
+            expected = sorted(idx for idx, b in self.boxes.items() if _overlaps(b, r.x, r.y, r.x + r.width, r.y + r.height))
+            self.assertEqual(self.index.intersecting(r), expected)
+
+    def test_within(self):
+        for _ in range(300):
+            r = self._random_rect()
+            expected = sorted(idx for idx, b in self.boxes.items()
+                              if b.x >= r.x and b.y >= r.y and b.x + b.width <= r.x + r.width and b.y + b.height <= r.y + r.height)
+            self.assertEqual(self.index.within(r), expected)
+
+    def test_near(self):
+        for idx in self.rnd.sample(sorted(self.boxes), 50):
+            distance = self.rnd.randint(0, 30)
+            b = self.boxes[idx]
+            expected = sorted(other for other, c in self.boxes.items() if other != idx and
+                              _overlaps(c, b.x - distance, b.y - distance, b.x + b.width + distance, b.y + b.height + distance))
+            self.assertEqual(self.index.near(idx, distance), expected)
+        self.assertEqual(self.index.near(-1, 10), [])
+
+    def test_clear(self):
+        self.index.clear()
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.intersecting(Rectangle(0, 0, 400, 400)), [])
+
+if __name__ == "__main__":
+    unittest.main()
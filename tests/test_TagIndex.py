@@ -0,0 +1,59 @@
+"""
+test_TagIndex.py
+
+Checks of the tag bitmasks and the reverse index of TagIndex.
+Runs under Jython without ImageJ, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import random
+import unittest
+
+from java.util import BitSet
+
+from TagIndex import TagIndex, MAX_TAGS
+
+class TagIndexTest(unittest.TestCase):
+    def test_encode_decode(self):
+        index = TagIndex()
+        mask = index.encode(["small", "fold"])
+        self.assertEqual(index.decode(mask), frozenset(["small", "fold"]))
+        self.assertEqual(index.encode(["fold"]), 1 << index.intern("fold"))
+        self.assertEqual(index.decode(0), frozenset())
+        self.assertTrue(index.decode(mask) is index.decode(mask))  # 1 shared frozenset per mask
+        self.assertEqual(index.tags(), ["small", "fold"])
+
+    def test_members_and_count(self):
+        rnd = random.Random(3)
+        index = TagIndex()
+        tags = ["t%d" % i for i in range(8)]
+        masks = {}
+        for _ in range(2000):  # random changes of the tags of 50 ROIs
+            idx = rnd.randint(1, 50)
+            new_mask = index.encode(rnd.sample(tags, rnd.randint(0, 3)))
+            index.update(idx, masks.get(idx, 0), new_mask)
+            masks[idx] = new_mask
+        state_members = BitSet()
+        for idx in range(1, 51, 3):
+            state_members.set(idx)
+        for tag in tags:
+            expected = [idx for idx, mask in masks.items() if tag in index.decode(mask)]
+            members = index.members(tag)
+            self.assertEqual(sorted(i for i in range(1, 51) if members.get(i)), sorted(expected))
+            self.assertEqual(index.count(tag), len(expected))
+            self.assertEqual(index.count(tag, state_members), len([idx for idx in expected if state_members.get(idx)]))
+        self.assertEqual(index.members("unused"), None)
+        self.assertEqual(index.count("unused"), 0)
+
+    def test_max_tags(self):
+        index = TagIndex()
+        for i in range(MAX_TAGS):
+            index.intern("t%d" % i)
+        self.assertEqual(index.intern("t0"), 0)
+        self.assertRaises(ValueError, index.intern, "one too many")
+
+if __name__ == "__main__":
+    unittest.main()
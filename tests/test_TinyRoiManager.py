@@ -0,0 +1,70 @@
+"""
+test_TinyRoiManager.py
+
+Checks of the queries of TinyRoiManager that take a snapshot: iter_by_tag, intersecting, iter_intersecting.
+The manager lock is not re-entrant, so each query runs in a thread and fails when it does not return.
+TinyRoiManager imports ij.gui and ij.io: skipped when ImageJ is not on the class path, e.g. run it with
+the Jython of Fiji and ij.jar on the class path, see Tests in readme.md.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import threading
+import unittest
+
+try:
+    from ij.gui import PolygonRoi, Roi
+    from java.awt import Polygon, Rectangle
+    from TinyRoiManager import TinyRoiManager
+except ImportError:
+    TinyRoiManager = None
+
+_TIMEOUT_SECONDS = 10
+
+def _call_with_timeout(func, *args):
+    """func(*args) in a daemon thread; (True, result) or (False, None) when it did not return in time."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func(*args)))
+    thread.daemon = True
+    thread.start()
+    thread.join(_TIMEOUT_SECONDS)
+    return (True, result[0]) if result else (False, None)
+
+@unittest.skipIf(TinyRoiManager is None, "ImageJ (ij.gui) is not available")
+class TinyRoiManagerQueryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # built once: TinyRoiManager is a singleton, and after a deadlock its lock stays taken
+        # 6 triangles side by side, 10 pixels apart, L2 and L4 deleted with tag fold
+        cls.rm = TinyRoiManager({})
+        cls.rm.reset(6)
+        for i in range(1, 7):
+            roi = PolygonRoi(Polygon([i * 10, i * 10 + 5, i * 10 + 5], [0, 0, 5], 3), Roi.TRACED_ROI)
+            roi.setName("L%d" % i)
+            cls.rm.add_1_tuple(("L%d" % i, i, roi, cls.rm.ROI_STATE_ACTIVE, set()), label_position=(0, 0))
+        cls.rm.select(["L2", "L4"], "manual")
+        cls.rm.delete_selected("fold")
+
+    def test_iter_by_tag(self):
+        returned, rows = _call_with_timeout(lambda tag: [row[0] for row in self.rm.iter_by_tag(tag)], "fold")
+        self.assertTrue(returned, "iter_by_tag did not return")
+        self.assertEqual(rows, ["L2", "L4"])
+        rows = [row[0] for row in self.rm.iter_by_tag("fold", self.rm.ROI_STATE_ACTIVE)]
+        self.assertEqual(rows, [])
+        self.assertEqual(list(self.rm.iter_by_tag("unused")), [])
+
+    def test_intersecting(self):
+        returned, (snapshot, indices) = _call_with_timeout(self.rm.intersecting, Rectangle(18, 0, 15, 10))
+        self.assertTrue(returned, "intersecting did not return")
+        self.assertEqual([name for _, name, _, _ in snapshot.entries_at(indices)], ["L2", "L3"])
+        self.assertTrue(self.rm.snapshot() is snapshot)  # no change since: the same snapshot
+
+    def test_iter_intersecting(self):
+        returned, rows = _call_with_timeout(lambda r: list(self.rm.iter_intersecting(r)), Rectangle(0, 0, 100, 10))
+        self.assertTrue(returned, "iter_intersecting did not return")
+        self.assertEqual(len(rows), 6)
+
+if __name__ == "__main__":
+    unittest.main()
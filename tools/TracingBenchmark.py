@@ -0,0 +1,105 @@
+"""
+TracingBenchmark.py
+
+Compares the Wand engine and the contour engine of RoiDetector on one label image:
+- wall clock time of both engines (best of n runs)
+- number of ROIs found by each engine
+- whether both engines produce the same outline for every label
+
+Two outlines are considered the same when they have the same corner points in the same
+cyclic order; the Wand may start its outline at another corner.
+
+Usage (from the repository root, with the Jython of Fiji and ij.jar on the class path):
+    jython -Dpython.path=fiji.app/jars/lib tools/TracingBenchmark.py path/to/label_image.png [runs]
+It lives outside jars/lib, so the installer does not copy it into Fiji.
+
+Author: Bart Vanderbeke & Elisa
+Copyright: © 2025
+License: MIT
+"""
+
+import sys
+import datetime
+
+from ij import IJ
+from ij.gui import PolygonRoi, Roi
+from java.awt import Polygon
+from jarray import zeros
+
+from RoiDetector import detect_with_wand, detect_with_contours
+from LabelCensus import compute_census
+
+def _new_roi_array(size):
+    roi_array = zeros(size, Roi)
+    # label 0 is background, the Wand engine skips labels that already have an ROI
+    roi_array[0] = PolygonRoi(Polygon(), Roi.TRACED_ROI)
+    return roi_array
+
+def _time_engine(detect, ip, gvars, census, runs):
+    best_ms = None
+    for _ in range(runs):
+        roi_array = _new_roi_array(census.num_labels)
+        start_time = datetime.datetime.now()
+        counter = detect(ip, roi_array, gvars, census=census)
+        duration = datetime.datetime.now() - start_time
+        milliseconds = int(duration.total_seconds() * 1000.0)
+        if best_ms is None or milliseconds < best_ms:
+            best_ms = milliseconds
+    return best_ms, counter, roi_array
+
+def _corners(roi):
+    polygon = roi.getPolygon()
+    return [(polygon.xpoints[i], polygon.ypoints[i]) for i in range(polygon.npoints)]
+
+def same_outline(roi_a, roi_b):
+    """True if both ROIs have the same corner points in the same cyclic order."""
+    corners_a = _corners(roi_a)
+    corners_b = _corners(roi_b)
+    if len(corners_a) != len(corners_b):
+        return False
+    if not corners_a:
+        return True
+    try:
+        shift = corners_b.index(corners_a[0])
+    except ValueError:
+        return False
+    return corners_a == corners_b[shift:] + corners_b[:shift]
+
+def run_benchmark(path_label_image, runs=3):
+    imp_lbl = IJ.openImage(path_label_image)
+    if not imp_lbl:
+        print "Could not open label image: " + path_label_image
+        return
+    ip = imp_lbl.getProcessor()
+    gvars = {"pixels_per_logical_processor": 500000}
+
+    # both engines share one census, so the dense label indices of their ROI arrays match
+    census = compute_census(ip, gvars)
+    print "Label image: " + path_label_image + " | " + str(ip.getWidth()) + " x " + str(ip.getHeight()) + " | #labels: " + str(len(census.labels()))
+    wand_ms, wand_count, wand_rois = _time_engine(detect_with_wand, ip, gvars, census, runs)
+    print "Wand engine   : " + str(wand_ms) + " milliseconds | #ROIs: " + str(wand_count)
+    contour_ms, contour_count, contour_rois = _time_engine(detect_with_contours, ip, gvars, census, runs)
+    print "Contour engine: " + str(contour_ms) + " milliseconds | #ROIs: " + str(contour_count)
+
+    different = []
+    missing = []
+    for dense in census.labels():
+        roi_wand = wand_rois[dense]
+        roi_contour = contour_rois[dense]
+        if roi_wand is None and roi_contour is None:
+            continue
+        if roi_wand is None or roi_contour is None:
+            missing.append(census.label_id(dense))
+        elif not same_outline(roi_wand, roi_contour):
+            different.append(census.label_id(dense))
+
+    print "Labels found by one engine only  : " + str(len(missing)) + " " + str(missing[:20])
+    print "Labels with a different outline  : " + str(len(different)) + " " + str(different[:20])
+    if wand_ms:
+        print "Speed up (Wand / contour)        : " + str(round(float(wand_ms) / max(contour_ms, 1), 2))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print "Usage: TracingBenchmark.py label_image [runs]"
+    else:
+        run_benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)